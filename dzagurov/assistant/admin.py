@@ -1,3 +1,42 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AssistantQueryDaily
+
+
+# --- Фильтр "были / не было результатов"
+class ZeroResultsFilter(admin.SimpleListFilter):
+    title = "Результаты"
+    parameter_name = "zero"
+
+    def lookups(self, request, model_admin):
+        return (("yes", "Есть запросы без результатов"),
+                ("no", "Всегда с результатами"),)
+
+    def queryset(self, request, queryset):
+        val = self.value()
+        if val == "yes":
+            return queryset.filter(zero_results__gt=0)
+        if val == "no":
+            return queryset.filter(zero_results=0)
+        return queryset
+
+
+@admin.register(AssistantQueryDaily)
+class AssistantQueryDailyAdmin(admin.ModelAdmin):
+    list_display = ("day", "query", "count", "zero_results", "clicks", "mean_results")
+    list_filter = (ZeroResultsFilter,)
+    search_fields = ("query",)
+    date_hierarchy = "day"
+    ordering = ("-day", "-count")
+    list_per_page = 100
+
+    # агрегаты пишет только rollup_assistant_events
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def mean_results(self, obj):
+        return obj.mean_results
+    mean_results.short_description = "Среднее число результатов"
@@ -0,0 +1,385 @@
+"""
+Готовые ответы на вопросы «интент + анализ»: "подготовка к ферритину",
+"сколько стоит 21.100", "какой биоматериал для АЛТ".
+
+Таблица AssistantAnswer, ключ (kind, object_id, intent), строится из
+лабораторного каталога:
+  preparation — PanelPreanalytic.training;
+  duration    — Panel.duration;
+  price       — Service.cost (первая услуга панели с ценой);
+  biomaterial — PanelMaterial (биоматериал, контейнер) + минимальный объём.
+Полностью — build_assistant_answers и reindex_search, точечно — из
+indexing.reindex_objects для изменённых панелей и услуг.
+
+В ask (pipeline.retrieve) запрос делится на слова-интенты и остаток.
+Остаток должен точно совпасть с кодом панели/услуги или с названием
+панели (по стемам, без окончаний). Если однозначно опознаны обе части
+и ответ есть — отдаём его одним запросом по ключу, без поиска.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from lab.models import Panel, PanelMaterial, PanelPreanalytic, PreanalyticText, Service as LabService
+
+from . import metrics
+from .codes import normalize_code, query_code
+from .index_version import PerProcess
+from .indexing import dec_to_str, safe_url
+from .models import AssistantAnswer
+from .orchestrator import INTENTS, normalize
+from .tokens import stem
+
+ANSWER_INTENTS = tuple(AssistantAnswer.Intent.values)
+LABELS = dict(AssistantAnswer.Intent.choices)
+CURRENCY = {"RUB": "₽", "EUR": "€"}
+
+# слова вокруг названия, которые ничего не меняют: "подготовка к ...", "какой биоматериал для ..."
+FILLER = frozenset({
+    "к", "о", "об", "про", "у", "с", "от", "до", "за", "перед", "при",
+    "какой", "какая", "какие", "каков", "нужен", "нужна", "надо", "можно",
+    "стоит", "стоят", "сдать", "сдавать", "сдача", "сдачи", "сдаче", "сдаю",
+    "делается", "делают", "выполняется", "выполняют", "ждать",
+})
+# пробуем и с ними, и без: "подготовка к анализу ..." при названии без слова "анализ"
+SOFT = frozenset({
+    "анализ", "анализа", "анализу", "анализе", "анализы", "анализов",
+    "исследование", "исследования", "исследованию", "тест", "теста", "тесту",
+})
+
+_PAREN_RE = re.compile(r"\(([^()]*)\)")
+
+
+def _compile_words(intents: dict) -> tuple[tuple, tuple]:
+    """
+    Стемы INTENTS для разбора по словам: слово — интент, если начинается
+    со стема ("подготовка" -> preparation, но не duration по "готов"
+    внутри слова, как у detect_intents). Фразы ("сколько стоит") — отдельно
+    и раньше слов.
+    """
+    words, phrases = {}, {}
+    for intent, stems in intents.items():
+        for s in stems:
+            target = phrases if " " in s else words
+            target.setdefault(s, set()).add(intent)
+    return (
+        tuple(sorted(((tuple(p.split()), frozenset(i)) for p, i in phrases.items()), key=lambda x: -len(x[0]))),
+        tuple(sorted(((w, frozenset(i)) for w, i in words.items()), key=lambda x: -len(x[0]))),
+    )
+
+
+_PHRASES, _WORDS = _compile_words(INTENTS)
+
+
+def split_query(qn: str) -> tuple[list[str], list[str]]:
+    """qn -> (интенты из ANSWER_INTENTS в порядке таблицы, оставшиеся слова)."""
+    words = qn.split()
+    hit: set = set()
+    rest: list[str] = []
+    i = 0
+    while i < len(words):
+        for phrase, owners in _PHRASES:
+            if tuple(words[i:i + len(phrase)]) == phrase:
+                hit |= owners
+                i += len(phrase)
+                break
+        else:
+            w = words[i]
+            owners = next((o for s, o in _WORDS if w.startswith(s)), None)
+            if owners is not None:
+                hit |= owners
+            elif w not in FILLER:
+                rest.append(w)
+            i += 1
+    return [x for x in ANSWER_INTENTS if x in hit], rest
+
+
+def title_key(words) -> str:
+    return " ".join(stem(w) for w in words)
+
+
+def title_keys(name: str) -> set[str]:
+    """Ключи названия панели: целиком, без скобок и содержимое скобок ("АЛТ (аланиновая трансаминаза)")."""
+    keys = {title_key(normalize(name).split()), title_key(normalize(_PAREN_RE.sub(" ", name)).split())}
+    keys.update(title_key(normalize(inner).split()) for inner in _PAREN_RE.findall(name))
+    keys.discard("")
+    return keys
+
+
+# ---------------------------------------------------------------------------
+# build
+
+def _money(cost, currency: str) -> str:
+    currency = (currency or "").strip() or "RUB"
+    return f"{dec_to_str(cost)} {CURRENCY.get(currency, currency)}"
+
+
+def _days(n: int) -> str:
+    if n % 10 == 1 and n % 100 != 11:
+        return f"{n} календарный день"
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return f"{n} календарных дня"
+    return f"{n} календарных дней"
+
+
+def _for_panels(qs, panel_ids):
+    return qs if panel_ids is None else qs.filter(panel_id__in=panel_ids)
+
+
+def build_rows(panel_ids=None) -> list[dict]:
+    """Строки AssistantAnswer для активных панелей (None — для всех) — пятью запросами на пачку."""
+    panels = Panel.objects.filter(is_active=True).only("id", "code", "name", "duration").order_by("id")
+    if panel_ids is not None:
+        panels = panels.filter(id__in=panel_ids)
+
+    pre = {
+        pid: (text_id, (min_count or "").strip())
+        for pid, text_id, min_count in _for_panels(PanelPreanalytic.objects, panel_ids)
+        .values_list("panel_id", "training_text_id", "min_count")
+    }
+    texts = PreanalyticText.objects.only("id", "body").in_bulk({t for t, _m in pre.values() if t})
+
+    materials: dict[int, list[dict]] = {}
+    pms = (
+        _for_panels(PanelMaterial.objects, panel_ids)
+        .select_related("biomaterial", "container_type")
+        .order_by("panel_id", "id")
+    )
+    for pm in pms.iterator(chunk_size=4000):
+        bio, cont = pm.biomaterial, pm.container_type
+        materials.setdefault(pm.panel_id, []).append({
+            "name": (bio.name or bio.code or "").strip(),
+            "container": (cont.name or cont.code or "").strip() if cont else "",
+            "color": (cont.color or "").strip() if cont else "",
+        })
+
+    prices: dict[int, tuple] = {}
+    services = (
+        _for_panels(LabService.objects, panel_ids)
+        .filter(panel__isnull=False, cost__isnull=False)
+        .order_by("panel_id", "id")
+        .values_list("panel_id", "code", "cost", "currency")
+    )
+    for pid, code, cost, currency in services.iterator(chunk_size=4000):
+        prices.setdefault(pid, (code, cost, currency))  # как на карточке панели — первая услуга
+
+    rows = []
+    for p in panels.iterator(chunk_size=2000):
+        base = {
+            "kind": "panel",
+            "object_id": p.id,
+            "title": (p.name or "").strip()[:512] or p.code,
+            "code": p.code,
+            "url": safe_url(p),
+        }
+        text_id, min_count = pre.get(p.id, (None, ""))
+
+        training = texts[text_id].body.strip() if text_id in texts else ""
+        if training:
+            rows.append({**base, "intent": "preparation", "text": training, "data": {}})
+
+        duration = (p.duration or "").strip()
+        if duration:
+            text = _days(int(duration)) if duration.isdigit() else duration
+            rows.append({**base, "intent": "duration", "text": text, "data": {"days": duration}})
+
+        if p.id in prices:
+            code, cost, currency = prices[p.id]
+            rows.append({**base, "intent": "price", "text": _money(cost, currency), "data": {
+                "price": dec_to_str(cost), "currency": (currency or "").strip(), "service": code,
+            }})
+
+        mats = materials.get(p.id)
+        if mats:
+            lines = [" • ".join(x for x in (m["name"], m["container"]) if x) for m in mats]
+            if min_count:
+                lines.append(f"Минимальный объём образца: {min_count}")
+            rows.append({**base, "intent": "biomaterial", "text": "\n".join(lines), "data": {
+                "items": mats, "min_count": min_count,
+            }})
+    return rows
+
+
+ANSWER_FIELDS = ("title", "code", "url", "text", "data")
+
+
+def rebuild(panel_ids=None, batch: int = 1000) -> Counter:
+    """
+    Пересобрать ответы панелей (None — всю таблицу). Как reindex_objects,
+    пишем только разницу: новые строки, изменившиеся и исчезнувшие (ответы
+    удалённых и снятых с каталога панелей из этого набора). Возвращает число
+    строк по интентам.
+    """
+    if panel_ids is not None:
+        panel_ids = sorted({int(i) for i in panel_ids if i is not None})
+        if not panel_ids:
+            return Counter()
+    rows = build_rows(panel_ids)
+
+    existing = AssistantAnswer.objects.filter(kind="panel").only("id", "object_id", "intent", *ANSWER_FIELDS)
+    if panel_ids is not None:
+        existing = existing.filter(object_id__in=panel_ids)
+    current = {(a.object_id, a.intent): a for a in existing}
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for r in rows:
+        a = current.pop((r["object_id"], r["intent"]), None)
+        if a is None:
+            to_create.append(AssistantAnswer(updated_at=now, **r))
+            continue
+        if any(getattr(a, f) != r[f] for f in ANSWER_FIELDS):
+            for f in ANSWER_FIELDS:
+                setattr(a, f, r[f])
+            a.updated_at = now
+            to_update.append(a)
+
+    if not (to_create or to_update or current):
+        return Counter(r["intent"] for r in rows)
+    with transaction.atomic():
+        if to_create:
+            AssistantAnswer.objects.bulk_create(to_create, batch_size=batch)
+        if to_update:
+            AssistantAnswer.objects.bulk_update(to_update, [*ANSWER_FIELDS, "updated_at"], batch_size=batch)
+        if current:
+            AssistantAnswer.objects.filter(id__in=[a.id for a in current.values()]).delete()
+    return Counter(r["intent"] for r in rows)
+
+
+def refresh(kind: str, ids) -> None:
+    """
+    После reindex_objects: панели — по id, услуги — по их панелям
+    (удалённую услугу панели переиндексирует сигнал — её id тут уже не найти).
+    """
+    if kind == "panel":
+        rebuild(ids)
+    elif kind == "lab_service":
+        rebuild(LabService.objects.filter(id__in=list(ids), panel__isnull=False).values_list("panel_id", flat=True))
+
+
+# ---------------------------------------------------------------------------
+# lookup
+
+class EntityIndex:
+    """Коды и названия панелей (и их услуг) -> id панели; неоднозначные ключи выброшены."""
+
+    def __init__(self, by_code: dict[str, int], by_title: dict[str, int]):
+        self.by_code = by_code
+        self.by_title = by_title
+
+    def __len__(self):
+        return len(self.by_code) + len(self.by_title)
+
+    @classmethod
+    def build(cls) -> "EntityIndex":
+        codes: dict[str, set] = {}
+        titles: dict[str, set] = {}
+
+        def add(pid, code, name):
+            c = normalize_code(code)
+            if c:
+                codes.setdefault(c, set()).add(pid)
+            for k in title_keys(name or ""):
+                titles.setdefault(k, set()).add(pid)
+
+        for pid, code, name in Panel.objects.filter(is_active=True).values_list("id", "code", "name").iterator(chunk_size=4000):
+            add(pid, code, name)
+        services = LabService.objects.filter(panel__is_active=True).values_list("panel_id", "code", "name")
+        for pid, code, name in services.iterator(chunk_size=4000):
+            add(pid, code, name)
+
+        def unique(d):
+            return {k: next(iter(ids)) for k, ids in d.items() if len(ids) == 1}
+
+        return cls(unique(codes), unique(titles))
+
+    def match(self, query: str, rest: list[str]) -> int | None:
+        if not rest:
+            return None
+        # код: остаток запроса — ровно один код ("03.001" normalize режет на "03 001")
+        for tok in query.split():
+            code = query_code(tok)
+            if code and code in self.by_code and normalize(tok).split() == rest:
+                return self.by_code[code]
+        pid = self.by_title.get(title_key(rest))
+        if pid is None:
+            soft = [w for w in rest if w not in SOFT]
+            if soft and len(soft) < len(rest):
+                pid = self.by_title.get(title_key(soft))
+        return pid
+
+
+_shared = PerProcess(EntityIndex.build)
+
+
+@dataclass
+class Answer:
+    kind: str
+    object_id: int
+    title: str
+    code: str
+    url: str
+    facts: list  # [{"intent", "label", "text", "data"}] в порядке ANSWER_INTENTS
+
+    @property
+    def id(self) -> str:
+        return f"{self.kind}:{self.object_id}"
+
+    def row(self) -> dict:
+        """Карточка объекта в формате строк выдачи (для build_answer и журнала кликов)."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "object_id": self.object_id,
+            "title": self.title,
+            "url": self.url,
+            "search_text": "",
+            "meta": {"code": self.code},
+            "score": 1.0,
+        }
+
+
+def _enabled() -> bool:
+    return bool(getattr(settings, "ASSISTANT_STRUCTURED_ANSWERS", True))
+
+
+def lookup(query: str) -> Answer | None:
+    """Готовый ответ, если в запросе однозначно есть и интент, и панель; иначе None (обычный поиск)."""
+    if not _enabled():
+        return None
+    intents, rest = split_query(normalize(query))
+    if not intents or not rest:
+        return None
+    pid = _shared.get().match(query, rest)
+    if pid is None:
+        return None
+
+    rows = list(
+        AssistantAnswer.objects
+        .filter(kind="panel", object_id=pid, intent__in=intents)
+        .values("intent", "title", "code", "url", "text", "data")
+    )
+    if not rows:
+        # панель узнали, но данных под этот интент нет — пусть отвечает поиск
+        metrics.incr("answer.empty")
+        return None
+    rows.sort(key=lambda r: ANSWER_INTENTS.index(r["intent"]))
+    metrics.incr("answer.hit")
+    first = rows[0]
+    return Answer(
+        kind="panel",
+        object_id=pid,
+        title=first["title"],
+        code=first["code"],
+        url=first["url"],
+        facts=[
+            {"intent": r["intent"], "label": LABELS[r["intent"]], "text": r["text"], "data": r["data"]}
+            for r in rows
+        ],
+    )
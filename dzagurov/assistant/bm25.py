@@ -0,0 +1,308 @@
+"""
+In-memory BM25 поверх SearchIndex.
+
+Индекс строится один раз на процесс (см. index_version.PerProcess) и
+пересобирается сам, когда меняется версия SearchIndex. Новые boost
+(boost_version) подменяют только doc_boost, без пересборки.
+
+Раскладка — CSR, без объекта на каждое вхождение:
+  vocab            dict term -> term_id
+  term_off         array('I'), постинги term_id лежат в [term_off[t], term_off[t+1])
+  post_doc         array('I'), номер документа
+  post_tf          array('H'), частота терма в документе
+  doc_norm         array('f'), k1 * (1 - b + b * dl / avgdl) — считается при сборке
+  doc_boost/doc_kind — для множителя и фильтра по kind
+
+Если установлен numpy, скоринг идёт по np.frombuffer-видам этих же
+буферов (без копирования); иначе — чистый Python по тем же массивам.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+
+from .index_version import PerProcess, current_boost_version
+from .models import SearchIndex
+from .tokens import tokenize
+
+try:  # numpy — опциональная зависимость
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+log = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2  # токены заголовка считаем несколько раз — поле важнее текста
+
+
+class Bm25Index:
+    def __init__(self):
+        self.vocab: dict[str, int] = {}
+        self.term_off = array("I", [0])
+        self.post_doc = array("I")
+        self.post_tf = array("H")
+        self.idf = array("f")
+
+        self.doc_key: list[tuple[str, int]] = []
+        self.doc_title: list[str] = []
+        self.doc_url: list[str] = []
+        self.doc_text: list[str] = []
+        self.doc_meta: list[dict] = []
+        self.doc_boost = array("f")
+        self.doc_norm = array("f")
+        self.doc_kind = array("B")
+        self.kinds: list[str] = []
+
+        self.boost_version = ""
+        self.build_seconds = 0.0
+
+    def __len__(self):
+        return len(self.doc_key)
+
+    # ------------------------------------------------------------------ build
+
+    @classmethod
+    def from_queryset(cls, qs=None) -> "Bm25Index":
+        t0 = time.perf_counter()
+        self = cls()
+        qs = qs if qs is not None else SearchIndex.objects.all()
+        rows = qs.order_by("id").values_list(
+            "kind", "object_id", "title", "url", "search_text", "boost", "meta", "extra",
+        )
+
+        kind_ids: dict[str, int] = {}
+        postings: dict[int, list[tuple[int, int]]] = {}
+        lengths = array("I")
+
+        for kind, obj_id, title, url, text, boost, meta, extra in rows.iterator(chunk_size=2000):
+            doc = len(self.doc_key)
+            self.doc_key.append((kind, obj_id))
+            self.doc_title.append(title or "")
+            self.doc_url.append(url or "")
+            self.doc_text.append(text or "")
+            self.doc_meta.append(meta or extra or {})
+            self.doc_boost.append(float(boost or 1.0))
+
+            if kind not in kind_ids:
+                kind_ids[kind] = len(self.kinds)
+                self.kinds.append(kind)
+            self.doc_kind.append(kind_ids[kind])
+
+            tf = Counter(tokenize(text or ""))
+            for _ in range(TITLE_WEIGHT):
+                tf.update(tokenize(title or ""))
+            lengths.append(sum(tf.values()))
+
+            for term, n in tf.items():
+                tid = self.vocab.get(term)
+                if tid is None:
+                    tid = self.vocab[term] = len(self.vocab)
+                    postings[tid] = []
+                postings[tid].append((doc, min(n, 0xFFFF)))
+
+        n_docs = len(self.doc_key)
+        avgdl = (sum(lengths) / n_docs) if n_docs else 1.0
+        for dl in lengths:
+            self.doc_norm.append(K1 * (1.0 - B + B * dl / (avgdl or 1.0)))
+
+        for tid in range(len(self.vocab)):
+            plist = postings.pop(tid)
+            for doc, n in plist:
+                self.post_doc.append(doc)
+                self.post_tf.append(n)
+            self.term_off.append(len(self.post_doc))
+            df = len(plist)
+            self.idf.append(math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)))
+
+        self.build_seconds = time.perf_counter() - t0
+        log.info("bm25: built %s docs, %s terms, %s postings in %.2fs",
+                 n_docs, len(self.vocab), len(self.post_doc), self.build_seconds)
+        return self
+
+    def refresh_boosts(self, version: str) -> None:
+        """Перечитать boost из SearchIndex; массив подменяется целиком, поиск идёт без блокировки."""
+        pos = {key: d for d, key in enumerate(self.doc_key)}
+        boosts = array("f", self.doc_boost)
+        for kind, obj_id, boost in SearchIndex.objects.values_list("kind", "object_id", "boost").iterator(chunk_size=5000):
+            d = pos.get((kind, obj_id))
+            if d is not None:
+                boosts[d] = float(boost or 1.0)
+        self.doc_boost = boosts
+        self.boost_version = version
+
+    # ----------------------------------------------------------------- search
+
+    def _query_terms(self, qn: str) -> list[int]:
+        seen = []
+        for t in tokenize(qn):
+            tid = self.vocab.get(t)
+            if tid is not None and tid not in seen:
+                seen.append(tid)
+        return seen
+
+    def _kind_filter(self, kinds):
+        if not kinds:
+            return None
+        return {self.kinds.index(k) for k in kinds if k in self.kinds}
+
+    def _scores_numpy(self, tids):
+        """Вектор BM25 * boost по всем документам."""
+        docs = np.frombuffer(self.post_doc, dtype=np.uint32)
+        tfs = np.frombuffer(self.post_tf, dtype=np.uint16)
+        norm = np.frombuffer(self.doc_norm, dtype=np.float32)
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        for tid in tids:
+            s, e = self.term_off[tid], self.term_off[tid + 1]
+            d = docs[s:e]
+            tf = tfs[s:e].astype(np.float32)
+            scores[d] += self.idf[tid] * tf * (K1 + 1.0) / (tf + norm[d])
+
+        scores *= np.frombuffer(self.doc_boost, dtype=np.float32)
+        return scores
+
+    def _scores_python(self, tids) -> dict[int, float]:
+        """{doc: BM25 * boost} только по документам с совпадениями."""
+        acc: dict[int, float] = {}
+        post_doc, post_tf, norm = self.post_doc, self.post_tf, self.doc_norm
+        for tid in tids:
+            idf = self.idf[tid]
+            for i in range(self.term_off[tid], self.term_off[tid + 1]):
+                d = post_doc[i]
+                tf = post_tf[i]
+                acc[d] = acc.get(d, 0.0) + idf * tf * (K1 + 1.0) / (tf + norm[d])
+        boost = self.doc_boost
+        return {d: s * boost[d] for d, s in acc.items()}
+
+    def _score_numpy(self, tids, allowed, limit):
+        scores = self._scores_numpy(tids)
+        if allowed is not None:
+            mask = np.isin(np.frombuffer(self.doc_kind, dtype=np.uint8), list(allowed))
+            scores[~mask] = 0.0
+
+        cand = np.flatnonzero(scores > 0)
+        if cand.size > limit:
+            cand = cand[np.argpartition(-scores[cand], limit - 1)[:limit]]
+        cand = cand[np.argsort(-scores[cand], kind="stable")]
+        return [(int(d), float(scores[d])) for d in cand]
+
+    def _score_python(self, tids, allowed, limit):
+        kinds = self.doc_kind
+        scored = (
+            (d, s) for d, s in self._scores_python(tids).items()
+            if allowed is None or kinds[d] in allowed
+        )
+        return heapq.nlargest(limit, scored, key=lambda x: (x[1], -x[0]))
+
+    def _faceted_numpy(self, tids, allowed, quotas, limit):
+        scores = self._scores_numpy(tids)
+        cand = np.flatnonzero(scores > 0)
+        cand_kind = np.frombuffer(self.doc_kind, dtype=np.uint8)[cand]
+        counts = np.bincount(cand_kind, minlength=len(self.kinds))
+
+        picked = []
+        for kid, kind in enumerate(self.kinds):
+            if not counts[kid] or (allowed is not None and kid not in allowed):
+                continue
+            q = quotas.get(kind, limit)
+            sel = cand[cand_kind == kid]
+            if sel.size > q:
+                sel = sel[np.argpartition(-scores[sel], q - 1)[:q]]
+            picked.append(sel)
+
+        hits = []
+        if picked:
+            top = np.concatenate(picked)
+            top = top[np.lexsort((top, -scores[top]))][:limit]
+            hits = [(int(d), float(scores[d])) for d in top]
+        return hits, {kid: int(n) for kid, n in enumerate(counts)}
+
+    def _faceted_python(self, tids, allowed, quotas, limit):
+        kinds = self.doc_kind
+        buckets: dict[int, list] = {}
+        for d, s in self._scores_python(tids).items():
+            buckets.setdefault(kinds[d], []).append((d, s))
+
+        key = lambda x: (x[1], -x[0])  # noqa: E731
+        picked = []
+        for kid, items in buckets.items():
+            if allowed is None or kid in allowed:
+                picked.extend(heapq.nlargest(quotas.get(self.kinds[kid], limit), items, key=key))
+        hits = heapq.nlargest(limit, picked, key=key)
+        return hits, {kid: len(items) for kid, items in buckets.items()}
+
+    def _hit(self, d: int, score: float) -> dict:
+        kind, obj_id = self.doc_key[d]
+        return {
+            "id": f"{kind}:{obj_id}",
+            "kind": kind,
+            "object_id": obj_id,
+            "title": self.doc_title[d],
+            "url": self.doc_url[d],
+            "search_text": self.doc_text[d],
+            "meta": self.doc_meta[d],
+            "score": score,
+        }
+
+    def search(self, qn: str, limit: int = 8, kinds=None) -> list[dict]:
+        limit = max(1, int(limit))
+        tids = self._query_terms(qn)
+        if not tids or not len(self):
+            return []
+        allowed = self._kind_filter(kinds)
+        if allowed is not None and not allowed:
+            return []
+
+        if np is not None:
+            hits = self._score_numpy(tids, allowed, limit)
+        else:
+            hits = self._score_python(tids, allowed, limit)
+
+        return [self._hit(d, score) for d, score in hits]
+
+    def search_faceted(self, qn: str, limit: int = 8, kinds=None, quotas=None) -> tuple[list, dict]:
+        """
+        Один проход по постингам: выдача, где каждый kind занимает не больше
+        quotas[kind] строк, и число совпадений по каждому kind (по всем kind,
+        даже если kinds сужает выдачу).
+        """
+        limit = max(1, int(limit))
+        tids = self._query_terms(qn)
+        if not tids or not len(self):
+            return [], {}
+        allowed = self._kind_filter(kinds)
+        faceted = self._faceted_numpy if np is not None else self._faceted_python
+        hits, counts = faceted(tids, allowed, quotas or {}, limit)
+        facets = {self.kinds[kid]: n for kid, n in counts.items() if n}
+        return [self._hit(d, score) for d, score in hits], facets
+
+
+def _build() -> Bm25Index:
+    # версию boost фиксируем до сборки — как PerProcess версию индекса
+    version = current_boost_version()
+    index = Bm25Index.from_queryset()
+    index.boost_version = version
+    return index
+
+
+# один индекс на воркер-процесс
+_shared = PerProcess(_build)
+_boost_lock = threading.Lock()
+
+
+def get_index() -> Bm25Index:
+    index = _shared.get()
+    version = current_boost_version()
+    if index.boost_version != version:
+        with _boost_lock:
+            if index.boost_version != version:
+                index.refresh_boosts(version)
+    return index
+
@@ -0,0 +1,85 @@
+"""
+Обучение SearchIndex.boost по кликам из AssistantEvent.
+
+Показ — документ в AssistantEvent.results, клик — AssistantEvent.clicked.
+Показы взвешиваем по позиции (1 / log2(pos + 2)): до пятой карточки
+доходят реже, и без поправки первые места только укрепляли бы себя.
+
+CTR сглаживаем к общему по всем документам:
+    ctr = (clicks + PRIOR * global_ctr) / (views + PRIOR)
+и boost = ctr / global_ctr, зажатый в [ASSISTANT_BOOST_MIN, ASSISTANT_BOOST_MAX].
+Документ с парой показов остаётся около 1.0, с сотней — получает свой CTR.
+
+Boost уже участвует в ранжировании (MATCH * boost в MySQL, множитель в BM25,
+ранг подсказок), так что на время запроса это ничего не добавляет.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AssistantEvent, SearchIndex
+
+
+@dataclass
+class ClickStats:
+    views: dict[str, float]
+    clicks: dict[str, int]
+    events: int = 0
+
+    @property
+    def global_ctr(self) -> float:
+        total = sum(self.views.values())
+        return (sum(self.clicks.values()) / total) if total else 0.0
+
+
+def position_weight(pos: int) -> float:
+    return 1.0 / math.log2(pos + 2)
+
+
+def collect_stats(days: int) -> ClickStats:
+    """Показы и клики по документам за последние days дней (один проход по событиям)."""
+    since = timezone.now() - timedelta(days=days)
+    views: dict[str, float] = {}
+    clicks: dict[str, int] = {}
+    n = 0
+    rows = AssistantEvent.objects.filter(created_at__gte=since).values_list("results", "clicked")
+    for results, clicked in rows.iterator(chunk_size=5000):
+        n += 1
+        if isinstance(results, list):
+            for pos, doc_id in enumerate(results):
+                views[doc_id] = views.get(doc_id, 0.0) + position_weight(pos)
+        if clicked:
+            clicks[clicked] = clicks.get(clicked, 0) + 1
+    return ClickStats(views=views, clicks=clicks, events=n)
+
+
+def boost_for(views: float, clicks: int, global_ctr: float, prior: float, lo: float, hi: float) -> float:
+    if global_ctr <= 0:
+        return 1.0
+    ctr = (clicks + prior * global_ctr) / (views + prior)
+    return round(min(hi, max(lo, ctr / global_ctr)), 3)
+
+
+def compute_boosts(stats: ClickStats) -> dict[str, float]:
+    """doc_id ("panel:12") -> новый boost; документов без показов здесь нет (у них 1.0)."""
+    prior = float(getattr(settings, "ASSISTANT_BOOST_PRIOR", 20.0))
+    lo = float(getattr(settings, "ASSISTANT_BOOST_MIN", 0.5))
+    hi = float(getattr(settings, "ASSISTANT_BOOST_MAX", 3.0))
+    g = stats.global_ctr
+    return {
+        doc_id: boost_for(v, stats.clicks.get(doc_id, 0), g, prior, lo, hi)
+        for doc_id, v in stats.views.items()
+    }
+
+
+def learned_boosts() -> dict[tuple[str, int], float]:
+    """Текущие неединичные boost — reindex_search переносит их в новый индекс."""
+    return {
+        (kind, obj_id): boost
+        for kind, obj_id, boost in SearchIndex.objects.exclude(boost=1.0).values_list("kind", "object_id", "boost")
+    }
@@ -0,0 +1,19 @@
+"""Системные проверки ассистента (manage.py check --deploy)."""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def ratelimit_cache(app_configs, **kwargs):
+    """Лимит в памяти процесса умножается на число воркеров."""
+    if not getattr(settings, "ASSISTANT_RATELIMIT", True):
+        return []
+    alias = getattr(settings, "ASSISTANT_RATELIMIT_CACHE_ALIAS", "")
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "") if alias else ""
+    if alias and not backend.endswith(("LocMemCache", "DummyCache")):
+        return []
+    return [Warning(
+        f"ASSISTANT_RATELIMIT_CACHE_ALIAS={alias!r} is not a shared cache: /assistant/ask/ limits are per worker process.",
+        hint="Point it to a shared cache from CACHES (e.g. redis).",
+        id="assistant.W001",
+    )]
@@ -0,0 +1,108 @@
+"""
+Быстрый путь для запросов-кодов: "03.001", "FERR", "tsh", "код 70.810".
+
+Хеш-индекс (dict) нормализованный код -> строки SearchIndex: коды тестов,
+панелей и услуг (meta.code) плюс алиасы из заголовков, которые находит
+orchestrator.extract_code_from_text ("Ферритин (FERR)"); алиас берём, только
+если он есть у одной строки ("ВИЧ" встречается в десятках названий).
+Полнотекстовый поиск не зовём, только если запрос явно код — с цифрой
+("03.001") или с "код:"; совпадения по слову без цифр ("tsh") pipeline ставит
+наверх обычной выдачи.
+Индекс живёт в процессе и пересобирается при смене версии SearchIndex.
+"""
+from __future__ import annotations
+
+import re
+
+from .index_version import PerProcess
+from .models import SearchIndex
+from .orchestrator import LAYOUT_RU_EN, extract_code_from_text
+
+CODE_KINDS = ("test", "panel", "lab_service")
+KIND_RANK = {k: i for i, k in enumerate(CODE_KINDS)}
+EXACT_SCORE = 1000.0
+
+_PREFIX_RE = re.compile(r"^\s*(?:код|code)\s*[:#№]?\s*", re.I)
+_CODE_RE = re.compile(r"^[0-9A-Za-zА-Яа-яЁё][0-9A-Za-zА-Яа-яЁё.\-_]{0,23}$")
+_DIGIT_RE = re.compile(r"\d")
+
+
+def normalize_code(s: str) -> str:
+    return (s or "").strip().upper().replace("Ё", "Е")
+
+
+def query_code(q: str) -> str:
+    """Код, если весь запрос — один код (с необязательным "код:"), иначе ""."""
+    s = _PREFIX_RE.sub("", (q or "").strip()).strip().rstrip(".")
+    if not s or not _CODE_RE.match(s):
+        return ""
+    # одно слово ("ферритин") тоже проверяем: промах в dict стоит копейки,
+    # дальше запрос идёт обычным путём
+    return normalize_code(s)
+
+
+def is_explicit_code(q: str) -> bool:
+    """Запрос точно код, а не слово: в нём есть цифра или префикс "код:"."""
+    return bool(query_code(q)) and bool(_PREFIX_RE.match(q or "") or _DIGIT_RE.search(q or ""))
+
+
+class CodeIndex:
+    def __init__(self):
+        self.by_code: dict[str, list[dict]] = {}
+
+    def __len__(self):
+        return len(self.by_code)
+
+    @classmethod
+    def build(cls) -> "CodeIndex":
+        self = cls()
+        aliases: dict[str, list[dict]] = {}
+        rows = SearchIndex.objects.filter(kind__in=CODE_KINDS).values_list(
+            "kind", "object_id", "title", "url", "search_text", "boost", "meta",
+        )
+        for kind, obj_id, title, url, text, boost, meta in rows.iterator(chunk_size=2000):
+            meta = meta if isinstance(meta, dict) else {}
+            row = {
+                "id": f"{kind}:{obj_id}",
+                "kind": kind,
+                "object_id": obj_id,
+                "title": title,
+                "url": url,
+                "search_text": text or "",
+                "meta": meta,
+                "score": EXACT_SCORE + float(boost or 1.0),
+            }
+            code = normalize_code(str(meta.get("code") or ""))
+            if code:
+                self.by_code.setdefault(code, []).append(row)
+            alias = extract_code_from_text(title or "")
+            if alias and alias != (title or "").strip().upper():
+                # алиас из заголовка, но не сам заголовок целиком ("ТТГ" — это название)
+                aliases.setdefault(normalize_code(alias), []).append(row)
+
+        for alias, hits in aliases.items():
+            if len(hits) == 1 and alias not in self.by_code:
+                self.by_code[alias] = hits
+
+        for hits in self.by_code.values():
+            hits.sort(key=lambda r: (KIND_RANK.get(r["kind"], 99), -r["score"], r["title"]))
+        return self
+
+    def lookup(self, q: str, limit: int = 8) -> list[dict]:
+        code = query_code(q)
+        if not code:
+            return []
+        hits = self.by_code.get(code)
+        if hits is None and re.search(r"[А-Я]", code):
+            # "ЕЫР" — TSH на русской раскладке
+            hits = self.by_code.get(code.lower().translate(LAYOUT_RU_EN).upper())
+        return list(hits[:limit]) if hits else []
+
+
+_shared = PerProcess(CodeIndex.build)
+
+
+def exact_code_hits(q: str, limit: int = 8) -> list[dict]:
+    if not query_code(q):
+        return []
+    return _shared.get().lookup(q, limit=limit)
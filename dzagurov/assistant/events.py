@@ -0,0 +1,143 @@
+"""
+Асинхронная запись AssistantEvent.
+
+ask не ждёт INSERT: событие кладётся в ограниченную очередь процесса,
+фоновый поток пишет их bulk_create пачками — каждые
+ASSISTANT_EVENTS_BATCH событий или ASSISTANT_EVENTS_FLUSH_SECONDS секунд.
+Очередь переполнена — событие выбрасываем и считаем (events.dropped).
+При остановке процесса (atexit) остаток дописывается.
+
+ASSISTANT_EVENTS_ASYNC = False — писать синхронно, как раньше.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+from .models import AssistantEvent
+
+log = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    def __init__(self, maxsize: int, batch_size: int, flush_seconds: float):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pid = None
+        self._q: queue.Queue | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # -------------------------------------------------------------- lifecycle
+
+    def _ensure_started(self):
+        # после fork (gunicorn --preload) потока в дочернем процессе нет — заводим свой
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._q = queue.Queue(maxsize=self.maxsize)
+                self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="assistant-events", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Остановить поток и дописать всё, что осталось в очереди."""
+        if self._q is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout if timeout is not None else self.flush_seconds + 5)
+        self.flush()
+
+    # ------------------------------------------------------------------- api
+
+    def put(self, fields: dict) -> bool:
+        self._ensure_started()
+        try:
+            self._q.put_nowait(fields)
+            return True
+        except queue.Full:
+            metrics.incr("events.dropped")
+            return False
+
+    def qsize(self) -> int:
+        return self._q.qsize() if self._q is not None else 0
+
+    def flush(self) -> int:
+        """Синхронно записать всё, что сейчас в очереди."""
+        written = 0
+        while True:
+            batch = self._take(self.batch_size, wait=False)
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    # ---------------------------------------------------------------- worker
+
+    def _take(self, n: int, wait: bool) -> list[dict]:
+        items: list[dict] = []
+        deadline = None
+        while len(items) < n:
+            try:
+                if not wait:
+                    items.append(self._q.get_nowait())
+                    continue
+                # ждём первое событие до flush_seconds, дальше — до дедлайна пачки
+                timeout = self.flush_seconds if deadline is None else deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                items.append(self._q.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+            except queue.Empty:
+                break
+        return items
+
+    def _write(self, batch: list[dict]) -> int:
+        try:
+            AssistantEvent.objects.bulk_create([AssistantEvent(**f) for f in batch], batch_size=self.batch_size)
+            metrics.incr("events.written", len(batch))
+            return len(batch)
+        except Exception:
+            metrics.incr("events.failed", len(batch))
+            log.exception("assistant: failed to write %s events", len(batch))
+            return 0
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take(self.batch_size, wait=True)
+            if batch:
+                self._write(batch)
+
+
+buffer = EventBuffer(
+    maxsize=int(getattr(settings, "ASSISTANT_EVENTS_QUEUE_MAX", 10000)),
+    batch_size=int(getattr(settings, "ASSISTANT_EVENTS_BATCH", 100)),
+    flush_seconds=float(getattr(settings, "ASSISTANT_EVENTS_FLUSH_SECONDS", 2.0)),
+)
+atexit.register(buffer.stop)
+metrics.gauge("events.queue", buffer.qsize)
+
+
+def log_event(**fields) -> None:
+    """Поля — как у AssistantEvent (user передаём как user_id)."""
+    if not getattr(settings, "ASSISTANT_EVENTS_ASYNC", True):
+        AssistantEvent.objects.create(**fields)
+        return
+    buffer.put(fields)
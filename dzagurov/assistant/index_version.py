@@ -0,0 +1,133 @@
+"""
+Версия поискового индекса и «живущие в процессе» структуры поверх него.
+
+Версия — дешёвый агрегат по SearchIndex (count / max id / max updated_at):
+любая переиндексация или правка строки её меняет. Агрегат читается из БД,
+поэтому правку видят все воркеры, без общего кеша. Чтобы не ходить в БД
+на каждый запрос, значение кешируется в процессе на
+ASSISTANT_INDEX_VERSION_TTL секунд.
+
+Писатели индекса (reindex_search, инкрементальные обновления) вызывают
+bump_index_version(): свой процесс перечитывает версию сразу, остальные —
+не позже чем через TTL.
+
+boost (learn_assistant_boosts) версионируется отдельно — boost_version():
+новые boost меняют ключ кеша результатов и множители BM25, но не
+пересобирают словари, TF-IDF и прочие структуры на весь индекс.
+"""
+from __future__ import annotations
+
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+
+from .models import SearchIndex
+
+def _ttl() -> float:
+    return float(getattr(settings, "ASSISTANT_INDEX_VERSION_TTL", 5.0))
+
+
+def content_version() -> str:
+    """Агрегат по строкам; им же помечены артефакты на диске (spelling.bin, tfidf.bin)."""
+    agg = SearchIndex.objects.aggregate(n=Count("id"), last_id=Max("id"), last_upd=Max("updated_at"))
+    upd = agg["last_upd"]
+    stamp = int(upd.timestamp() * 1_000_000) if upd else 0
+    return f"{agg['n']}:{agg['last_id'] or 0}:{stamp}"
+
+
+def boost_version() -> str:
+    """Агрегат по boost; updated_at learn_assistant_boosts не трогает."""
+    agg = SearchIndex.objects.exclude(boost=1.0).aggregate(n=Count("id"), total=Sum("boost"))
+    return f"{agg['n']}:{float(agg['total'] or 0.0):.6f}"
+
+
+class _Memo:
+    """Значение агрегата, кешированное в процессе на ASSISTANT_INDEX_VERSION_TTL."""
+
+    def __init__(self, read):
+        self._read = read
+        self._lock = threading.Lock()
+        self._value = None
+        self._checked = 0.0
+
+    def get(self, force: bool = False) -> str:
+        now = time.monotonic()
+        if not force and self._value is not None and now - self._checked < _ttl():
+            return self._value
+        with self._lock:
+            if force or self._value is None or now - self._checked >= _ttl():
+                self._value = self._read()
+                self._checked = time.monotonic()
+            return self._value
+
+
+_content = _Memo(content_version)
+_boosts = _Memo(boost_version)
+
+
+def current_version(force: bool = False) -> str:
+    return _content.get(force)
+
+
+def current_boost_version(force: bool = False) -> str:
+    return _boosts.get(force)
+
+
+def bump_index_version() -> str:
+    """
+    Индекс поменялся: перечитать версию в этом процессе сейчас, не дожидаясь TTL.
+    Другие воркеры увидят новый агрегат сами.
+    """
+    return current_version(force=True)
+
+
+def bump_boost_version() -> str:
+    """То же для boost (learn_assistant_boosts)."""
+    return current_boost_version(force=True)
+
+
+class PerProcess:
+    """
+    Лениво строит структуру (BM25, словарь, …) один раз на процесс
+    и пересобирает её, когда меняется версия индекса. None от build
+    (нет файла, нет numpy) тоже запоминается до смены версии — иначе
+    каждый запрос заново открывал бы файл. max_age (сек) —
+    дополнительно пересобирать по времени, если структура зависит
+    не только от SearchIndex (например, от журнала запросов).
+    """
+
+    def __init__(self, build, max_age: float | None = None):
+        self._build = build
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._obj = None
+        self._loaded = False
+        self._version = None
+        self._built_at = 0.0
+
+    def _fresh(self, v) -> bool:
+        if not self._loaded or self._version != v:
+            return False
+        return self._max_age is None or time.monotonic() - self._built_at < self._max_age
+
+    def get(self):
+        v = current_version()
+        if self._fresh(v):
+            return self._obj
+        with self._lock:
+            if not self._fresh(v):
+                # версию фиксируем ДО сборки: если индекс поменяется во время
+                # сборки, на следующем запросе соберём ещё раз
+                self._obj = self._build()
+                self._loaded = True
+                self._version = v
+                self._built_at = time.monotonic()
+            return self._obj
+
+    def reset(self):
+        with self._lock:
+            self._obj = None
+            self._loaded = False
+            self._version = None
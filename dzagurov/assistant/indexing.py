@@ -0,0 +1,553 @@
+"""
+Построение строк SearchIndex и точечное обновление индекса.
+
+  - build_*_row — строки индекса из объектов (их же использует reindex_search);
+  - reindex_objects(kind, ids) — батчевый upsert/удаление только затронутых строк
+    (для сигналов и массовых синков, которые сигналы обходят);
+  - deferred() — копить изменения и применить их одним батчем в конце блока
+    (например, на время nacpp_sync_catalogs).
+"""
+from __future__ import annotations
+
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from lab.models import Test, Panel, PanelCategory, Service as LabService, PanelMaterial
+from main.models import Contact, Documents, News, Service as SiteService
+
+from . import pdf_text
+
+from .index_version import bump_index_version
+from .models import SearchIndex
+
+
+# ---------------------------
+# Utils
+# ---------------------------
+
+TAG_RE = re.compile(r"<[^>]+>")
+WS_RE = re.compile(r"\s+")
+
+
+def strip_html(text: str) -> str:
+    if not text:
+        return ""
+    # remove tags
+    text = TAG_RE.sub(" ", str(text))
+    text = text.replace("&nbsp;", " ")
+    text = text.replace("\xa0", " ")
+    text = WS_RE.sub(" ", text).strip()
+    return text
+
+
+def cut(text: str, n: int) -> str:
+    if not text:
+        return ""
+    t = str(text).strip()
+    return t if len(t) <= n else (t[:n].rstrip() + "…")
+
+
+def safe_url(obj) -> str:
+    try:
+        if hasattr(obj, "get_absolute_url"):
+            return obj.get_absolute_url() or ""
+    except Exception:
+        return ""
+    return ""
+
+
+def category_path_map() -> dict[int, str]:
+    """
+    category_id -> полный путь "родитель / ребёнок" для всех PanelCategory.
+    Один запрос, пути считаются в памяти с мемоизацией (0 -> "").
+    """
+    rows = {cid: (name, parent_id) for cid, name, parent_id in
+            PanelCategory.objects.values_list("id", "name", "parent_id").order_by()}
+    paths: dict[int, str] = {0: ""}
+
+    def path(cid, seen=()):
+        if cid in paths:
+            return paths[cid]
+        if cid not in rows or cid in seen:  # битая ссылка / цикл
+            return ""
+        name, parent_id = rows[cid]
+        prefix = path(parent_id, seen + (cid,)) if parent_id else ""
+        paths[cid] = " / ".join(x for x in (prefix, name) if x)
+        return paths[cid]
+
+    for cid in rows:
+        path(cid)
+    return paths
+
+
+def dec_to_str(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, Decimal):
+        # avoid exponent formats
+        return format(v, "f").rstrip("0").rstrip(".") if "." in format(v, "f") else format(v, "f")
+    return str(v)
+
+
+def ref_range(low: str, high: str) -> str:
+    low = (low or "").strip()
+    high = (high or "").strip()
+    if low and high:
+        return f"{low}–{high}"
+    if low and not high:
+        return f"от {low}"
+    if high and not low:
+        return f"до {high}"
+    return ""
+
+
+# ---------------------------
+# Builders
+# ---------------------------
+
+def build_test_row(t: Test) -> dict:
+    meta = {
+        "code": t.code,
+        "unit": (t.unit or "").strip(),
+        "method": cut(strip_html(t.method), 80),
+        "ref": ref_range(t.low, t.high),
+    }
+
+    # короткий "hint" (не простыня) — из description, но сильно режем
+    # если description пустой — пусто, фронт сам скроет строку
+    hint = cut(strip_html(t.description), 80)
+    if hint:
+        meta["hint"] = hint
+
+    title = f"{t.name}".strip() or t.code
+
+    search_text = " ".join([
+        t.code or "",
+        title,
+        meta.get("unit", ""),
+        meta.get("method", ""),
+        meta.get("ref", ""),
+        strip_html(t.description or ""),
+    ]).strip()
+
+    return {
+        "kind": "test",
+        "object_id": t.id,
+        "title": title,
+        "url": safe_url(t),
+        "search_text": search_text,
+        "meta": meta,
+    }
+
+
+def build_panel_row(p: Panel, materials_map: dict[int, list[str]], cat_map: dict[int, str]) -> dict:
+    cat_path = cat_map.get(p.category_id or 0, "")
+    meta = {
+        "code": p.code,
+        "duration": (p.duration or "").strip(),
+        "category": cat_path,
+    }
+
+    mats = materials_map.get(p.id, [])
+    if mats:
+        meta["biomaterials"] = mats[:6]
+
+    title = cut((p.name or "").strip() or p.code, 180)
+
+
+    search_text = " ".join([
+        p.code or "",
+        title,
+        (p.duration or ""),
+        cat_path,
+        " ".join(mats),
+    ]).strip()
+
+    return {
+        "kind": "panel",
+        "object_id": p.id,
+        "title": title,
+        "url": safe_url(p),
+        "search_text": search_text,
+        "meta": meta,
+    }
+
+
+def build_lab_service_row(s: LabService) -> dict:
+    meta = {
+        "code": s.code,
+        "price": dec_to_str(s.cost),
+        "currency": (s.currency or "").strip(),
+        "duration": (s.duration or "").strip(),
+        "panel_code": s.panel.code if s.panel_id else "",
+        "panel_name": s.panel.name if s.panel_id else "",
+    }
+
+    title = cut((s.name or "").strip() or s.code, 180)
+
+    search_text = " ".join([
+        s.code or "",
+        title,
+        dec_to_str(s.cost),
+        (s.currency or ""),
+        (s.duration or ""),
+        (s.comment or ""),
+        meta.get("panel_code", ""),
+        meta.get("panel_name", ""),
+    ]).strip()
+
+    return {
+        "kind": "lab_service",
+        "object_id": s.id,
+        "title": title,
+        "url": safe_url(s),
+        "search_text": search_text,
+        "meta": meta,
+    }
+
+
+def build_contact_row(c: Contact) -> dict:
+    meta = {
+        "group": getattr(c.group, "name", "") if c.group_id else "",
+        "phone": (c.phone or "").strip(),
+        "email": (c.email or "").strip(),
+        "address": (c.address or "").strip(),
+        "is_main": bool(c.is_main),
+    }
+
+    title = cut((c.name or "").strip() or "Контакт", 180)
+
+    search_text = " ".join([
+        title,
+        meta["group"],
+        meta["phone"],
+        meta["email"],
+        meta["address"],
+        strip_html(c.description or ""),
+    ]).strip()
+
+    return {
+        "kind": "contact",
+        "object_id": c.id,
+        "title": title,
+        "url": safe_url(c),
+        "search_text": search_text,
+        "meta": meta,
+    }
+
+
+def build_news_row(n: News) -> dict:
+    meta = {
+        "category": getattr(n.cat, "name", "") if n.cat_id else "",
+        "date": n.time_create.isoformat() if isinstance(n.time_create, date) else str(n.time_create) if n.time_create else "",
+    }
+
+    title = cut((n.title or "").strip() or "Новость", 180)
+
+    # берём кусок контента без HTML
+    text = strip_html(n.content or "")
+    text2 = strip_html(n.content2 or "")
+    text3 = strip_html(n.content3 or "")
+    text4 = strip_html(n.content4 or "")
+    body = " ".join([text, text2, text3, text4]).strip()
+
+    search_text = " ".join([
+        title,
+        meta["category"],
+        body,
+    ]).strip()
+
+    return {
+        "kind": "news",
+        "object_id": n.id,
+        "title": title,
+        "url": safe_url(n),
+        "search_text": search_text,
+        "meta": meta,
+    }
+
+
+def pdf_path(d: Documents) -> str:
+    """Локальный путь к PDF документа или "" (нет файла / хранилище без path)."""
+    if not d.pdf_file:
+        return ""
+    try:
+        return d.pdf_file.path
+    except (NotImplementedError, ValueError):
+        return ""
+
+
+def build_doc_row(d: Documents, pdf: str = "") -> dict:
+    """pdf — уже извлечённый текст файла (см. _build_doc_rows / pdf_text.extract_many)."""
+    meta = {
+        "file": d.pdf_file.url if d.pdf_file else "",
+        "file_name": d.name_pdffile or "",
+        "sections": [s.name for s in d.section.all()],
+        "date": d.time_update.isoformat() if d.time_update else "",
+    }
+
+    title = cut((d.title or "").strip() or "Документ", 180)
+
+    search_text = " ".join([
+        title,
+        meta["file_name"],
+        " ".join(meta["sections"]),
+        strip_html(d.content or ""),
+        pdf,
+    ]).strip()
+
+    return {
+        "kind": "doc",
+        "object_id": d.id,
+        "title": title,
+        "url": safe_url(d),
+        "search_text": search_text,
+        "meta": meta,
+    }
+
+
+def build_site_service_row(s: SiteService) -> dict:
+    meta = {
+        "price": dec_to_str(s.price) if s.price else "",
+    }
+
+    title = cut((s.title or "").strip() or "Услуга", 180)
+
+    search_text = " ".join([
+        title,
+        f"цена {meta['price']} руб" if meta["price"] else "",
+        strip_html(s.content or ""),
+    ]).strip()
+
+    return {
+        "kind": "site_service",
+        "object_id": s.id,
+        "title": title,
+        "url": safe_url(s),
+        "search_text": search_text,
+        "meta": meta,
+    }
+
+
+# ---------------------------
+# Querysets (то, что попадает в индекс)
+# ---------------------------
+
+def tests_qs():
+    return Test.objects.filter(is_active=True).only(
+        "id", "code", "name", "unit", "method", "description", "low", "high",
+    )
+
+
+def panels_qs():
+    # путь категории берём из category_path_map(), не из связанного объекта
+    return Panel.objects.filter(is_active=True).only(
+        "id", "code", "name", "duration", "category_id",
+    )
+
+
+def lab_services_qs():
+    return LabService.objects.select_related("panel").all().only(
+        "id", "code", "name", "cost", "currency", "duration", "comment", "panel_id", "panel__code", "panel__name",
+    )
+
+
+def contacts_qs():
+    return Contact.objects.select_related("group").all().only(
+        "id", "name", "phone", "email", "address", "description", "group_id", "group__name", "is_main",
+    )
+
+
+def news_qs():
+    return News.objects.select_related("cat").all().only(
+        "id", "title", "slug", "time_create", "cat_id", "cat__name",
+        "content", "content2", "content3", "content4",
+    )
+
+
+def documents_qs():
+    return Documents.objects.filter(is_published=True).prefetch_related("section").only(
+        "id", "title", "slug", "content", "name_pdffile", "pdf_file", "time_update",
+    )
+
+
+def site_services_qs():
+    return SiteService.objects.filter(is_published=True).only(
+        "id", "title", "slug", "content", "price",
+    )
+
+
+def materials_map_for(panel_ids=None) -> dict[int, list[str]]:
+    """panel_id -> названия биоматериалов (None — по всем панелям)."""
+    # порядок фиксируем: иначе полная и точечная переиндексация расходятся
+    qs = PanelMaterial.objects.select_related("biomaterial").only("panel_id", "biomaterial__name").order_by("panel_id", "id")
+    if panel_ids is not None:
+        qs = qs.filter(panel_id__in=panel_ids)
+    out: dict[int, list[str]] = {}
+    for pm in qs.iterator(chunk_size=4000):
+        out.setdefault(pm.panel_id, []).append((pm.biomaterial.name or "").strip())
+    return out
+
+
+def _build_panel_rows(panels) -> list[dict]:
+    panels = list(panels)
+    materials_map = materials_map_for([p.id for p in panels])
+    cat_map = category_path_map()
+    return [build_panel_row(p, materials_map=materials_map, cat_map=cat_map) for p in panels]
+
+
+# kind -> (queryset, builder по списку объектов)
+def _build_doc_rows(docs) -> list[dict]:
+    # все PDF пачки — одним extract_many: кеш по хешу + параллельный разбор новых
+    docs = list(docs)
+    texts = pdf_text.extract_many(pdf_path(d) for d in docs)
+    return [build_doc_row(d, texts.get(pdf_path(d), "")) for d in docs]
+
+
+SOURCES = {
+    "test": (tests_qs, lambda objs: [build_test_row(o) for o in objs]),
+    "panel": (panels_qs, _build_panel_rows),
+    "lab_service": (lab_services_qs, lambda objs: [build_lab_service_row(o) for o in objs]),
+    "contact": (contacts_qs, lambda objs: [build_contact_row(o) for o in objs]),
+    "news": (news_qs, lambda objs: [build_news_row(o) for o in objs]),
+    "doc": (documents_qs, _build_doc_rows),
+    "site_service": (site_services_qs, lambda objs: [build_site_service_row(o) for o in objs]),
+}
+
+
+# ---------------------------
+# Shards (для reindex_search --workers)
+# ---------------------------
+
+ROW_TUPLE = ("kind", "object_id", "title", "url", "search_text", "meta")
+
+
+def shard_ranges(kind: str, size: int) -> list[tuple[str, int, int]]:
+    """Делим объекты kind на диапазоны id примерно по size штук: [(kind, lo, hi), ...]."""
+    qs_fn, _ = SOURCES[kind]
+    ids = list(qs_fn().order_by("id").values_list("id", flat=True))
+    return [(kind, ids[i], ids[min(i + size, len(ids)) - 1]) for i in range(0, len(ids), size)]
+
+
+def build_shard(kind: str, lo: int, hi: int) -> list[tuple]:
+    """
+    Строки индекса для kind с id в [lo, hi] — простыми кортежами (ROW_TUPLE),
+    чтобы дёшево передавать их из воркера координатору.
+    """
+    qs_fn, build = SOURCES[kind]
+    rows = build(qs_fn().filter(id__gte=lo, id__lte=hi).order_by("id").iterator(chunk_size=2000))
+    return [tuple(r[f] for f in ROW_TUPLE) for r in rows]
+
+
+# ---------------------------
+# Incremental updates
+# ---------------------------
+
+ROW_FIELDS = ("title", "url", "search_text", "meta")
+
+
+def reindex_objects(kind: str, ids, batch: int = 500) -> dict:
+    """
+    Пересобрать строки индекса для объектов kind с данными id.
+    Объекты, которых больше нет (или они не попадают в индекс, например
+    is_active=False), удаляются из SearchIndex. Пишем только изменившиеся
+    строки; boost не трогаем.
+    """
+    if kind not in SOURCES:
+        raise ValueError(f"Неизвестный kind для индекса: {kind!r}")
+    qs_fn, build = SOURCES[kind]
+    ids = sorted({int(i) for i in ids if i is not None})
+    stats = {"created": 0, "updated": 0, "deleted": 0}
+
+    for start in range(0, len(ids), batch):
+        chunk = ids[start:start + batch]
+        rows = {r["object_id"]: r for r in build(qs_fn().filter(id__in=chunk))}
+        existing = {
+            si.object_id: si
+            for si in SearchIndex.objects.filter(kind=kind, object_id__in=chunk)
+        }
+        now = timezone.now()
+
+        to_create, to_update = [], []
+        for obj_id, row in rows.items():
+            si = existing.get(obj_id)
+            if si is None:
+                to_create.append(SearchIndex(updated_at=now, **row))
+                continue
+            if any(getattr(si, f) != row[f] for f in ROW_FIELDS):
+                for f in ROW_FIELDS:
+                    setattr(si, f, row[f])
+                si.updated_at = now
+                to_update.append(si)
+
+        gone = [oid for oid in existing if oid not in rows]
+
+        with transaction.atomic():
+            if to_create:
+                SearchIndex.objects.bulk_create(to_create, batch_size=batch)
+            if to_update:
+                SearchIndex.objects.bulk_update(to_update, [*ROW_FIELDS, "updated_at"], batch_size=batch)
+            if gone:
+                SearchIndex.objects.filter(kind=kind, object_id__in=gone).delete()
+
+        stats["created"] += len(to_create)
+        stats["updated"] += len(to_update)
+        stats["deleted"] += len(gone)
+
+    if kind in ("panel", "lab_service"):
+        # готовые ответы (срок, цена, подготовка) — из тех же панелей и услуг;
+        # answers сам импортирует indexing, поэтому импорт здесь
+        from .answers import refresh
+        refresh(kind, ids)
+
+    if any(stats.values()):
+        transaction.on_commit(bump_index_version)
+    return stats
+
+
+def delete_objects(kind: str, ids) -> int:
+    ids = [int(i) for i in ids if i is not None]
+    if not ids:
+        return 0
+    deleted, _ = SearchIndex.objects.filter(kind=kind, object_id__in=ids).delete()
+    if deleted:
+        transaction.on_commit(bump_index_version)
+    return deleted
+
+
+_pending = threading.local()
+
+
+@contextmanager
+def deferred():
+    """
+    Внутри блока schedule() только копит id; по выходу — по одному
+    reindex_objects на kind. Вложенные блоки копят во внешний.
+    """
+    if getattr(_pending, "ids", None) is not None:
+        yield _pending.ids
+        return
+    _pending.ids = pending = defaultdict(set)
+    try:
+        yield pending
+    finally:
+        _pending.ids = None
+    for kind, ids in pending.items():
+        reindex_objects(kind, ids)
+
+
+def schedule(kind: str, ids) -> None:
+    """Переиндексировать после коммита (или в конце deferred-блока)."""
+    pending = getattr(_pending, "ids", None)
+    if pending is not None:
+        pending[kind].update(ids)
+        return
+    ids = list(ids)
+    transaction.on_commit(lambda: reindex_objects(kind, ids))
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assistant import retrieval
+from assistant.orchestrator import build_answer, detect_intents, normalize
+
+QUERIES = [
+    "ферритин",
+    "подготовка к анализу мочи",
+    "сколько стоит общий анализ крови",
+    "гормоны щитовидной железы норма",
+    "сколько дней готовится витамин d",
+]
+
+
+def _best_us(fn, repeat: int, number: int) -> float:
+    """Лучшее из repeat прогонов по number вызовов, мкс на вызов."""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        dt = (time.perf_counter() - t0) / number
+        best = dt if best is None else min(best, dt)
+    return best * 1e6
+
+
+class Command(BaseCommand):
+    help = "Микробенчмарк orchestrator: normalize / detect_intents / build_answer на реальной выдаче (8 строк)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--query", action="append", help="Запрос (можно несколько; default: встроенный набор).")
+        parser.add_argument("--backend", choices=sorted(retrieval.BACKENDS), default="",
+                            help="Откуда брать строки выдачи (default: ASSISTANT_SEARCH_BACKEND).")
+        parser.add_argument("--limit", type=int, default=8, help="Строк в выдаче (default: 8).")
+        parser.add_argument("--number", type=int, default=2000, help="Вызовов в одном прогоне.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", dest="json_path", default="", help="Сохранить отчёт в JSON.")
+
+    def handle(self, *args, **opts):
+        backend = retrieval.get_backend(opts["backend"] or None)
+        number = max(1, int(opts["number"]))
+        repeat = max(1, int(opts["repeat"]))
+
+        rows_out = []
+        for q in opts["query"] or QUERIES:
+            qn = normalize(q)
+            rows = backend.search(qn, limit=max(1, int(opts["limit"])))
+            if not rows:
+                self.stdout.write(self.style.WARNING(f"{q!r}: пустая выдача, пропускаем"))
+                continue
+            rows_out.append({
+                "query": q,
+                "rows": len(rows),
+                "text_chars": sum(len(r.get("search_text") or "") for r in rows),
+                "normalize_us": round(_best_us(lambda: normalize(q), repeat, number), 2),
+                "intents_us": round(_best_us(lambda: detect_intents(qn), repeat, number), 2),
+                "build_answer_us": round(_best_us(lambda: build_answer(q, rows, qn=qn), repeat, number), 2),
+            })
+        if not rows_out:
+            raise CommandError("Ни один запрос ничего не нашёл — индекс пуст? (reindex_search)")
+
+        self.stdout.write(f"{'query':<36} {'rows':>4} {'chars':>6} {'norm us':>8} {'intent us':>9} {'answer us':>9}")
+        for r in rows_out:
+            self.stdout.write(
+                f"{r['query'][:36]:<36} {r['rows']:>4} {r['text_chars']:>6} "
+                f"{r['normalize_us']:>8.1f} {r['intents_us']:>9.1f} {r['build_answer_us']:>9.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"backend: {backend.name}"))
+
+        if opts["json_path"]:
+            Path(opts["json_path"]).write_text(json.dumps(rows_out, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(f"JSON: {opts['json_path']}")
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import json
+import math
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from assistant import retrieval
+from assistant.models import AssistantEvent
+from assistant.orchestrator import normalize
+from assistant.pipeline import retrieve
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank перцентиль (p в процентах)."""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[max(0, math.ceil(p / 100.0 * len(s)) - 1)]
+
+
+def seed_corpus(days: int, min_clicks: int, max_queries: int) -> list[dict]:
+    """
+    Размеченный корпус из AssistantEvent: запрос -> документы, по которым
+    по нему кликали (не меньше min_clicks раз). Самые частые запросы — первыми.
+    """
+    since = timezone.now() - timedelta(days=days)
+    by_query: dict[str, tuple[str, Counter]] = {}
+    rows = AssistantEvent.objects.filter(created_at__gte=since).exclude(clicked="").values_list("query", "clicked")
+    for query, clicked in rows.iterator(chunk_size=5000):
+        key = " ".join((query or "").lower().split())
+        if not key:
+            continue
+        raw, clicks = by_query.setdefault(key, (query.strip(), Counter()))
+        clicks[clicked] += 1
+
+    corpus = []
+    for raw, clicks in by_query.values():
+        expected = sorted(doc for doc, n in clicks.items() if n >= min_clicks)
+        if expected:
+            corpus.append({"q": raw, "expected": expected, "weight": sum(clicks.values())})
+    corpus.sort(key=lambda c: (-c["weight"], c["q"]))
+    return corpus[:max_queries]
+
+
+class Command(BaseCommand):
+    help = "Relevance (recall@k, MRR) and latency (p50/p95/p99) of assistant search per backend on a labelled query corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default="",
+                            help='JSON [{"q": ..., "expected": ["panel:12", ...]}, ...]; default: seed from AssistantEvent clicks.')
+        parser.add_argument("--days", type=int, default=90, help="Seed: events from the last N days.")
+        parser.add_argument("--min-clicks", type=int, default=1, help="Seed: clicks needed to call a document relevant.")
+        parser.add_argument("--max-queries", type=int, default=500, help="Seed: most frequent N queries.")
+        parser.add_argument("--save-corpus", default="", help="Write the (seeded) corpus to JSON for reproducible runs.")
+        parser.add_argument("--backend", action="append", choices=sorted(retrieval.BACKENDS),
+                            help="Backend to measure (repeatable; default: all usable on this DB).")
+        parser.add_argument("--k", type=int, action="append", help="Cut-offs for recall@k (default: 1, 3, 8).")
+        parser.add_argument("--repeat", type=int, default=3, help="Latency samples per query.")
+        parser.add_argument("--raw", action="store_true",
+                            help="Backend search on normalize(q) only (no code hits, typo fixes, rerank).")
+        parser.add_argument("--cache", action="store_true", help="Keep the result cache on (default: off).")
+        parser.add_argument("--json", dest="json_path", default="", help="Write the report to JSON.")
+        parser.add_argument("--baseline", default="", help="Previous JSON report to compare against.")
+        parser.add_argument("--max-drop", type=float, default=None,
+                            help="Fail if recall@max(k) or MRR drops by more than this vs --baseline.")
+
+    def handle(self, *args, **opts):
+        corpus = self.load_corpus(opts)
+        if not corpus:
+            raise CommandError("Empty corpus: no clicked events to seed from — pass --corpus")
+        if opts["save_corpus"]:
+            Path(opts["save_corpus"]).write_text(json.dumps(corpus, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(f"corpus: {opts['save_corpus']}")
+
+        ks = sorted(set(opts["k"] or [1, 3, 8]))
+        backends = opts["backend"] or [
+            name for name in sorted(retrieval.BACKENDS)
+            if name != "mysql" or connection.vendor == "mysql"
+        ]
+
+        report = {
+            "generated_at": timezone.now().isoformat(),
+            "corpus": {"size": len(corpus), "source": opts["corpus"] or "events"},
+            "mode": "raw" if opts["raw"] else "pipeline",
+            "k": ks,
+            "settings": {
+                "rerank": getattr(settings, "ASSISTANT_RERANK", True),
+                "typo_correction": getattr(settings, "ASSISTANT_TYPO_CORRECTION", True),
+                "cache": bool(opts["cache"]),
+            },
+            "backends": {},
+        }
+        with override_settings(ASSISTANT_RESULT_CACHE=bool(opts["cache"])):
+            for name in backends:
+                report["backends"][name] = self.evaluate(name, corpus, ks, max(1, int(opts["repeat"])), opts["raw"])
+
+        self.print_report(report)
+        if opts["json_path"]:
+            Path(opts["json_path"]).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(f"JSON: {opts['json_path']}")
+        if opts["baseline"]:
+            self.compare(report, json.loads(Path(opts["baseline"]).read_text(encoding="utf-8")), opts["max_drop"])
+
+    # ---------------------------
+
+    def load_corpus(self, opts) -> list[dict]:
+        if not opts["corpus"]:
+            return seed_corpus(int(opts["days"]), max(1, int(opts["min_clicks"])), max(1, int(opts["max_queries"])))
+        items = json.loads(Path(opts["corpus"]).read_text(encoding="utf-8"))
+        return [
+            {"q": str(it["q"]), "expected": [str(e) for e in it["expected"]]}
+            for it in items if it.get("q") and it.get("expected")
+        ]
+
+    def evaluate(self, backend: str, corpus: list[dict], ks: list[int], repeat: int, raw: bool) -> dict:
+        limit = max(ks)
+        be = retrieval.get_backend(backend)
+
+        def run(q: str) -> list[str]:
+            if raw:
+                return [r["id"] for r in be.search(normalize(q), limit=limit)]
+            return [r["id"] for r in retrieve(q, limit=limit, backend=backend).rows]
+
+        run(corpus[0]["q"])  # прогрев: индексы/словари процесса строятся при первом запросе
+
+        recall = {k: 0.0 for k in ks}
+        rr_sum, zero = 0.0, 0
+        latencies: list[float] = []
+        misses = []
+        for item in corpus:
+            ids: list[str] = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                ids = run(item["q"])
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+
+            expected = set(item["expected"])
+            zero += not ids
+            for k in ks:
+                recall[k] += len(expected & set(ids[:k])) / len(expected)
+            rank = next((i for i, doc in enumerate(ids, 1) if doc in expected), 0)
+            rr_sum += 1.0 / rank if rank else 0.0
+            if not rank:
+                misses.append(item["q"])
+
+        n = len(corpus)
+        return {
+            "queries": n,
+            "recall": {f"@{k}": round(recall[k] / n, 4) for k in ks},
+            "mrr": round(rr_sum / n, 4),
+            "zero_results": zero,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3),
+                "p99": round(percentile(latencies, 99), 3),
+                "mean": round(sum(latencies) / len(latencies), 3),
+            },
+            "misses": misses[:20],
+        }
+
+    def print_report(self, report: dict) -> None:
+        ks = report["k"]
+        head = f"{'backend':<8} " + " ".join(f"{'R@' + str(k):>7}" for k in ks)
+        self.stdout.write(f"{head} {'MRR':>7} {'zero':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, r in report["backends"].items():
+            lat = r["latency_ms"]
+            self.stdout.write(
+                f"{name:<8} " + " ".join(f"{r['recall'][f'@{k}']:>7.3f}" for k in ks)
+                + f" {r['mrr']:>7.3f} {r['zero_results']:>5} {lat['p50']:>8.2f} {lat['p95']:>8.2f} {lat['p99']:>8.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"corpus: {report['corpus']['size']} queries ({report['corpus']['source']}), mode: {report['mode']}"
+        ))
+
+    def compare(self, report: dict, baseline: dict, max_drop: float | None) -> None:
+        key = f"@{max(report['k'])}"
+        failed = []
+        for name, cur in report["backends"].items():
+            old = baseline.get("backends", {}).get(name)
+            if not old:
+                continue
+            for metric, now, was in (
+                (f"recall{key}", cur["recall"].get(key, 0.0), old.get("recall", {}).get(key, 0.0)),
+                ("mrr", cur["mrr"], old.get("mrr", 0.0)),
+            ):
+                delta = now - was
+                self.stdout.write(f"{name:<8} {metric:<10} {was:.3f} -> {now:.3f} ({delta:+.3f})")
+                if max_drop is not None and -delta > max_drop:
+                    failed.append(f"{name} {metric} {delta:+.3f}")
+            p95 = cur["latency_ms"]["p95"] - old.get("latency_ms", {}).get("p95", 0.0)
+            self.stdout.write(f"{name:<8} {'p95 ms':<10} {p95:+.2f}")
+        if failed:
+            raise CommandError("Relevance regression: " + ", ".join(failed))
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from assistant import answers
+
+
+class Command(BaseCommand):
+    help = "Build precomputed assistant answers (preparation / duration / price / biomaterial per panel); reindex_search does this too."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--panel", type=int, action="append", help="Only these panel ids (repeatable).")
+        parser.add_argument("--batch", type=int, default=1000, help="Bulk insert batch size (default: 1000).")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        counts = answers.rebuild(opts["panel"], batch=max(1, int(opts["batch"])))
+        by_intent = ", ".join(f"{i}={counts.get(i, 0)}" for i in answers.ANSWER_INTENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f"assistant: answers rows={sum(counts.values())} ({by_intent}) in {time.monotonic() - t0:.1f}s"
+        ))
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from assistant import rerank
+
+
+class Command(BaseCommand):
+    help = "Build the TF-IDF rerank matrix from SearchIndex (reindex_search does this too)."
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        m = rerank.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"assistant: tf-idf matrix {len(m)} docs, {len(m.terms)} features, {len(m.data)} nnz "
+            f"in {time.monotonic() - t0:.1f}s -> {rerank.matrix_path()}"
+        ))
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from assistant import spelling
+from assistant.index_version import content_version
+
+
+class Command(BaseCommand):
+    help = "Build the spelling vocabulary from SearchIndex (reindex_search does this too)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--if-stale", action="store_true",
+                            help="Skip when spelling.bin already matches the index (for frequent cron runs).")
+
+    def handle(self, *args, **opts):
+        if opts["if_stale"]:
+            try:
+                if spelling.Vocabulary.load(spelling.index_path()).version == content_version():
+                    self.stdout.write("assistant: spelling vocabulary is up to date")
+                    return
+            except (OSError, ValueError):
+                pass
+        t0 = time.monotonic()
+        vocab = spelling.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"assistant: spelling vocabulary {len(vocab)} terms, {len(vocab.grams)} trigrams "
+            f"in {time.monotonic() - t0:.1f}s -> {spelling.index_path()}"
+        ))
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from assistant.boosts import collect_stats, compute_boosts
+from assistant.index_version import bump_boost_version
+from assistant.models import SearchIndex
+
+
+class Command(BaseCommand):
+    help = "Learn SearchIndex.boost from assistant click-through rates (smoothed CTR, bulk update)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=getattr(settings, "ASSISTANT_BOOST_DAYS", 30),
+                            help="Use events from the last N days.")
+        parser.add_argument("--min-delta", type=float, default=getattr(settings, "ASSISTANT_BOOST_MIN_DELTA", 0.05),
+                            help="Skip rows whose boost would change by less than this.")
+        parser.add_argument("--batch", type=int, default=500, help="Rows per bulk_update (default: 500).")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+
+    def handle(self, *args, **opts):
+        days = max(1, int(opts["days"]))
+        min_delta = max(0.0, float(opts["min_delta"]))
+
+        stats = collect_stats(days)
+        if not stats.clicks:
+            # без кликов CTR не посчитать; старые boost не трогаем
+            self.stdout.write(self.style.WARNING(f"assistant: no clicks in {stats.events} events over {days} days"))
+            return
+        target = compute_boosts(stats)
+
+        changed = []
+        rows = SearchIndex.objects.only("id", "kind", "object_id", "boost").order_by("id")
+        for row in rows.iterator(chunk_size=5000):
+            # без показов за окно — обратно к нейтральному 1.0
+            new = target.get(f"{row.kind}:{row.object_id}", 1.0)
+            if abs(new - float(row.boost or 1.0)) >= min_delta:
+                # updated_at не трогаем: boost не меняет текст, словари и TF-IDF пересобирать незачем
+                row.boost = new
+                changed.append(row)
+
+        self.stdout.write(
+            f"assistant: {stats.events} events, {len(stats.views)} shown docs, "
+            f"{sum(stats.clicks.values())} clicks, global CTR {stats.global_ctr:.3f}"
+        )
+        top = sorted(changed, key=lambda r: -r.boost)[:5]
+        for r in top:
+            self.stdout.write(f"  {r.kind}:{r.object_id} -> {r.boost}")
+
+        if opts["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"assistant: dry run, {len(changed)} rows would change"))
+            return
+
+        with transaction.atomic():
+            SearchIndex.objects.bulk_update(changed, ["boost"], batch_size=max(1, int(opts["batch"])))
+            if changed:
+                transaction.on_commit(bump_boost_version)
+        self.stdout.write(self.style.SUCCESS(f"assistant: boosts updated, rows={len(changed)}"))
@@ -1,253 +1,39 @@
 from __future__ import annotations
 
-import re
-from datetime import date
-from decimal import Decimal
-
-from django.core.management.base import BaseCommand
-from django.db import transaction
-
+import json
+import multiprocessing as mp
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from assistant.boosts import learned_boosts
+from assistant.index_version import bump_index_version
+from assistant.indexing import (
+    ROW_TUPLE,
+    SOURCES,
+    build_shard,
+    build_contact_row,
+    build_site_service_row,
+    build_lab_service_row,
+    build_news_row,
+    build_panel_row,
+    build_test_row,
+    category_path_map,
+    contacts_qs,
+    documents_qs,
+    lab_services_qs,
+    materials_map_for,
+    news_qs,
+    panels_qs,
+    shard_ranges,
+    site_services_qs,
+    tests_qs,
+)
 from assistant.models import SearchIndex
-
-# ===== Imports of your models =====
-from lab.models import Test, Panel, Service as LabService, PanelMaterial
-from main.models import Contact, News
-
-
-# ---------------------------
-# Utils
-# ---------------------------
-
-TAG_RE = re.compile(r"<[^>]+>")
-WS_RE = re.compile(r"\s+")
-
-
-def strip_html(text: str) -> str:
-    if not text:
-        return ""
-    # remove tags
-    text = TAG_RE.sub(" ", str(text))
-    text = text.replace("&nbsp;", " ")
-    text = text.replace("\xa0", " ")
-    text = WS_RE.sub(" ", text).strip()
-    return text
-
-
-def cut(text: str, n: int) -> str:
-    if not text:
-        return ""
-    t = str(text).strip()
-    return t if len(t) <= n else (t[:n].rstrip() + "…")
-
-
-def safe_url(obj) -> str:
-    try:
-        if hasattr(obj, "get_absolute_url"):
-            return obj.get_absolute_url() or ""
-    except Exception:
-        return ""
-    return ""
-
-
-def category_path(cat) -> str:
-    """
-    Full path for PanelCategory (parent -> child).
-    """
-    if not cat:
-        return ""
-    parts = [cat.name]
-    p = getattr(cat, "parent", None)
-    while p:
-        parts.append(p.name)
-        p = getattr(p, "parent", None)
-    return " / ".join(reversed([x for x in parts if x]))
-
-
-def dec_to_str(v) -> str:
-    if v is None:
-        return ""
-    if isinstance(v, Decimal):
-        # avoid exponent formats
-        return format(v, "f").rstrip("0").rstrip(".") if "." in format(v, "f") else format(v, "f")
-    return str(v)
-
-
-def ref_range(low: str, high: str) -> str:
-    low = (low or "").strip()
-    high = (high or "").strip()
-    if low and high:
-        return f"{low}–{high}"
-    if low and not high:
-        return f"от {low}"
-    if high and not low:
-        return f"до {high}"
-    return ""
-
-
-# ---------------------------
-# Builders
-# ---------------------------
-
-def build_test_row(t: Test) -> dict:
-    meta = {
-        "code": t.code,
-        "unit": (t.unit or "").strip(),
-        "method": cut(strip_html(t.method), 80),
-        "ref": ref_range(t.low, t.high),
-    }
-
-    # короткий "hint" (не простыня) — из description, но сильно режем
-    # если description пустой — пусто, фронт сам скроет строку
-    hint = cut(strip_html(t.description), 80)
-    if hint:
-        meta["hint"] = hint
-
-    title = f"{t.name}".strip() or t.code
-
-    search_text = " ".join([
-        t.code or "",
-        title,
-        meta.get("unit", ""),
-        meta.get("method", ""),
-        meta.get("ref", ""),
-        strip_html(t.description or ""),
-    ]).strip()
-
-    return {
-        "kind": "test",
-        "object_id": t.id,
-        "title": title,
-        "url": safe_url(t),
-        "search_text": search_text,
-        "meta": meta,
-    }
-
-
-def build_panel_row(p: Panel, materials_map: dict[int, list[str]], cat_map: dict[int, str]) -> dict:
-    cat_path = cat_map.get(p.category_id or 0, "")
-    meta = {
-        "code": p.code,
-        "duration": (p.duration or "").strip(),
-        "category": cat_path,
-    }
-
-    mats = materials_map.get(p.id, [])
-    if mats:
-        meta["biomaterials"] = mats[:6]
-
-    title = cut((p.name or "").strip() or p.code, 180)
-
-
-    search_text = " ".join([
-        p.code or "",
-        title,
-        (p.duration or ""),
-        cat_path,
-        " ".join(mats),
-    ]).strip()
-
-    return {
-        "kind": "panel",
-        "object_id": p.id,
-        "title": title,
-        "url": safe_url(p),
-        "search_text": search_text,
-        "meta": meta,
-    }
-
-
-def build_lab_service_row(s: LabService) -> dict:
-    meta = {
-        "code": s.code,
-        "price": dec_to_str(s.cost),
-        "currency": (s.currency or "").strip(),
-        "duration": (s.duration or "").strip(),
-        "panel_code": s.panel.code if s.panel_id else "",
-        "panel_name": s.panel.name if s.panel_id else "",
-    }
-
-    title = cut((s.name or "").strip() or s.code, 180)
-
-    search_text = " ".join([
-        s.code or "",
-        title,
-        dec_to_str(s.cost),
-        (s.currency or ""),
-        (s.duration or ""),
-        (s.comment or ""),
-        meta.get("panel_code", ""),
-        meta.get("panel_name", ""),
-    ]).strip()
-
-    return {
-        "kind": "lab_service",
-        "object_id": s.id,
-        "title": title,
-        "url": safe_url(s),
-        "search_text": search_text,
-        "meta": meta,
-    }
-
-
-def build_contact_row(c: Contact) -> dict:
-    meta = {
-        "group": getattr(c.group, "name", "") if c.group_id else "",
-        "phone": (c.phone or "").strip(),
-        "email": (c.email or "").strip(),
-        "address": (c.address or "").strip(),
-        "is_main": bool(c.is_main),
-    }
-
-    title = cut((c.name or "").strip() or "Контакт", 180)
-
-    search_text = " ".join([
-        title,
-        meta["group"],
-        meta["phone"],
-        meta["email"],
-        meta["address"],
-        strip_html(c.description or ""),
-    ]).strip()
-
-    return {
-        "kind": "contact",
-        "object_id": c.id,
-        "title": title,
-        "url": safe_url(c),
-        "search_text": search_text,
-        "meta": meta,
-    }
-
-
-def build_news_row(n: News) -> dict:
-    meta = {
-        "category": getattr(n.cat, "name", "") if n.cat_id else "",
-        "date": n.time_create.isoformat() if isinstance(n.time_create, date) else str(n.time_create) if n.time_create else "",
-    }
-
-    title = cut((n.title or "").strip() or "Новость", 180)
-
-    # берём кусок контента без HTML
-    text = strip_html(n.content or "")
-    text2 = strip_html(n.content2 or "")
-    text3 = strip_html(n.content3 or "")
-    text4 = strip_html(n.content4 or "")
-    body = " ".join([text, text2, text3, text4]).strip()
-
-    search_text = " ".join([
-        title,
-        meta["category"],
-        body,
-    ]).strip()
-
-    return {
-        "kind": "news",
-        "object_id": n.id,
-        "title": title,
-        "url": safe_url(n),
-        "search_text": search_text,
-        "meta": meta,
-    }
+from assistant import answers, rerank, spelling
 
 
 # ---------------------------
@@ -260,98 +46,273 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--batch", type=int, default=1000, help="Bulk insert batch size (default: 1000).")
         parser.add_argument("--keep", action="store_true", help="Do not wipe existing index (append).")
+        parser.add_argument("--swap", action="store_true",
+                            help="MySQL: build into a shadow table and swap it in with RENAME TABLE (no downtime). "
+                                 "Previous table is kept as <table>_old.")
+        parser.add_argument("--rollback", action="store_true",
+                            help="MySQL: swap <table>_old back in (undo the last --swap).")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Build rows in N processes (per kind + id-range shards); 1 = sequential.")
+        parser.add_argument("--shard-size", type=int, default=2000,
+                            help="Objects per shard for --workers (default: 2000).")
 
-    @transaction.atomic
     def handle(self, *args, **opts):
         batch = int(opts["batch"] or 1000)
-        keep = bool(opts["keep"])
-
+        self.workers = max(1, int(opts["workers"] or 1))
+        self.shard_size = max(1, int(opts["shard_size"] or 2000))
+        if self.workers > 1 and connection.vendor == "sqlite":
+            # один писатель: открытая транзакция координатора блокирует чтение воркеров
+            self.stdout.write(self.style.WARNING("assistant: --workers ignored on SQLite, building sequentially"))
+            self.workers = 1
+        # boost, выученные learn_assistant_boosts, переживают полную пересборку
+        self.boosts = {} if opts["rollback"] else learned_boosts()
+
+        if opts["rollback"]:
+            return self.rollback()
+        if opts["swap"]:
+            if opts["keep"]:
+                raise CommandError("--swap always builds a full index; --keep makes no sense with it")
+            return self.handle_swap(batch)
+
+        with transaction.atomic():
+            self.handle_inplace(batch, keep=bool(opts["keep"]))
+
+    # ---------------------------
+    # modes
+    # ---------------------------
+
+    def handle_inplace(self, batch: int, keep: bool):
         self.stdout.write(self.style.WARNING("assistant: reindex_search started"))
 
         if not keep:
             SearchIndex.objects.all().delete()
             self.stdout.write("assistant: cleared SearchIndex")
 
+        def write(rows):
+            SearchIndex.objects.bulk_create([SearchIndex(**r) for r in rows], batch_size=batch)
+
+        created = self.index_all(write, batch)
+
+        transaction.on_commit(bump_index_version)
+        transaction.on_commit(self.build_vocabulary)
+        transaction.on_commit(self.build_rerank)
+        transaction.on_commit(self.build_answers)
+        self.stdout.write(self.style.SUCCESS(f"assistant: reindex_search done. total={created}"))
+
+    def handle_swap(self, batch: int):
+        """
+        Живую таблицу не трогаем, пока новая не готова:
+          1) CREATE TABLE shadow LIKE live (снимаем FULLTEXT — строим после загрузки, так быстрее);
+          2) заливаем строки в shadow;
+          3) возвращаем FULLTEXT;
+          4) RENAME TABLE live TO old, shadow TO live — атомарно для читателей.
+        DDL в MySQL коммитит неявно, поэтому здесь без общей транзакции.
+        Правки через сигналы, пришедшие во время сборки, попадут в старую
+        таблицу — после свапа их подберёт следующий reindex_objects/reindex.
+        """
+        if connection.vendor != "mysql":
+            raise CommandError("--swap needs MySQL (RENAME TABLE + FULLTEXT); use plain reindex_search here")
+
+        live = SearchIndex._meta.db_table
+        shadow, old = f"{live}_shadow", f"{live}_old"
+        qn = connection.ops.quote_name
+
+        self.stdout.write(self.style.WARNING(f"assistant: reindex_search --swap started ({shadow})"))
+
+        with connection.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {qn(shadow)}")
+            cur.execute(f"CREATE TABLE {qn(shadow)} LIKE {qn(live)}")
+            fulltext = self._fulltext_indexes(cur, shadow)
+            for name, _cols in fulltext:
+                cur.execute(f"ALTER TABLE {qn(shadow)} DROP INDEX {qn(name)}")
+
+        cols = ("kind", "object_id", "title", "url", "search_text", "boost", "extra", "meta", "updated_at")
+        insert_sql = (
+            f"INSERT INTO {qn(shadow)} ({', '.join(qn(c) for c in cols)}) "
+            f"VALUES ({', '.join(['%s'] * len(cols))})"
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        def write(rows):
+            params = [
+                (r["kind"], r["object_id"], r["title"], r["url"], r["search_text"], r.get("boost", 1.0),
+                 json.dumps(r.get("extra") or {}, ensure_ascii=False),
+                 json.dumps(r.get("meta") or {}, ensure_ascii=False),
+                 now)
+                for r in rows
+            ]
+            with connection.cursor() as cur:
+                cur.executemany(insert_sql, params)
+
+        created = self.index_all(write, batch)
+        if not created:
+            raise CommandError(f"assistant: shadow table is empty — swap aborted, {live} left as is")
+
+        with connection.cursor() as cur:
+            t0 = time.monotonic()
+            for name, cols_ in fulltext:
+                cur.execute(f"ALTER TABLE {qn(shadow)} ADD FULLTEXT INDEX {qn(name)} ({', '.join(qn(c) for c in cols_)})")
+            if fulltext:
+                self.stdout.write(f"assistant: FULLTEXT rebuilt in {time.monotonic() - t0:.1f}s")
+
+            cur.execute(f"DROP TABLE IF EXISTS {qn(old)}")
+            cur.execute(f"RENAME TABLE {qn(live)} TO {qn(old)}, {qn(shadow)} TO {qn(live)}")
+
+        bump_index_version()
+        self.build_vocabulary()
+        self.build_rerank()
+        self.build_answers()
+        self.stdout.write(self.style.SUCCESS(
+            f"assistant: reindex_search --swap done. total={created}; previous index kept as {old} "
+            f"(undo: reindex_search --rollback)"
+        ))
+
+    def rollback(self):
+        if connection.vendor != "mysql":
+            raise CommandError("--rollback needs MySQL")
+        live = SearchIndex._meta.db_table
+        old, tmp = f"{live}_old", f"{live}_swap_tmp"
+        qn = connection.ops.quote_name
+
+        if old not in connection.introspection.table_names():
+            raise CommandError(f"No {old} table — nothing to roll back to")
+
+        with connection.cursor() as cur:
+            # меняем местами: повторный --rollback вернёт новый индекс
+            cur.execute(f"RENAME TABLE {qn(live)} TO {qn(tmp)}, {qn(old)} TO {qn(live)}, {qn(tmp)} TO {qn(old)}")
+
+        bump_index_version()
+        self.stdout.write(self.style.SUCCESS(f"assistant: rolled back; current index is now in {old}"))
+
+    def build_vocabulary(self):
+        t0 = time.monotonic()
+        vocab = spelling.rebuild()
+        self.stdout.write(
+            f"assistant: spelling vocabulary {len(vocab)} terms, {len(vocab.grams)} trigrams "
+            f"in {time.monotonic() - t0:.1f}s -> {spelling.index_path()}"
+        )
+
+    def build_rerank(self):
+        t0 = time.monotonic()
+        m = rerank.rebuild()
+        self.stdout.write(
+            f"assistant: tf-idf matrix {len(m)} docs, {len(m.terms)} features, {len(m.data)} nnz "
+            f"in {time.monotonic() - t0:.1f}s -> {rerank.matrix_path()}"
+        )
+
+    def build_answers(self):
+        t0 = time.monotonic()
+        counts = answers.rebuild()
+        self.stdout.write(f"assistant: answers rows={sum(counts.values())} in {time.monotonic() - t0:.1f}s")
+
+    @staticmethod
+    def _fulltext_indexes(cur, table: str) -> list[tuple[str, list[str]]]:
+        cur.execute(f"SHOW INDEX FROM {connection.ops.quote_name(table)} WHERE Index_type = 'FULLTEXT'")
+        names = [d[0] for d in cur.description]
+        by_name: dict[str, list[tuple[int, str]]] = {}
+        for row in cur.fetchall():
+            r = dict(zip(names, row))
+            by_name.setdefault(r["Key_name"], []).append((r["Seq_in_index"], r["Column_name"]))
+        return [(name, [c for _, c in sorted(cols)]) for name, cols in by_name.items()]
+
+    # ---------------------------
+    # rows
+    # ---------------------------
+
+    def index_all(self, write, batch: int) -> int:
+        """
+        Обходит все источники и отдаёт строки в write() пачками по batch.
+        Возвращает число записанных строк.
+        """
+        rows = self.iter_rows_parallel() if self.workers > 1 else self.iter_rows()
+
         created = 0
         buf = []
+        t0 = time.monotonic()
 
         def flush():
             nonlocal created, buf
             if not buf:
                 return
-            SearchIndex.objects.bulk_create(buf, batch_size=batch)
+            write(buf)
             created += len(buf)
             buf = []
-            self.stdout.write(f"assistant: inserted {created}")
-
-        # -------- Tests --------
-        self.stdout.write("assistant: indexing tests...")
-        for t in Test.objects.all().only("id", "code", "name", "unit", "method", "description", "low", "high").iterator(chunk_size=2000):
-            row = build_test_row(t)
-            buf.append(SearchIndex(**row))
+            rate = created / max(time.monotonic() - t0, 1e-6)
+            self.stdout.write(f"assistant: inserted {created} ({rate:,.0f} rows/s)")
+
+        boosts = getattr(self, "boosts", {})
+        for row in rows:
+            b = boosts.get((row["kind"], row["object_id"]))
+            if b is not None:
+                row["boost"] = b
+            buf.append(row)
             if len(buf) >= batch:
                 flush()
         flush()
 
+        elapsed = time.monotonic() - t0
+        self.stdout.write(f"assistant: built {created} rows in {elapsed:.1f}s ({created / max(elapsed, 1e-6):,.0f} rows/s)")
+        return created
+
+    def iter_rows(self):
+        # -------- Tests --------
+        self.stdout.write("assistant: indexing tests...")
+        for t in tests_qs().iterator(chunk_size=2000):
+            yield build_test_row(t)
+
         # -------- Panels (need category path + biomaterials) --------
+        # фиксированное число запросов: категории (1) + материалы (1) + сами панели (1 проход)
         self.stdout.write("assistant: indexing panels...")
-        panels = Panel.objects.select_related("category").all().only("id", "code", "name", "duration", "category_id", "category__name", "category__parent_id")
-
-        # category path cache
-        cat_ids = set(p.category_id for p in panels if p.category_id)
-        cat_map = {}
-        if cat_ids:
-            # we already have category via select_related for direct, but for full path we need parents chain;
-            # easiest: compute lazily via object category_path() using loaded relations where possible.
-            # We'll do a second fetch of categories with parents preloaded is tricky; instead compute per panel.
-            pass
-
-        # material map: panel_id -> list of biomaterial names
-        materials_map = {}
-        for pm in PanelMaterial.objects.select_related("biomaterial").all().only("panel_id", "biomaterial__name").iterator(chunk_size=4000):
-            materials_map.setdefault(pm.panel_id, []).append((pm.biomaterial.name or "").strip())
-
-        # build category paths per panel (works because category.parent is accessible if loaded; if not, path will be partial but ok)
-        for p in panels.iterator(chunk_size=2000):
-            cat_map[p.category_id or 0] = category_path(p.category) if p.category_id else ""
-
-            row = build_panel_row(p, materials_map=materials_map, cat_map=cat_map)
-            buf.append(SearchIndex(**row))
-            if len(buf) >= batch:
-                flush()
-        flush()
+        cat_map = category_path_map()
+        materials_map = materials_map_for()
+
+        for p in panels_qs().iterator(chunk_size=2000):
+            yield build_panel_row(p, materials_map=materials_map, cat_map=cat_map)
 
         # -------- Lab services --------
         self.stdout.write("assistant: indexing lab services...")
-        qs = LabService.objects.select_related("panel").all().only("id", "code", "name", "cost", "currency", "duration", "comment", "panel_id", "panel__code", "panel__name")
-        for s in qs.iterator(chunk_size=2000):
-            row = build_lab_service_row(s)
-            buf.append(SearchIndex(**row))
-            if len(buf) >= batch:
-                flush()
-        flush()
+        for s in lab_services_qs().iterator(chunk_size=2000):
+            yield build_lab_service_row(s)
 
         # -------- Contacts --------
         self.stdout.write("assistant: indexing contacts...")
-        qs = Contact.objects.select_related("group").all().only("id", "name", "phone", "email", "address", "description", "group_id", "group__name", "is_main")
-        for c in qs.iterator(chunk_size=2000):
-            row = build_contact_row(c)
-            buf.append(SearchIndex(**row))
-            if len(buf) >= batch:
-                flush()
-        flush()
+        for c in contacts_qs().iterator(chunk_size=2000):
+            yield build_contact_row(c)
 
         # -------- News --------
         self.stdout.write("assistant: indexing news...")
-        qs = News.objects.select_related("cat").all().only(
-            "id", "title", "slug", "time_create", "cat_id", "cat__name",
-            "content", "content2", "content3", "content4",
-        )
-        for n in qs.iterator(chunk_size=500):
-            row = build_news_row(n)
-            buf.append(SearchIndex(**row))
-            if len(buf) >= batch:
-                flush()
-        flush()
-
-        self.stdout.write(self.style.SUCCESS(f"assistant: reindex_search done. total={created}"))
+        for n in news_qs().iterator(chunk_size=500):
+            yield build_news_row(n)
+
+        # -------- Documents (text of PDFs: hash cache + process pool) --------
+        self.stdout.write("assistant: indexing documents...")
+        _qs_fn, build_docs = SOURCES["doc"]
+        yield from build_docs(documents_qs())
+
+        # -------- Site services --------
+        self.stdout.write("assistant: indexing site services...")
+        for s in site_services_qs().iterator(chunk_size=500):
+            yield build_site_service_row(s)
+
+    def iter_rows_parallel(self):
+        """
+        Шардируем каждый kind по диапазонам id и строим строки в spawn-пуле:
+        у каждого воркера своё приложение Django и своё соединение с БД.
+        Воркеры возвращают кортежи ROW_TUPLE, пишет в БД только координатор.
+        """
+        shards = []
+        for kind in SOURCES:
+            shards.extend(shard_ranges(kind, self.shard_size))
+        self.stdout.write(f"assistant: {len(shards)} shards over {len(SOURCES)} kinds, {self.workers} workers")
+
+        # инициализатор — сам django.setup: его можно распиклить до загрузки приложений
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(self.workers, initializer=django.setup) as pool:
+            for tuples in pool.imap_unordered(_build_shard, shards):
+                for t in tuples:
+                    yield dict(zip(ROW_TUPLE, t))
+
+
+def _build_shard(args):
+    # imap_unordered передаёт один аргумент; функция модульная — её должен уметь импортировать воркер
+    return build_shard(*args)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from assistant.models import AssistantEvent, AssistantQueryDaily, RollupWatermark
+
+WATERMARK = "assistant_query_daily"
+
+
+class Command(BaseCommand):
+    help = "Rollup AssistantEvent into daily per-query aggregates (incremental) and purge old raw events."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000, help="Events per rollup step (default: 5000).")
+        parser.add_argument("--lag-minutes", type=int, default=5,
+                            help="Do not touch events younger than N minutes (late clicks / open transactions).")
+        parser.add_argument("--retention-days", type=int,
+                            default=getattr(settings, "ASSISTANT_EVENTS_RETENTION_DAYS", 90),
+                            help="Delete raw events older than N days once rolled up (0 = keep forever).")
+        parser.add_argument("--delete-batch", type=int, default=5000, help="Rows per DELETE (default: 5000).")
+
+    def handle(self, *args, **opts):
+        batch = max(1, int(opts["batch"]))
+        horizon = timezone.now() - timedelta(minutes=max(0, int(opts["lag_minutes"])))
+
+        wm, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+        total = 0
+        while True:
+            events = list(
+                AssistantEvent.objects.filter(id__gt=wm.last_id, created_at__lt=horizon)
+                .order_by("id")
+                .values_list("id", "created_at", "normalized", "query", "results", "clicked")[:batch]
+            )
+            if not events:
+                break
+            self.apply(events, wm)
+            total += len(events)
+            self.stdout.write(f"assistant: rolled up {total} events (watermark={wm.last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"assistant: rollup done, events={total}, watermark={wm.last_id}"))
+
+        days = int(opts["retention_days"] or 0)
+        if days > 0:
+            deleted = self.purge(timezone.now() - timedelta(days=days), wm.last_id, max(1, int(opts["delete_batch"])))
+            self.stdout.write(f"assistant: purged {deleted} raw events older than {days} days")
+
+    @transaction.atomic
+    def apply(self, events, wm: RollupWatermark):
+        """Одна пачка: агрегаты и водяной знак — в одной транзакции."""
+        acc: dict[tuple, list[int]] = {}
+        for _id, created_at, normalized, query, results, clicked in events:
+            key = (timezone.localdate(created_at), (normalized or query or "").strip().lower()[:512])
+            n = len(results) if isinstance(results, list) else 0
+            a = acc.setdefault(key, [0, 0, 0, 0])
+            a[0] += 1
+            a[1] += n == 0
+            a[2] += bool(clicked)
+            a[3] += n
+
+        existing = {
+            (r.day, r.query): r
+            for r in AssistantQueryDaily.objects.select_for_update().filter(
+                day__in={d for d, _ in acc}, query__in={q for _, q in acc},
+            )
+        }
+        to_create, to_update = [], []
+        for (day, query), (count, zero, clicks, rsum) in acc.items():
+            row = existing.get((day, query))
+            if row is None:
+                to_create.append(AssistantQueryDaily(
+                    day=day, query=query, count=count, zero_results=zero, clicks=clicks, results_sum=rsum,
+                ))
+                continue
+            row.count += count
+            row.zero_results += zero
+            row.clicks += clicks
+            row.results_sum += rsum
+            to_update.append(row)
+
+        if to_create:
+            AssistantQueryDaily.objects.bulk_create(to_create, batch_size=1000)
+        if to_update:
+            AssistantQueryDaily.objects.bulk_update(
+                to_update, ["count", "zero_results", "clicks", "results_sum"], batch_size=1000,
+            )
+
+        wm.last_id = events[-1][0]
+        wm.save(update_fields=["last_id", "updated_at"])
+
+    def purge(self, cutoff, watermark: int, size: int) -> int:
+        """Удаляем только то, что уже попало в агрегаты (id <= watermark), пачками по size."""
+        deleted = 0
+        qs = AssistantEvent.objects.filter(created_at__lt=cutoff, id__lte=watermark).order_by("id")
+        while True:
+            ids = list(qs.values_list("id", flat=True)[:size])
+            if not ids:
+                return deleted
+            n, _ = AssistantEvent.objects.filter(id__in=ids).delete()
+            deleted += n
@@ -0,0 +1,48 @@
+"""
+Простые счётчики ассистента в памяти процесса (без внешних зависимостей).
+
+Значения — на воркер; при нескольких воркерах смотрим каждый или
+суммируем снаружи. Отдаются через /assistant/metrics/ (только staff).
+"""
+import threading
+import time
+
+_lock = threading.Lock()
+_counters: dict[str, int] = {}
+_gauges: dict = {}
+_started = time.time()
+
+
+def incr(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def get(name: str) -> int:
+    return _counters.get(name, 0)
+
+
+def gauge(name: str, fn) -> None:
+    """Значение, которое считается в момент snapshot() (например, длина очереди)."""
+    _gauges[name] = fn
+
+
+def ratio(hits: str, misses: str) -> float:
+    h, m = get(hits), get(misses)
+    return round(h / (h + m), 4) if (h + m) else 0.0
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(sorted(_counters.items()))
+    return {
+        "uptime_s": int(time.time() - _started),
+        "counters": counters,
+        "gauges": {name: fn() for name, fn in sorted(_gauges.items())},
+        "result_cache_hit_ratio": ratio("result_cache.hit", "result_cache.miss"),
+    }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0003_searchindex_meta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assistantevent',
+            name='variant',
+            field=models.CharField(blank=True, default='original', max_length=16),
+        ),
+    ]
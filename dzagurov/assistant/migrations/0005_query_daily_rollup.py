@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0004_assistantevent_variant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AssistantQueryDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('query', models.CharField(max_length=512)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('zero_results', models.PositiveIntegerField(default=0)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('results_sum', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Запросы ассистента по дням',
+                'verbose_name_plural': 'Запросы ассистента по дням',
+                'ordering': ['-day', '-count'],
+                'unique_together': {('day', 'query')},
+            },
+        ),
+    ]
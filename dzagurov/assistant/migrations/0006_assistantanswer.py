@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0005_query_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssistantAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('panel', 'Panel'), ('test', 'Test'), ('lab_service', 'Lab Service'), ('doc', 'Document'), ('news', 'News'), ('contact', 'Contact'), ('site_service', 'Site Service')], default='panel', max_length=32)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('intent', models.CharField(choices=[('preparation', 'Подготовка'), ('duration', 'Срок выполнения'), ('price', 'Стоимость'), ('biomaterial', 'Биоматериал')], max_length=16)),
+                ('title', models.CharField(max_length=512)),
+                ('code', models.CharField(blank=True, default='', max_length=64)),
+                ('url', models.CharField(blank=True, default='', max_length=1024)),
+                ('text', models.TextField()),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Готовый ответ ассистента',
+                'verbose_name_plural': 'Готовые ответы ассистента',
+                'unique_together': {('kind', 'object_id', 'intent')},
+            },
+        ),
+    ]
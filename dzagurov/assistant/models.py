@@ -38,6 +38,37 @@ class SearchIndex(models.Model):
         return f"{self.kind}:{self.object_id} {self.title[:80]}"
 
 
+class AssistantAnswer(models.Model):
+    """
+    Готовый ответ «объект × интент» (assistant.answers): подготовка, срок,
+    стоимость и биоматериал панели. ask отдаёт его по ключу, без поиска.
+    """
+    class Intent(models.TextChoices):
+        PREPARATION = "preparation", "Подготовка"
+        DURATION = "duration", "Срок выполнения"
+        PRICE = "price", "Стоимость"
+        BIOMATERIAL = "biomaterial", "Биоматериал"
+
+    kind = models.CharField(max_length=32, choices=SearchIndex.Kind.choices, default=SearchIndex.Kind.PANEL)
+    object_id = models.PositiveBigIntegerField()
+    intent = models.CharField(max_length=16, choices=Intent.choices)
+
+    title = models.CharField(max_length=512)
+    code = models.CharField(max_length=64, blank=True, default="")
+    url = models.CharField(max_length=1024, blank=True, default="")
+    text = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = [("kind", "object_id", "intent")]
+        verbose_name = "Готовый ответ ассистента"
+        verbose_name_plural = "Готовые ответы ассистента"
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.intent}"
+
+
 class AssistantEvent(models.Model):
     """
     Interaction log (analytics / future learning)
@@ -47,6 +78,8 @@ class AssistantEvent(models.Model):
 
     query = models.CharField(max_length=512)
     normalized = models.CharField(max_length=512, blank=True, default="")
+    # какой вариант прочтения сработал: original | layout | translit | code | answer
+    variant = models.CharField(max_length=16, blank=True, default="original")
     intents = models.JSONField(default=list, blank=True)
 
     results = models.JSONField(default=list, blank=True)  # ["panel:12", ...]
@@ -56,3 +89,41 @@ class AssistantEvent(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+
+
+class AssistantQueryDaily(models.Model):
+    """
+    Дневной агрегат по AssistantEvent (rollup_assistant_events): запрос × день.
+    """
+    day = models.DateField(db_index=True)
+    query = models.CharField(max_length=512)  # normalized (или сам запрос, если пусто)
+
+    count = models.PositiveIntegerField(default=0)
+    zero_results = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveIntegerField(default=0)
+    results_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [("day", "query")]
+        ordering = ["-day", "-count"]
+        verbose_name = "Запросы ассистента по дням"
+        verbose_name_plural = "Запросы ассистента по дням"
+
+    def __str__(self):
+        return f"{self.day} {self.query[:60]} ×{self.count}"
+
+    @property
+    def mean_results(self) -> float:
+        return round(self.results_sum / self.count, 2) if self.count else 0.0
+
+
+class RollupWatermark(models.Model):
+    """
+    До какого AssistantEvent.id агрегаты уже посчитаны.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
@@ -8,6 +8,7 @@ INTENTS = {
     "duration": ["срок", "сколько", "готов", "дней", "час"],
     "norms": ["норма", "референс", "значен", "повышен", "понижен"],
     "price": ["цена", "стоим", "руб", "сколько стоит"],
+    "biomaterial": ["биоматериал", "материал", "пробирк", "контейнер"],
     "contacts": ["адрес", "телефон", "график", "работаете"],
     "document": ["документ", "приказ", "pdf"],
     "news": ["новост", "акци"],
@@ -15,19 +16,143 @@ INTENTS = {
 
 TEST_KINDS = {"test", "tests", "lab_test", "analysis", "analyte"}
 
+CHIPS = (
+    ("preparation", "Подготовка"),
+    ("duration", "Срок выполнения"),
+    ("norms", "Нормы"),
+    ("price", "Стоимость"),
+    ("biomaterial", "Биоматериал"),
+    ("contacts", "Контакты"),
+)
+DEFAULT_CHIPS = ["Панели", "Тесты", "Прайс", "Документы", "Новости"]
+
+# фасеты выдачи: порядок чипов и подписи
+FACET_LABELS = {
+    "panel": "Панели",
+    "test": "Тесты",
+    "lab_service": "Услуги лаборатории",
+    "site_service": "Услуги",
+    "doc": "Документы",
+    "news": "Новости",
+    "contact": "Контакты",
+}
+
+_WORD_RE = re.compile(r"[\w\-]+", re.U)
+_SPACE_RE = re.compile(r"\s+")
+
 
 def normalize(q: str) -> str:
-    q = (q or "").lower().replace("ё", "е")
-    q = re.sub(r"[^\w\s\-]+", " ", q, flags=re.U)
-    return " ".join(t for t in q.split() if t not in STOP)[:256]
+    # слова — это \w и дефис, всё остальное разделитель: одно findall вместо sub + split
+    words = _WORD_RE.findall((q or "").lower().replace("ё", "е"))
+    return " ".join(t for t in words if t not in STOP)[:256]
+
+
+def _compile_intents(intents: dict) -> tuple[re.Pattern, dict]:
+    """
+    Все стемы INTENTS — в одну регулярку с lookahead: один проход по запросу
+    находит совпадения с каждой позиции, в том числе перекрывающиеся
+    ("подготов" и "готов"). В одной позиции срабатывает самый длинный стем,
+    поэтому каждому стему приписаны и интенты его префиксов
+    ("сколько стоит" -> price + duration, как у проверки `w in qn`).
+    """
+    owner: dict[str, set] = {}
+    for intent, words in intents.items():
+        for w in words:
+            owner.setdefault(w, set()).add(intent)
+    stems = sorted(owner, key=len, reverse=True)
+    implies = {
+        w: frozenset().union(*(owner[p] for p in stems if w.startswith(p)))
+        for w in stems
+    }
+    return re.compile("(?=(" + "|".join(map(re.escape, stems)) + "))"), implies
+
+
+_INTENT_RE, _INTENT_IMPLIES = _compile_intents(INTENTS)
+
+
+# --- раскладка / транслит -------------------------------------------------
+# "athhbnby" (ферритин на английской раскладке), "ferritin" (транслит)
+
+_EN_KEYS = "`qwertyuiop[]asdfghjkl;'zxcvbnm,./"
+_RU_KEYS = "ёйцукенгшщзхъфывапролджэячсмитьбю."
+LAYOUT_EN_RU = str.maketrans(_EN_KEYS, _RU_KEYS)
+LAYOUT_RU_EN = str.maketrans(_RU_KEYS[:-1], _EN_KEYS[:-1])
+
+TRANSLIT = {
+    "shch": "щ", "sch": "щ",
+    "yo": "е", "zh": "ж", "kh": "х", "ts": "ц", "ch": "ч", "sh": "ш",
+    "yu": "ю", "ya": "я", "ye": "е", "ph": "ф", "th": "т", "yy": "ый", "iy": "ий",
+    "a": "а", "b": "б", "c": "к", "d": "д", "e": "е", "f": "ф", "g": "г", "h": "х",
+    "i": "и", "j": "й", "k": "к", "l": "л", "m": "м", "n": "н", "o": "о", "p": "п",
+    "q": "к", "r": "р", "s": "с", "t": "т", "u": "у", "v": "в", "w": "в", "x": "кс",
+    "y": "ы", "z": "з",
+}
+_TRANSLIT_RE = re.compile("|".join(sorted(TRANSLIT, key=len, reverse=True)))
+_LATIN_RE = re.compile(r"[a-z]")
+_CYR_RE = re.compile(r"[а-яё]")
+
+
+def translit_to_ru(text: str) -> str:
+    # слова с цифрами — скорее коды (hba1c, 25oh), их не трогаем
+    return " ".join(
+        w if any(c.isdigit() for c in w) else _TRANSLIT_RE.sub(lambda m: TRANSLIT[m.group(0)], w)
+        for w in text.split()
+    )
+
+
+def query_variants(q: str):
+    """(имя, нормализованный запрос) для альтернативных прочтений q."""
+    low = (q or "").lower()
+    if _LATIN_RE.search(low):
+        yield "layout", normalize(low.translate(LAYOUT_EN_RU))
+        yield "translit", normalize(translit_to_ru(low))
+    if _CYR_RE.search(low):
+        yield "layout", normalize(low.translate(LAYOUT_RU_EN))
+
+
+def _known_count(qn: str, known) -> int:
+    # однобуквенные "r", "d" есть в словаре почти всегда — они ничего не доказывают
+    return sum(1 for t in qn.split() if len(t) > 2 and not t.isdigit() and known(t))
+
+
+def normalize_variant(q: str, known=None) -> tuple[str, str]:
+    """
+    normalize() + исправление раскладки/транслита.
+    known(token) -> bool — проверка по словарю индекса. Варианты пробуем,
+    только если в исходном запросе нет ни одного известного слова; берём
+    тот, где известных слов больше. Возвращает (qn, "original"|"layout"|"translit").
+    """
+    qn = normalize(q)
+    if known is None or not qn or _known_count(qn, known):
+        return qn, "original"
+    best = (0, qn, "original")
+    for name, cand in query_variants(q):
+        n = _known_count(cand, known)
+        if n > best[0]:
+            best = (n, cand, name)
+    return best[1], best[2]
 
 
 def detect_intents(qn: str):
-    found = []
-    for k, words in INTENTS.items():
-        if any(w in qn for w in words):
-            found.append(k)
-    return found or ["search"]
+    hit = set()
+    for m in _INTENT_RE.finditer(qn or ""):
+        hit |= _INTENT_IMPLIES[m.group(1)]
+    return [k for k in INTENTS if k in hit] or ["search"]
+
+
+def query_tokens(qn: str) -> tuple[str, ...]:
+    """Токены запроса для сниппетов и подсказок — один раз на ответ, а не на строку."""
+    return tuple(t for t in (qn or "").split() if len(t) > 2)[:6]
+
+
+def first_token_pos(low: str, tokens) -> int:
+    """Позиция первого вхождения любого токена в low (или 0)."""
+    pos = -1
+    for t in tokens:
+        p = low.find(t)
+        if p != -1 and (pos == -1 or p < pos):
+            pos = p
+    return max(pos, 0)
 
 
 def cut(text: str, n: int) -> str:
@@ -39,24 +164,18 @@ def cut(text: str, n: int) -> str:
     return text[:n].rstrip() + "…"
 
 
-def snippet(text: str, qn: str, max_len=220):
+def snippet(text: str, qn: str, max_len=220, tokens=None):
     """
     Делает сниппет вокруг первого найденного токена из запроса.
     Если токенов нет или text пустой — возвращает первые max_len символов.
+    tokens — готовый query_tokens(qn) (build_answer считает их один раз).
     """
     if not text:
         return ""
 
-    tokens = [t for t in qn.split() if len(t) > 2][:6]
-    low = text.lower()
-
-    positions = []
-    for t in tokens:
-        p = low.find(t)
-        if p != -1:
-            positions.append(p)
-
-    pos = min(positions) if positions else 0
+    if tokens is None:
+        tokens = query_tokens(qn)
+    pos = first_token_pos(text.lower(), tokens) if tokens else 0
 
     start = max(0, pos - 70)
     end = min(len(text), pos + max_len)
@@ -95,6 +214,11 @@ def safe_meta(v):
     return {}
 
 
+_CODE_LABEL_RE = re.compile(r"\bкод[:\s]*([A-Za-z0-9][A-Za-z0-9\-\._]{1,20})\b", re.I)
+_CODE_PAREN_RE = re.compile(r"\(([A-Za-z0-9][A-Za-z0-9\-\._]{1,20})\)")
+_CODE_UPPER_RE = re.compile(r"\b([A-Z][A-Z0-9]{1,9})\b")
+
+
 def extract_code_from_text(text: str) -> str:
     """
     Пытаемся выцепить код анализа из title/search_text.
@@ -103,24 +227,24 @@ def extract_code_from_text(text: str) -> str:
         return ""
 
     # "Код: FERR"
-    m = re.search(r"\bкод[:\s]*([A-Za-z0-9][A-Za-z0-9\-\._]{1,20})\b", text, flags=re.I)
+    m = _CODE_LABEL_RE.search(text)
     if m:
         return m.group(1).upper()
 
     # "(FERR)"
-    m = re.search(r"\(([A-Za-z0-9][A-Za-z0-9\-\._]{1,20})\)", text)
+    m = _CODE_PAREN_RE.search(text)
     if m:
         return m.group(1).upper()
 
     # короткий UPPER токен (например CRP, FERR, TSH, HbA1c, 25OHD)
-    m = re.search(r"\b([A-Z][A-Z0-9]{1,9})\b", text)
+    m = _CODE_UPPER_RE.search(text)
     if m:
         return m.group(1).upper()
 
     return ""
 
 
-def make_test_hint(r: dict, qn: str) -> str:
+def make_test_hint(r: dict, qn: str, tokens=None) -> str:
     """
     Короткий "смысл" для карточки (1 строка), без простыней.
     Приоритет:
@@ -136,30 +260,36 @@ def make_test_hint(r: dict, qn: str) -> str:
     if not st:
         return ""
 
-    tokens = [t for t in qn.split() if len(t) > 2][:6]
-    low = st.lower()
-    pos = min([low.find(t) for t in tokens if low.find(t) != -1] or [0])
+    if tokens is None:
+        tokens = query_tokens(qn)
+    pos = first_token_pos(st.lower(), tokens) if tokens else 0
 
     start = max(0, pos - 30)
     end = min(len(st), start + 120)
-    chunk = st[start:end].strip()
-    chunk = re.sub(r"\s+", " ", chunk)
+    chunk = _SPACE_RE.sub(" ", st[start:end].strip())
 
     return cut(chunk, 80)
 
 
-def build_answer(query: str, rows: list):
-    qn = normalize(query)
+def facet_items(facets: dict) -> list[dict]:
+    """{kind: count} -> [{"kind", "label", "count"}] в порядке FACET_LABELS, без нулей."""
+    order = list(FACET_LABELS)
+    kinds = sorted((k for k, n in facets.items() if n), key=lambda k: (order.index(k) if k in order else len(order), k))
+    return [{"kind": k, "label": FACET_LABELS.get(k, k), "count": int(facets[k])} for k in kinds]
+
+
+def build_answer(query: str, rows: list, qn: str | None = None, facets: dict | None = None):
+    qn = qn or normalize(query)
     intents = detect_intents(qn)
+    tokens = query_tokens(qn)
+    facet_list = facet_items(facets or {})
 
-    chips = []
-    if "preparation" in intents: chips.append("Подготовка")
-    if "duration" in intents: chips.append("Срок выполнения")
-    if "norms" in intents: chips.append("Нормы")
-    if "price" in intents: chips.append("Стоимость")
-    if "contacts" in intents: chips.append("Контакты")
-    if not chips:
-        chips = ["Панели", "Тесты", "Прайс", "Документы", "Новости"]
+    # без интента чипы — разделы, где реально что-то нашлось
+    chips = (
+        [label for intent, label in CHIPS if intent in intents]
+        or [f["label"] for f in facet_list]
+        or list(DEFAULT_CHIPS)
+    )
 
     results = []
     for r in rows:
@@ -171,7 +301,7 @@ def build_answer(query: str, rows: list):
         # ✅ Анализы: отдаём структуру под красивую карточку
         if is_test_kind(k):
             code = meta.get("code") or extract_code_from_text(title) or extract_code_from_text(st)
-            hint = make_test_hint(r, qn)
+            hint = make_test_hint(r, qn, tokens=tokens)
 
             results.append({
                 "id": r["id"],
@@ -193,7 +323,7 @@ def build_answer(query: str, rows: list):
             "kind": k,
             "title": title,
             "url": r["url"],
-            "snippet": snippet(st, qn),
+            "snippet": snippet(st, qn, tokens=tokens),
             "score": r["score"],
             "meta": meta,
         })
@@ -203,6 +333,7 @@ def build_answer(query: str, rows: list):
         "query": query,
         "normalized": qn,
         "intents": intents,
+        "facets": facet_list,
         "answer": {
             "title": "Навигатор",
             "blocks": [
@@ -212,3 +343,24 @@ def build_answer(query: str, rows: list):
         },
         "results": results,
     }
+
+
+def build_structured_answer(query: str, row: dict, facts: list, qn: str | None = None):
+    """
+    Ответ из готовых фактов (answers.lookup): блоки "fact" по интентам
+    и карточка объекта. Формат тот же, что у build_answer.
+    """
+    data = build_answer(query, [row], qn=qn, facets={row["kind"]: 1})
+    shown = {f["intent"] for f in facts}
+    data["mode"] = "structured"
+    data["intents"] = [f["intent"] for f in facts]
+    data["answer"] = {
+        "title": row.get("title") or "Навигатор",
+        "blocks": [
+            *({"type": "fact", "intent": f["intent"], "label": f["label"], "text": f["text"], "data": f["data"]}
+              for f in facts),
+            # остальные вопросы про этот же анализ
+            {"type": "chips", "items": [label for intent, label in CHIPS if intent not in shown and intent != "contacts"]},
+        ],
+    }
+    return data
@@ -0,0 +1,167 @@
+"""
+Текст из PDF для индекса документов (main.Documents.pdf_file).
+
+  - разбираем локально через pypdf (опциональная зависимость: без неё
+    документы индексируются по заголовку и тексту страницы);
+  - кеш на диске по sha1 содержимого: ASSISTANT_DATA_DIR/pdf_text/<sha1>-<max>.txt,
+    неизменившийся файл второй раз не разбирается;
+  - непрокешированные файлы разбираем в spawn-пуле (ASSISTANT_PDF_WORKERS);
+  - берём первые ASSISTANT_PDF_MAX_PAGES страниц и не больше
+    ASSISTANT_PDF_MAX_CHARS символов, обрезая по границе слова.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing as mp
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+
+try:  # pypdf — опциональная зависимость
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover
+    PdfReader = None
+
+log = logging.getLogger(__name__)
+
+WS_RE = re.compile(r"\s+")
+HASH_CHUNK = 1 << 20
+
+
+def max_chars() -> int:
+    return int(getattr(settings, "ASSISTANT_PDF_MAX_CHARS", 20000))
+
+
+def max_pages() -> int:
+    return int(getattr(settings, "ASSISTANT_PDF_MAX_PAGES", 50))
+
+
+def cache_dir() -> Path:
+    base = getattr(settings, "ASSISTANT_DATA_DIR", None) or Path(settings.BASE_DIR) / "data" / "assistant"
+    return Path(base) / "pdf_text"
+
+
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def clip(text: str, limit: int) -> str:
+    """Схлопнуть пробелы и обрезать до limit символов по границе слова."""
+    text = WS_RE.sub(" ", text or "").strip()
+    if len(text) <= limit:
+        return text
+    cut_at = text.rfind(" ", 0, limit)
+    return text[:cut_at if cut_at > limit // 2 else limit]
+
+
+def extract_text(path: str, limit: int, pages: int) -> str:
+    """
+    Текст первых pages страниц, не больше limit символов. Выполняется и в
+    воркерах пула, поэтому не трогает settings и БД.
+    """
+    reader = PdfReader(path)
+    if reader.is_encrypted:
+        try:
+            reader.decrypt("")
+        except Exception:
+            return ""
+    parts, size = [], 0
+    for page in reader.pages[:pages]:
+        t = page.extract_text() or ""
+        parts.append(t)
+        size += len(t)
+        if size >= limit:
+            break
+    return clip(" ".join(parts), limit)
+
+
+def _extract_worker(args) -> tuple[str, str, str]:
+    # модульная функция — её импортирует spawn-воркер; ошибку одного файла не роняем на весь пул
+    path, limit, pages = args
+    try:
+        return path, extract_text(path, limit, pages), ""
+    except Exception as e:
+        return path, "", f"{type(e).__name__}: {e}"
+
+
+def _cache_file(sha1: str, limit: int) -> Path:
+    return cache_dir() / f"{sha1}-{limit}.txt"
+
+
+def _save(path: Path, text: str) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning("pdf_text: cannot save %s: %s", path, e)
+
+
+def _workers(n_jobs: int) -> int:
+    if mp.current_process().daemon:
+        # уже внутри воркера (reindex_search --workers): дочерние процессы запрещены
+        return 1
+    n = int(getattr(settings, "ASSISTANT_PDF_WORKERS", 0) or os.cpu_count() or 1)
+    return max(1, min(n, n_jobs))
+
+
+def extract_many(paths) -> dict[str, str]:
+    """
+    path -> текст для списка PDF. Кеш по sha1 файла; остальное — в пуле
+    процессов (или последовательно, если файл один / воркер один).
+    Нечитаемые файлы дают "" (и тоже кешируются, чтобы не разбирать их заново).
+    """
+    paths = sorted({str(p) for p in paths if p})
+    if not paths:
+        return {}
+    if PdfReader is None:
+        log.info("pdf_text: pypdf not installed, PDF text is not indexed")
+        return {p: "" for p in paths}
+
+    limit, pages = max_chars(), max_pages()
+    out: dict[str, str] = {}
+    todo: dict[str, Path] = {}
+    for p in paths:
+        try:
+            cached = _cache_file(file_sha1(p), limit)
+        except OSError as e:
+            log.warning("pdf_text: cannot read %s: %s", p, e)
+            out[p] = ""
+            continue
+        try:
+            out[p] = cached.read_text(encoding="utf-8")
+        except OSError:
+            todo[p] = cached
+
+    if todo:
+        jobs = [(p, limit, pages) for p in todo]
+        workers = _workers(len(jobs))
+        results = None
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")) as pool:
+                    results = list(pool.map(_extract_worker, jobs, chunksize=1))
+            except (BrokenProcessPool, OSError) as e:
+                # воркер упал (например, по памяти на кривом PDF) — доделаем в этом процессе
+                log.warning("pdf_text: pool failed (%s), parsing sequentially", e)
+        if results is None:
+            workers = 1
+            results = [_extract_worker(j) for j in jobs]
+
+        for p, text, err in results:
+            if err:
+                log.warning("pdf_text: %s: %s", p, err)
+            out[p] = text
+            _save(todo[p], text)
+        log.info("pdf_text: parsed %s PDFs (%s workers), %s from cache", len(todo), workers, len(paths) - len(todo))
+    return out
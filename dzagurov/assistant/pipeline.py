@@ -0,0 +1,67 @@
+"""
+Путь запроса ask от текста до строк выдачи — без HTTP, чтобы его же
+гоняли бенчмарки (bench_assistant_search):
+
+  интент + точный код/название панели ("подготовка к ферритину") ->
+  готовый ответ из answers, без поиска;
+  явный код ("03.001", "код: FERR") -> точные совпадения из codes;
+  иначе normalize + раскладка/транслит -> опечатки -> поиск с квотами
+  и фасетами (через кеш) -> rerank; совпадения по коду без цифр ("tsh")
+  ставятся наверх.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from . import answers, metrics, rerank
+from .codes import exact_code_hits, is_explicit_code
+from .orchestrator import normalize, normalize_variant
+from .result_cache import cached_faceted_search
+from .retrieval import hydrate
+from .spelling import correct_query, vocabulary
+
+
+@dataclass
+class Retrieval:
+    rows: list
+    facets: dict
+    qn: str                 # нормализованный запрос (после раскладки/транслита)
+    qc: str                 # то, что реально искали (после исправления опечаток)
+    variant: str            # original | layout | translit | code | answer
+    fixes: list = field(default_factory=list)
+    answer: answers.Answer | None = None
+
+
+def retrieve(query: str, limit: int = 8, kinds=None, quotas=None, backend: str | None = None) -> Retrieval:
+    # готовые ответы — про панели; фильтр без панелей их не показывает
+    hit = answers.lookup(query) if not kinds or "panel" in kinds else None
+    if hit is not None:
+        qn = normalize(query)
+        return Retrieval([hit.row()], {hit.kind: 1}, qn, qn, "answer", answer=hit)
+
+    code_rows = exact_code_hits(query, limit=limit)
+    if kinds:
+        code_rows = [r for r in code_rows if r["kind"] in kinds]
+    if code_rows and is_explicit_code(query):
+        # явный код ("03.001", "код: FERR") — сразу точные совпадения, без полнотекста
+        qn = normalize(query)
+        metrics.incr("ask.exact_code")
+        return Retrieval(code_rows, dict(Counter(r["kind"] for r in code_rows)), qn, qn, "code")
+
+    vocab = vocabulary() if getattr(settings, "ASSISTANT_TYPO_CORRECTION", True) else None
+    qn, variant = normalize_variant(query, known=vocab.known if vocab is not None else None)
+    qc, fixes = correct_query(qn)
+    # под rerank берём у бэкенда больше кандидатов (только id и score), показываем limit
+    candidates = rerank.candidate_limit(qc, limit)
+    rows, facets = cached_faceted_search(
+        qc, limit=candidates, kinds=kinds, quotas=quotas, backend=backend, ids_only=candidates > limit,
+    )
+    rows = hydrate(rerank.rerank(qc, rows, limit))
+    if code_rows:
+        # слово, совпавшее с кодом или алиасом ("tsh"), — наверх обычной выдачи
+        seen = {r["id"] for r in code_rows}
+        rows = (code_rows + [r for r in rows if r["id"] not in seen])[:limit]
+    return Retrieval(rows, facets, qn, qc, variant, fixes)
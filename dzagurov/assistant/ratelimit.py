@@ -0,0 +1,184 @@
+"""
+Ограничение частоты /assistant/ask/ по сессии и по IP.
+
+Окно скользящее (приближённо): счётчик текущего фиксированного окна плюс
+доля предыдущего — prev * (1 - прошло / window) + cur. На клиента два
+ключа, без списка отметок времени. Отказ (429) не засчитывается: клиент,
+повторяющий запрос, выходит из-под лимита, как только окно сдвинется.
+
+Счётчики:
+  - общий Django-кеш (ASSISTANT_RATELIMIT_CACHE_ALIAS, например redis):
+    cache.add + cache.incr атомарны, лимит общий на все воркеры;
+  - без alias или при сбое кеша — словарь в памяти процесса (лимит на воркер;
+    manage.py check --deploy предупреждает, см. checks.py).
+
+Сначала IP — без БД и без request.user. Затем сессия: ключ из cookie
+считаем, только если сессия есть в хранилище (выдуманный ключ на каждый
+запрос давал бы свежий счётчик); загрузка та же, что ask делает дальше.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+PRUNE_EVERY = 1000
+
+
+class LocalCounters:
+    """Счётчики с истечением в памяти процесса — запасной вариант для кеша."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def incr(self, key: str, ttl: float) -> int:
+        now = time.monotonic()
+        with self._lock:
+            n, expires = self._data.get(key, (0, 0.0))
+            if expires <= now:
+                n, expires = 0, now + ttl
+            self._data[key] = (n + 1, expires)
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._data = {k: v for k, v in self._data.items() if v[1] > now}
+            return n + 1
+
+    def decr(self, key: str) -> None:
+        with self._lock:
+            n, expires = self._data.get(key, (0, 0.0))
+            if n > 0 and expires > time.monotonic():
+                self._data[key] = (n - 1, expires)
+
+    def get(self, key: str) -> int:
+        n, expires = self._data.get(key, (0, 0.0))
+        return n if expires > time.monotonic() else 0
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CacheCounters:
+    """Те же операции поверх Django-кеша."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def incr(self, key: str, ttl: float) -> int:
+        self.cache.add(key, 0, ttl)
+        try:
+            return self.cache.incr(key)
+        except ValueError:  # ключ истёк между add и incr
+            self.cache.set(key, 1, ttl)
+            return 1
+
+    def decr(self, key: str) -> None:
+        try:
+            self.cache.decr(key)
+        except ValueError:  # окно уже истекло
+            pass
+
+    def get(self, key: str) -> int:
+        return int(self.cache.get(key) or 0)
+
+
+_local = LocalCounters()
+
+
+def _alias() -> str:
+    return getattr(settings, "ASSISTANT_RATELIMIT_CACHE_ALIAS", "")
+
+
+def _count(op: str, key: str, *args):
+    """Операция со счётчиком в общем кеше, при сбое кеша — в памяти процесса."""
+    alias = _alias()
+    if alias:
+        try:
+            return getattr(CacheCounters(caches[alias]), op)(key, *args)
+        except Exception:
+            # кеш лёг — не роняем ask, считаем в процессе
+            metrics.incr("ratelimit.cache_error")
+    return getattr(_local, op)(key, *args)
+
+
+def _base(scope: str, ident: str) -> str:
+    return f"assistant:rl:{scope}:{hashlib.sha1(ident.encode('utf-8')).hexdigest()[:20]}"
+
+
+def hit(scope: str, ident: str, limit: int, window: int, now: float | None = None) -> int:
+    """
+    Засчитать запрос клиента ident. 0 — можно; иначе через сколько секунд
+    повторить (для Retry-After) — такой запрос не засчитывается.
+    """
+    now = time.time() if now is None else now
+    idx = int(now // window)
+    base = _base(scope, ident)
+    cur = _count("incr", f"{base}:{idx}", 2 * window)
+    prev = _count("get", f"{base}:{idx - 1}")
+
+    elapsed = now - idx * window
+    if prev * (1.0 - elapsed / window) + cur <= limit:
+        return 0
+    _count("decr", f"{base}:{idx}")
+    if cur < limit and prev:
+        # ждём, пока доля предыдущего окна не опустится до свободного места
+        wait = window * (1.0 - (limit - cur) / prev) - elapsed
+    else:
+        wait = window - elapsed
+    return max(1, math.ceil(wait))
+
+
+def unhit(scope: str, ident: str, window: int, now: float | None = None) -> None:
+    """Отменить засчитанный hit() (запрос всё же отклонён по другому правилу)."""
+    now = time.time() if now is None else now
+    _count("decr", f"{_base(scope, ident)}:{int(now // window)}")
+
+
+def client_ip(request) -> str:
+    header = getattr(settings, "ASSISTANT_RATELIMIT_IP_HEADER", "")
+    if header and request.META.get(header):
+        # "client, proxy1, proxy2" — первый адрес
+        return request.META[header].split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _rule(name: str, default: tuple[int, int]) -> tuple[int, int]:
+    limit, window = getattr(settings, name, default)
+    return int(limit), max(1, int(window))
+
+
+def session_key(request) -> str:
+    """Ключ сессии, если она есть в хранилище, иначе ""."""
+    session = request.session
+    if not session.session_key:
+        return ""
+    # загрузка сессии; неизвестный или истёкший ключ backend сбрасывает в None
+    session.keys()
+    return session.session_key or ""
+
+
+def check(request) -> int:
+    """0 — пропускаем; иначе Retry-After в секундах. Сессия и IP считаются независимо."""
+    if not getattr(settings, "ASSISTANT_RATELIMIT", True):
+        return 0
+    now = time.time()
+    ip = client_ip(request)
+    ip_limit, ip_window = _rule("ASSISTANT_RATELIMIT_IP", (120, 60))
+    retry = hit("ip", ip, ip_limit, ip_window, now) if ip else 0
+    if not retry:
+        key = session_key(request)
+        if key:
+            retry = hit("s", key, *_rule("ASSISTANT_RATELIMIT_SESSION", (30, 60)), now)
+            if retry and ip:
+                unhit("ip", ip, ip_window, now)
+    if retry:
+        metrics.incr("ratelimit.blocked")
+    return retry
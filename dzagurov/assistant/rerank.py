@@ -0,0 +1,330 @@
+"""
+Второй этап ранжирования: TF-IDF (слова + символьные триграммы) поверх
+кандидатов основного бэкенда.
+
+Полнотекст находит документ по совпавшим словам, но вопросы вроде
+"что сдать при выпадении волос" он ранжирует плохо: слова в другой форме,
+половина запроса — служебная. Косинус по триграммам ("выпаден" ~ "выпадение")
+и стемам уточняет порядок первых ASSISTANT_RERANK_CANDIDATES строк.
+
+Матрица строится офлайн (reindex_search / build_assistant_rerank) в
+ASSISTANT_DATA_DIR/tfidf.bin: CSR (indptr, indices, data) с L2-нормированными
+строками, idf, словарь признаков и ключи документов. Файл открывается через
+mmap — все воркеры делят одни страницы в page cache. С numpy скоринг идёт
+одним векторным проходом по np.frombuffer-видам, без него — bisect по тем же
+буферам (memoryview.cast).
+
+Итог: (1 - ASSISTANT_RERANK_WEIGHT) * score / max(score) + WEIGHT * cosine.
+Если не уложились в ASSISTANT_RERANK_BUDGET_MS — отдаём порядок бэкенда.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import mmap
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+from .index_version import PerProcess, content_version
+from .models import SearchIndex
+from .tokens import raw_tokens, stem
+
+try:  # numpy — опциональная зависимость
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"ATFIDF1\n"
+ALIGN = 8
+TITLE_WEIGHT = 2
+# (имя, код array, dtype numpy) — порядок блобов в файле
+BLOBS = (("idf", "f", "<f4"), ("indptr", "I", "<u4"), ("indices", "I", "<u4"), ("data", "f", "<f4"))
+
+
+def features(text: str) -> Counter:
+    """Признаки текста: стемы слов ("w " + стем) и триграммы слов с границами ("c " + триграмма)."""
+    out: Counter = Counter()
+    for tok in raw_tokens(text):
+        out["w " + stem(tok)] += 1
+        if len(tok) > 3 and tok.isalpha():
+            s = f" {tok} "
+            out.update("c " + s[i:i + 3] for i in range(len(s) - 2))
+    return out
+
+
+def _tf(n: int) -> float:
+    return 1.0 + math.log(n)
+
+
+class TfidfMatrix:
+    def __init__(self, keys: list[str], terms: list[str], idf, indptr, indices, data,
+                 version: str = "", buf=None):
+        self.keys = keys
+        self.terms = terms
+        self.idf = idf
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.version = version
+        self._buf = buf  # mmap держим, пока живы виды на него
+
+        self.row_of = {k: i for i, k in enumerate(keys)}
+        self.term_id = {t: i for i, t in enumerate(terms)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ------------------------------------------------------------------ build
+
+    @classmethod
+    def from_rows(cls, rows, version: str = "") -> "TfidfMatrix":
+        """rows: (ключ "kind:id", title, search_text)."""
+        keys: list[str] = []
+        term_id: dict[str, int] = {}
+        docs: list[list[tuple[int, int]]] = []
+        df = array("I")
+
+        for key, title, text in rows:
+            f = features(text or "")
+            for _ in range(TITLE_WEIGHT):
+                f.update(features(title or ""))
+            doc = []
+            for term, n in f.items():
+                tid = term_id.get(term)
+                if tid is None:
+                    tid = term_id[term] = len(term_id)
+                    df.append(0)
+                df[tid] += 1
+                doc.append((tid, n))
+            doc.sort()
+            keys.append(key)
+            docs.append(doc)
+
+        n_docs = len(keys)
+        idf = array("f", (math.log((1 + n_docs) / (1 + d)) + 1.0 for d in df))
+        indptr, indices, data = array("I", [0]), array("I"), array("f")
+        for doc in docs:
+            weights = [_tf(n) * idf[tid] for tid, n in doc]
+            norm = math.sqrt(sum(w * w for w in weights)) or 1.0
+            for (tid, _n), w in zip(doc, weights):
+                indices.append(tid)
+                data.append(w / norm)
+            indptr.append(len(indices))
+
+        terms = [""] * len(term_id)
+        for t, i in term_id.items():
+            terms[i] = t
+        return cls(keys, terms, idf, indptr, indices, data, version)
+
+    @classmethod
+    def from_index(cls) -> "TfidfMatrix":
+        version = content_version()
+        rows = SearchIndex.objects.order_by("id").values_list("kind", "object_id", "title", "search_text")
+        return cls.from_rows(
+            ((f"{kind}:{obj_id}", title, text) for kind, obj_id, title, text in rows.iterator(chunk_size=2000)),
+            version,
+        )
+
+    # -------------------------------------------------------------- storage
+
+    def save(self, path: Path) -> None:
+        """MAGIC, JSON-заголовок строкой, затем блобы, выровненные по 8 байт (для mmap-видов)."""
+        text_blobs = ["\n".join(self.keys).encode("utf-8"), "\n".join(self.terms).encode("utf-8")]
+        num_blobs = [getattr(self, name).tobytes() for name, _c, _d in BLOBS]
+        sizes = [len(b) for b in text_blobs + num_blobs]
+
+        header = json.dumps({"version": self.version, "sizes": sizes}).encode("utf-8") + b"\n"
+        start = len(MAGIC) + len(header)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(header)
+            pos = start
+            for b in text_blobs + num_blobs:
+                pad = -pos % ALIGN
+                f.write(b"\0" * pad + b)
+                pos += pad + len(b)
+        os.replace(tmp, path)  # читатели видят либо старый, либо новый файл целиком
+
+    @classmethod
+    def load(cls, path: Path) -> "TfidfMatrix":
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buf.readline() != MAGIC:
+            raise ValueError(f"{path}: not a tfidf matrix")
+        header = json.loads(buf.readline())
+
+        spans, pos = [], buf.tell()
+        for n in header["sizes"]:
+            pos += -pos % ALIGN
+            spans.append((pos, n))
+            pos += n
+        (k_off, k_len), (t_off, t_len), *num = spans
+
+        view = memoryview(buf)
+        arrays = []
+        for (name, code, dtype), (off, n) in zip(BLOBS, num):
+            if np is not None:
+                arrays.append(np.frombuffer(buf, dtype=dtype, count=n // 4, offset=off))
+            else:
+                arrays.append(view[off:off + n].cast(code))
+        keys = buf[k_off:k_off + k_len].decode("utf-8")
+        terms = buf[t_off:t_off + t_len].decode("utf-8")
+        return cls(
+            keys.split("\n") if keys else [],
+            terms.split("\n") if terms else [],
+            *arrays,
+            version=header.get("version", ""),
+            buf=buf,
+        )
+
+    # ---------------------------------------------------------------- query
+
+    def query_vector(self, qn: str) -> dict[int, float]:
+        q = {}
+        for term, n in features(qn).items():
+            tid = self.term_id.get(term)
+            if tid is not None:
+                q[tid] = _tf(n) * float(self.idf[tid])
+        norm = math.sqrt(sum(w * w for w in q.values())) or 1.0
+        return {tid: w / norm for tid, w in q.items()}
+
+    def _cosines_numpy(self, q: dict, rows: list[int]):
+        qdense = np.zeros(len(self.terms), dtype=np.float32)
+        qdense[list(q)] = list(q.values())
+        r = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[r].astype(np.int64)
+        lens = self.indptr[r + 1].astype(np.int64) - starts
+        # позиции всех ненулевых элементов кандидатов подряд — один gather и один reduceat
+        offs = np.cumsum(lens) - lens
+        pos = np.arange(int(lens.sum()), dtype=np.int64) - np.repeat(offs, lens) + np.repeat(starts, lens)
+        prod = self.data[pos] * qdense[self.indices[pos]]
+        out = np.zeros(len(rows), dtype=np.float32)
+        nz = lens > 0
+        if nz.any():
+            out[nz] = np.add.reduceat(prod, offs[nz])
+        return out.tolist()
+
+    def _cosines_python(self, q: dict, rows: list[int], deadline: float):
+        indptr, indices, data = self.indptr, self.indices, self.data
+        qitems = sorted(q.items())
+        out = []
+        for i, r in enumerate(rows):
+            lo, hi = indptr[r], indptr[r + 1]
+            s = 0.0
+            for tid, w in qitems:
+                j = bisect_left(indices, tid, lo, hi)
+                if j < hi and indices[j] == tid:
+                    s += w * data[j]
+                    lo = j + 1
+            out.append(s)
+            if i % 16 == 15 and time.perf_counter() > deadline:
+                return None
+        return out
+
+    def cosines(self, qn: str, keys: list[str], deadline: float) -> list[float | None] | None:
+        """Косинус запроса с каждым документом; None — документа нет в матрице (добавлен после сборки)."""
+        q = self.query_vector(qn)
+        if not q:
+            return None
+        found = [(i, self.row_of[k]) for i, k in enumerate(keys) if k in self.row_of]
+        if not found:
+            return None
+        rows = [r for _i, r in found]
+        sims = self._cosines_numpy(q, rows) if np is not None else self._cosines_python(q, rows, deadline)
+        if sims is None:
+            return None
+        out: list[float | None] = [None] * len(keys)
+        for (i, _r), s in zip(found, sims):
+            out[i] = s
+        return out
+
+
+# ---------------------------------------------------------------------------
+# per-process
+
+def matrix_path() -> Path:
+    base = getattr(settings, "ASSISTANT_DATA_DIR", None) or Path(settings.BASE_DIR) / "data" / "assistant"
+    return Path(base) / "tfidf.bin"
+
+
+def rebuild() -> TfidfMatrix:
+    """Собрать матрицу из SearchIndex и сохранить на диск (зовёт reindex_search)."""
+    m = TfidfMatrix.from_index()
+    try:
+        m.save(matrix_path())
+    except OSError as e:
+        log.warning("rerank: cannot save %s: %s", matrix_path(), e)
+    return m
+
+
+def _load() -> TfidfMatrix | None:
+    path = matrix_path()
+    try:
+        m = TfidfMatrix.load(path)
+    except (OSError, ValueError) as e:
+        # строить в запросе дорого — ждём reindex_search / build_assistant_rerank
+        log.info("rerank: %s unusable (%s), rerank is off", path, e)
+        return None
+    if m.version != content_version():
+        # точечные правки после сборки: их строки получат средний косинус, остальное годно
+        log.info("rerank: %s is older than the index, using it anyway", path)
+    return m
+
+
+_shared = PerProcess(_load)
+
+
+def _enabled() -> bool:
+    return bool(getattr(settings, "ASSISTANT_RERANK", True))
+
+
+def candidate_limit(qn: str, limit: int) -> int:
+    """Сколько строк просить у бэкенда: под rerank — больше, чем покажем."""
+    if not _enabled() or len(qn.split()) < int(getattr(settings, "ASSISTANT_RERANK_MIN_TOKENS", 2)):
+        return limit
+    return max(limit, int(getattr(settings, "ASSISTANT_RERANK_CANDIDATES", 100)))
+
+
+def rerank(qn: str, rows: list[dict], limit: int) -> list[dict]:
+    if len(rows) <= 1 or candidate_limit(qn, limit) == limit:
+        return rows[:limit]
+    m = _shared.get()
+    if m is None:
+        return rows[:limit]
+
+    t0 = time.perf_counter()
+    deadline = t0 + float(getattr(settings, "ASSISTANT_RERANK_BUDGET_MS", 15)) / 1000.0
+    sims = m.cosines(qn, [r["id"] for r in rows], deadline)
+    if sims is None:
+        metrics.incr("rerank.skipped")
+        return rows[:limit]
+
+    known = [s for s in sims if s is not None]
+    fill = sum(known) / len(known)
+    top = max(float(r["score"]) for r in rows) or 1.0
+    alpha = float(getattr(settings, "ASSISTANT_RERANK_WEIGHT", 0.5))
+
+    scored = []
+    for r, s in zip(rows, sims):
+        final = (1.0 - alpha) * float(r["score"]) / top + alpha * (fill if s is None else s)
+        scored.append({**r, "score": final})
+    scored.sort(key=lambda r: -r["score"])
+
+    if time.perf_counter() > deadline:
+        # бюджет — это ограничение, а не только счётчик: порядок бэкенда
+        metrics.incr("rerank.over_budget")
+        return rows[:limit]
+    metrics.incr("rerank.applied")
+    return scored[:limit]
@@ -0,0 +1,125 @@
+"""
+Кеш результатов поиска для /assistant/ask/.
+
+Ключ: (нормализованный запрос, limit, kinds, бэкенд, версия индекса и boost) —
+после переиндексации или пересчёта boost версия другая, и старые результаты
+просто перестают находиться (вытесняются LRU / истекают по TTL).
+
+Два уровня:
+  1) LRU в памяти процесса (ASSISTANT_RESULT_CACHE_SIZE записей);
+  2) опционально — общий Django-кеш (ASSISTANT_RESULT_CACHE_ALIAS,
+     например redis), чтобы воркеры делили прогретые ответы.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .index_version import current_boost_version, current_version
+from .retrieval import get_backend
+
+
+class LruCache:
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local = LruCache(int(getattr(settings, "ASSISTANT_RESULT_CACHE_SIZE", 512)))
+
+
+def _shared():
+    alias = getattr(settings, "ASSISTANT_RESULT_CACHE_ALIAS", "")
+    return caches[alias] if alias else None
+
+
+def _version() -> str:
+    return f"{current_version()}/{current_boost_version()}"
+
+
+def make_key(qn: str, limit: int, kinds, backend: str, version: str) -> tuple:
+    return (qn, int(limit), tuple(sorted(kinds or ())), backend, version)
+
+
+def _shared_key(key: tuple) -> str:
+    raw = "\x1f".join(str(p) for p in key).encode("utf-8")
+    return "assistant:res:" + hashlib.sha1(raw).hexdigest()
+
+
+def _cached(key: tuple, compute):
+    value = _local.get(key)
+    if value is not None:
+        metrics.incr("result_cache.hit")
+        return value
+
+    shared = _shared()
+    if shared is not None:
+        value = shared.get(_shared_key(key))
+        if value is not None:
+            metrics.incr("result_cache.hit")
+            metrics.incr("result_cache.hit_shared")
+            _local.set(key, value)
+            return value
+
+    metrics.incr("result_cache.miss")
+    value = compute()
+    _local.set(key, value)
+    if shared is not None:
+        shared.set(_shared_key(key), value, int(getattr(settings, "ASSISTANT_RESULT_CACHE_TTL", 300)))
+    return value
+
+
+def cached_search(qn: str, limit: int = 8, kinds=None, backend: str | None = None) -> list:
+    if not qn:
+        return []
+    be = get_backend(backend)
+    if not getattr(settings, "ASSISTANT_RESULT_CACHE", True):
+        return be.search(qn, limit=limit, kinds=kinds)
+
+    key = make_key(qn, limit, kinds, be.name, _version())
+    return _cached(key, lambda: be.search(qn, limit=limit, kinds=kinds))
+
+
+def cached_faceted_search(qn: str, limit: int = 8, kinds=None, quotas=None,
+                          backend: str | None = None, ids_only: bool = False) -> tuple[list, dict]:
+    """cached_search с квотами по kind; значение — (rows, facets). ids_only — см. retrieval.hydrate."""
+    if not qn:
+        return [], {}
+    be = get_backend(backend)
+    if not getattr(settings, "ASSISTANT_RESULT_CACHE", True):
+        return be.search_faceted(qn, limit=limit, kinds=kinds, quotas=quotas, ids_only=ids_only)
+
+    key = make_key(qn, limit, kinds, be.name, _version()) + (
+        "faceted", tuple(sorted((quotas or {}).items())), ids_only,
+    )
+    return _cached(key, lambda: be.search_faceted(qn, limit=limit, kinds=kinds, quotas=quotas, ids_only=ids_only))
+
+
+def clear_local() -> None:
+    _local.clear()
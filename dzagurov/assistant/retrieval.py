@@ -1,4 +1,10 @@
+from abc import ABC, abstractmethod
+
+from django.conf import settings
 from django.db import connection
+from django.db.models import Q
+
+from .models import SearchIndex
 
 def search_mysql_fulltext(qn: str, limit: int = 8, kinds=None):
     kinds = kinds or []
@@ -35,3 +41,172 @@ def search_mysql_fulltext(qn: str, limit: int = 8, kinds=None):
                 "score": float(score or 0.0) * float(boost or 1.0),
             })
     return rows
+
+
+def kind_quotas(limit: int, quotas=None) -> dict:
+    """
+    Сколько строк одного kind может попасть в выдачу: ASSISTANT_KIND_QUOTAS,
+    поверх — квоты из запроса; всё в пределах 1..limit. Kind без квоты — limit.
+    """
+    merged = {**getattr(settings, "ASSISTANT_KIND_QUOTAS", {}), **(quotas or {})}
+    return {k: min(max(int(v), 1), limit) for k, v in merged.items()}
+
+
+def search_mysql_faceted(qn: str, limit: int = 8, kinds=None, quotas=None, ids_only: bool = False):
+    """
+    Выдача с квотами по kind и счётчиками по kind — одним запросом (MySQL 8,
+    оконные функции): ROW_NUMBER() режет каждый kind по его квоте, COUNT(*)
+    OVER даёт фасет. Счётчики считаются по всем kind, даже если kinds
+    ограничивает выдачу, — чипы показывают, что есть в других разделах.
+    ids_only — кандидаты под rerank: только id и score, без title/search_text
+    (их потом добирает hydrate() для показанных строк).
+    Возвращает (rows, {kind: count}).
+    """
+    limit = max(1, int(limit))
+    kinds = list(kinds or [])
+    quotas = kind_quotas(limit, quotas)
+
+    # не запрошенный kind нужен только ради счётчика — ему хватит одной строки
+    case_sql, case_params = [], []
+    for kind in SearchIndex.Kind.values:
+        case_sql.append("WHEN %s THEN %s")
+        case_params.extend([kind, quotas.get(kind, limit) if not kinds or kind in kinds else 1])
+
+    text_cols = "" if ids_only else "title, url, search_text, extra, "
+    sql = f"""
+    SELECT kind, object_id, {text_cols}score, kind_total
+    FROM (
+        SELECT scored.*,
+               ROW_NUMBER() OVER (PARTITION BY kind ORDER BY score DESC, id) AS rn,
+               COUNT(*) OVER (PARTITION BY kind) AS kind_total
+        FROM (
+            SELECT id, kind, object_id, {text_cols}
+                   (MATCH(search_text) AGAINST (%s IN NATURAL LANGUAGE MODE)) * boost AS score
+            FROM assistant_searchindex
+            WHERE MATCH(search_text) AGAINST (%s IN NATURAL LANGUAGE MODE)
+        ) scored
+    ) ranked
+    WHERE rn <= CASE kind {" ".join(case_sql)} ELSE %s END
+    ORDER BY score DESC;
+    """
+    params = [qn, qn, *case_params, 1 if kinds else limit]
+
+    rows, facets = [], {}
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        for rec in cur.fetchall():
+            kind, obj_id, score, kind_total = rec[0], rec[1], rec[-2], rec[-1]
+            facets[kind] = int(kind_total)
+            if kinds and kind not in kinds:
+                continue
+            if len(rows) < limit:
+                row = {"id": f"{kind}:{obj_id}", "kind": kind, "object_id": obj_id, "score": float(score or 0.0)}
+                if not ids_only:
+                    title, url, text, extra = rec[2:6]
+                    row.update(title=title, url=url, search_text=text or "", meta=extra or {})
+                rows.append(row)
+    return rows, facets
+
+
+def hydrate(rows: list[dict]) -> list[dict]:
+    """Дописать title/url/search_text/meta строкам кандидатов (ids_only) — одним запросом."""
+    missing = [r for r in rows if "search_text" not in r]
+    if not missing:
+        return rows
+    cond = Q()
+    by_kind: dict[str, list[int]] = {}
+    for r in missing:
+        by_kind.setdefault(r["kind"], []).append(r["object_id"])
+    for kind, ids in by_kind.items():
+        cond |= Q(kind=kind, object_id__in=ids)
+    found = {
+        (kind, obj_id): (title, url, text, extra)
+        for kind, obj_id, title, url, text, extra in SearchIndex.objects.filter(cond).values_list(
+            "kind", "object_id", "title", "url", "search_text", "extra",
+        )
+    }
+    out = []
+    for r in rows:
+        if "search_text" not in r:
+            hit = found.get((r["kind"], r["object_id"]))
+            if hit is None:  # строку удалили между поиском и показом
+                continue
+            title, url, text, extra = hit
+            r = {**r, "title": title, "url": url, "search_text": text or "", "meta": extra or {}}
+        out.append(r)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# backends
+#
+# Бэкенд — любой объект с .search(qn, limit, kinds) -> list[dict] в формате
+# search_mysql_fulltext и .search_faceted(qn, limit, kinds, quotas) ->
+# (list[dict], {kind: count}). Выбор: settings.ASSISTANT_SEARCH_BACKEND.
+
+class RetrievalBackend(ABC):
+    """Бэкенд без одного из методов падает уже при создании (get_backend), а не на первом запросе."""
+    name = ""
+
+    @abstractmethod
+    def search(self, qn: str, limit: int = 8, kinds=None) -> list:
+        ...
+
+    @abstractmethod
+    def search_faceted(self, qn: str, limit: int = 8, kinds=None, quotas=None,
+                       ids_only: bool = False) -> tuple[list, dict]:
+        """ids_only — бэкенд вправе не заполнять title/url/search_text/meta (см. hydrate)."""
+
+
+class MysqlFulltextBackend(RetrievalBackend):
+    """FULLTEXT-индекс MySQL по assistant_searchindex (как было изначально)."""
+    name = "mysql"
+
+    def search(self, qn, limit=8, kinds=None):
+        return search_mysql_fulltext(qn, limit=limit, kinds=kinds)
+
+    def search_faceted(self, qn, limit=8, kinds=None, quotas=None, ids_only=False):
+        return search_mysql_faceted(qn, limit=limit, kinds=kinds, quotas=quotas, ids_only=ids_only)
+
+
+class Bm25Backend(RetrievalBackend):
+    """In-memory BM25 (assistant.bm25): общий индекс на процесс, без запросов в БД."""
+    name = "bm25"
+
+    def search(self, qn, limit=8, kinds=None):
+        from .bm25 import get_index
+        return get_index().search(qn, limit=limit, kinds=kinds)
+
+    def search_faceted(self, qn, limit=8, kinds=None, quotas=None, ids_only=False):
+        # строки и так в памяти — отдаём целиком
+        from .bm25 import get_index
+        return get_index().search_faceted(qn, limit=limit, kinds=kinds, quotas=kind_quotas(max(1, int(limit)), quotas))
+
+
+BACKENDS = {
+    MysqlFulltextBackend.name: MysqlFulltextBackend,
+    Bm25Backend.name: Bm25Backend,
+}
+
+_instances = {}
+
+
+def get_backend(name: str | None = None) -> RetrievalBackend:
+    name = (name or getattr(settings, "ASSISTANT_SEARCH_BACKEND", "mysql") or "mysql").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд поиска: {name!r}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+
+def search(qn: str, limit: int = 8, kinds=None, backend: str | None = None) -> list:
+    if not qn:
+        return []
+    return get_backend(backend).search(qn, limit=limit, kinds=kinds)
+
+
+def search_faceted(qn: str, limit: int = 8, kinds=None, quotas=None, backend: str | None = None) -> tuple[list, dict]:
+    if not qn:
+        return [], {}
+    return get_backend(backend).search_faceted(qn, limit=limit, kinds=kinds, quotas=quotas)
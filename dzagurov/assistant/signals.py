@@ -0,0 +1,80 @@
+"""
+Инкрементальное обновление SearchIndex по сигналам моделей.
+
+Сохранение/удаление объекта переиндексирует только его строку (после
+коммита транзакции); разделы документа (M2M) — через m2m_changed. Массовые синки, которые обходят сигналы
+(queryset.update / bulk_*), должны сами звать indexing.reindex_objects
+или завернуть работу в indexing.deferred().
+Выключается settings.ASSISTANT_INDEX_SIGNALS = False.
+"""
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from lab.models import Test, Panel, PanelMaterial, PanelPreanalytic, Service as LabService
+from main.models import Contact, Documents, News, Service as SiteService
+
+from . import indexing
+
+KIND_BY_MODEL = {
+    Test: "test",
+    Panel: "panel",
+    LabService: "lab_service",
+    Contact: "contact",
+    News: "news",
+    Documents: "doc",
+    SiteService: "site_service",
+}
+
+# своих строк в индексе нет, но они входят в строку панели и в её готовые ответы
+PANEL_PARTS = (PanelMaterial, PanelPreanalytic)
+
+
+def _enabled(raw=False) -> bool:
+    # raw=True — loaddata: связанные объекты могут быть ещё не загружены
+    return not raw and getattr(settings, "ASSISTANT_INDEX_SIGNALS", True)
+
+
+@receiver(post_save, dispatch_uid="assistant_index_save")
+def on_save(sender, instance, raw=False, **kwargs):
+    if sender in PANEL_PARTS and _enabled(raw):
+        indexing.schedule("panel", [instance.panel_id])
+        return
+    kind = KIND_BY_MODEL.get(sender)
+    if kind is None or not _enabled(raw):
+        return
+    indexing.schedule(kind, [instance.pk])
+    if sender is Panel:
+        # в строках услуг лежат код/название панели
+        ids = list(LabService.objects.filter(panel_id=instance.pk).values_list("id", flat=True))
+        if ids:
+            indexing.schedule("lab_service", ids)
+
+
+@receiver(post_delete, dispatch_uid="assistant_index_delete")
+def on_delete(sender, instance, **kwargs):
+    if sender in PANEL_PARTS and _enabled():
+        indexing.schedule("panel", [instance.panel_id])
+        return
+    kind = KIND_BY_MODEL.get(sender)
+    if kind is None or not _enabled():
+        return
+    indexing.schedule(kind, [instance.pk])
+    if sender is LabService and instance.panel_id:
+        # цена в готовых ответах панели
+        indexing.schedule("panel", [instance.panel_id])
+
+
+@receiver(m2m_changed, sender=Documents.section.through, dispatch_uid="assistant_index_doc_sections")
+def on_doc_sections(sender, instance, action, reverse, pk_set, **kwargs):
+    # разделы лежат в строке документа (meta.sections и текст) — save() их не видит
+    if not _enabled():
+        return
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            indexing.schedule("doc", [instance.pk])
+    elif action in ("post_add", "post_remove"):
+        indexing.schedule("doc", pk_set)
+    elif action == "pre_clear":
+        # после clear() документов раздела уже не найти
+        indexing.schedule("doc", Documents.objects.filter(section=instance).values_list("id", flat=True))
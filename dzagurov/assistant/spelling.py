@@ -0,0 +1,285 @@
+"""
+Исправление опечаток в запросе по словарю каталога ("феритин" -> "ферритин",
+"тирео тропный" -> "тиреотропный").
+
+Словарь — все различные токены title / search_text / кодов из SearchIndex,
+плюс триграммный индекс: триграмма -> id терминов (CSR в array('I')).
+Неизвестный токен ищем по общим триграммам (Jaccard), кандидатов
+добиваем ограниченным Левенштейном (1 правка до 5 букв, 2 — длиннее).
+
+Собирается в reindex_search или build_assistant_vocabulary (по cron,
+с --if-stale — только если индекс поменялся) и сохраняется в
+ASSISTANT_DATA_DIR/spelling.bin. Процесс только загружает файл: устаревший
+используется как есть, без файла исправление выключено. Ни в запросе, ни
+при точечной переиндексации словарь не строится.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from array import array
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+from .index_version import PerProcess, content_version
+from .models import SearchIndex
+from .tokens import raw_tokens, stem
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"ASPELL1\n"
+MIN_LEN = 4          # короче — не исправляем
+MIN_JACCARD = 0.3
+MAX_CANDIDATES = 12
+
+
+def trigrams(term: str) -> set[str]:
+    s = f"${term}$"
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def bounded_levenshtein(a: str, b: str, max_d: int) -> int:
+    """Расстояние Левенштейна или max_d + 1, если точно больше max_d."""
+    if abs(len(a) - len(b)) > max_d:
+        return max_d + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > max_d:
+            return max_d + 1
+        prev = cur
+    return prev[-1]
+
+
+def _max_edits(term: str) -> int:
+    return 1 if len(term) <= 5 else 2
+
+
+def _is_word(tok: str) -> bool:
+    return any(c.isalpha() for c in tok) and not any(c.isdigit() for c in tok)
+
+
+class Vocabulary:
+    def __init__(self, terms: list[str], freq: array, grams: list[str],
+                 gram_off: array, gram_post: array, version: str = ""):
+        self.terms = terms
+        self.freq = freq
+        self.grams = grams
+        self.gram_off = gram_off
+        self.gram_post = gram_post
+        self.version = version
+
+        self.term_id = {t: i for i, t in enumerate(terms)}
+        self.gram_id = {g: i for i, g in enumerate(grams)}
+        self.stems = {stem(t) for t in terms}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.term_id
+
+    # ------------------------------------------------------------------ build
+
+    @classmethod
+    def from_texts(cls, texts, version: str = "") -> "Vocabulary":
+        counts: Counter = Counter()
+        for text in texts:
+            counts.update(raw_tokens(text))
+
+        terms = sorted(counts)
+        freq = array("I", (min(counts[t], 0xFFFFFFFF) for t in terms))
+
+        postings: dict[str, list[int]] = {}
+        for tid, t in enumerate(terms):
+            if len(t) < MIN_LEN - 1 or not _is_word(t):
+                continue
+            for g in trigrams(t):
+                postings.setdefault(g, []).append(tid)
+
+        grams = sorted(postings)
+        gram_off = array("I", [0])
+        gram_post = array("I")
+        for g in grams:
+            gram_post.extend(postings[g])
+            gram_off.append(len(gram_post))
+        return cls(terms, freq, grams, gram_off, gram_post, version)
+
+    @classmethod
+    def from_index(cls) -> "Vocabulary":
+        version = content_version()
+        rows = SearchIndex.objects.values_list("title", "search_text", "meta").iterator(chunk_size=2000)
+
+        def texts():
+            for title, text, meta in rows:
+                yield title or ""
+                yield text or ""
+                code = (meta or {}).get("code") if isinstance(meta, dict) else ""
+                if code:
+                    yield str(code)
+
+        return cls.from_texts(texts(), version)
+
+    # -------------------------------------------------------------- storage
+
+    def save(self, path: Path) -> None:
+        """Компактный бинарник: MAGIC, JSON-заголовок строкой, затем блобы подряд."""
+        blobs = [
+            "\n".join(self.terms).encode("utf-8"),
+            self.freq.tobytes(),
+            "\n".join(self.grams).encode("utf-8"),
+            self.gram_off.tobytes(),
+            self.gram_post.tobytes(),
+        ]
+        header = json.dumps({"version": self.version, "sizes": [len(b) for b in blobs]}).encode("utf-8")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(header + b"\n")
+            for b in blobs:
+                f.write(b)
+        os.replace(tmp, path)  # читатели видят либо старый, либо новый файл целиком
+
+    @classmethod
+    def load(cls, path: Path) -> "Vocabulary":
+        with open(path, "rb") as f:
+            if f.readline() != MAGIC:
+                raise ValueError(f"{path}: not a spelling index")
+            header = json.loads(f.readline())
+            terms_b, freq_b, grams_b, off_b, post_b = (f.read(n) for n in header["sizes"])
+
+        def arr(code, raw):
+            a = array(code)
+            a.frombytes(raw)
+            return a
+
+        return cls(
+            terms_b.decode("utf-8").split("\n") if terms_b else [],
+            arr("I", freq_b),
+            grams_b.decode("utf-8").split("\n") if grams_b else [],
+            arr("I", off_b),
+            arr("I", post_b),
+            header.get("version", ""),
+        )
+
+    # ---------------------------------------------------------------- query
+
+    def nearest(self, tok: str) -> str | None:
+        grams = trigrams(tok)
+        shared: Counter = Counter()
+        off, post = self.gram_off, self.gram_post
+        for g in grams:
+            gid = self.gram_id.get(g)
+            if gid is not None:
+                shared.update(post[off[gid]:off[gid + 1]])
+        if not shared:
+            return None
+
+        max_d = _max_edits(tok)
+        n = len(grams)
+        cands = []
+        for tid, k in shared.items():
+            term = self.terms[tid]
+            if abs(len(term) - len(tok)) > max_d:
+                continue
+            jac = k / (n + len(term) - k)  # у "$term$" ровно len(term) триграмм (без повторов — не больше)
+            if jac >= MIN_JACCARD:
+                cands.append((jac, tid))
+        cands.sort(reverse=True)
+
+        best = None
+        for _jac, tid in cands[:MAX_CANDIDATES]:
+            term = self.terms[tid]
+            d = bounded_levenshtein(tok, term, max_d)
+            if d > max_d:
+                continue
+            key = (d, -self.freq[tid])
+            if best is None or key < best[0]:
+                best = (key, term)
+        return best[1] if best else None
+
+    def known(self, tok: str) -> bool:
+        return tok in self.term_id or stem(tok) in self.stems
+
+    def correct(self, qn: str) -> tuple[str, list[tuple[str, str]]]:
+        """
+        Нормализованный запрос -> (исправленный запрос, [(было, стало), ...]).
+        Известные слова, числа/коды и короткие токены не трогаем.
+        """
+        toks = qn.split()
+        out, fixes = [], []
+        i = 0
+        while i < len(toks):
+            tok = toks[i]
+            nxt = toks[i + 1] if i + 1 < len(toks) else ""
+            # "тирео тропный" -> "тиреотропный"
+            if nxt and not self.known(tok) and (tok + nxt) in self.term_id:
+                out.append(tok + nxt)
+                fixes.append((f"{tok} {nxt}", tok + nxt))
+                i += 2
+                continue
+            if len(tok) >= MIN_LEN and _is_word(tok) and not self.known(tok):
+                fixed = self.nearest(tok)
+                if fixed and fixed != tok:
+                    out.append(fixed)
+                    fixes.append((tok, fixed))
+                    i += 1
+                    continue
+            out.append(tok)
+            i += 1
+        return " ".join(out), fixes
+
+
+# ---------------------------------------------------------------------------
+# per-process
+
+def index_path() -> Path:
+    base = getattr(settings, "ASSISTANT_DATA_DIR", None) or Path(settings.BASE_DIR) / "data" / "assistant"
+    return Path(base) / "spelling.bin"
+
+
+def rebuild() -> Vocabulary:
+    """Собрать словарь из SearchIndex и сохранить на диск (reindex_search, build_assistant_vocabulary)."""
+    vocab = Vocabulary.from_index()
+    try:
+        vocab.save(index_path())
+    except OSError as e:
+        log.warning("spelling: cannot save %s: %s", index_path(), e)
+    return vocab
+
+
+def _load() -> Vocabulary | None:
+    path = index_path()
+    try:
+        vocab = Vocabulary.load(path)
+    except (OSError, ValueError) as e:
+        # строить в запросе дорого — ждём reindex_search / build_assistant_vocabulary
+        log.info("spelling: %s unusable (%s), typo correction is off", path, e)
+        return None
+    if vocab.version != content_version():
+        # точечные правки после сборки: новых терминов в нём нет, остальное годно
+        log.info("spelling: %s is older than the index, using it anyway", path)
+    return vocab
+
+
+_shared = PerProcess(_load)
+
+
+def vocabulary() -> Vocabulary | None:
+    return _shared.get()
+
+
+def correct_query(qn: str) -> tuple[str, list[tuple[str, str]]]:
+    if not qn or not getattr(settings, "ASSISTANT_TYPO_CORRECTION", True):
+        return qn, []
+    vocab = _shared.get()
+    if vocab is None:
+        return qn, []
+    return vocab.correct(qn)
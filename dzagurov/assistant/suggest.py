@@ -0,0 +1,150 @@
+"""
+Подсказки по префиксу для /assistant/suggest/.
+
+Всё в памяти процесса: отсортированный список ключей + bisect.
+  - ключи — сложенные (lower, ё->е) заголовки SearchIndex, их «хвосты» с каждого
+    слова ("гормон" находит "Тиреотропный гормон"), коды тестов/панелей
+    и популярные запросы из AssistantEvent;
+  - у каждого ключа — номер записи (что показать) в array('I');
+  - для 1–2-символьных префиксов топ считается заранее, длинные префиксы
+    дают узкий диапазон и ранжируются на лету.
+
+Ранг: boost * (1 + log1p(клики)) для записей индекса, частота — для запросов.
+Структура пересобирается при смене версии индекса и раз в
+ASSISTANT_SUGGEST_TTL секунд (популярные запросы).
+"""
+from __future__ import annotations
+
+import math
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .index_version import PerProcess
+from .models import AssistantEvent, SearchIndex
+from .orchestrator import LAYOUT_EN_RU
+from .tokens import fold
+
+CODE_KINDS = ("test", "panel")
+MAX_TAIL_WORDS = 4     # хвосты заголовка — с первых N слов
+PRECOMPUTED_PREFIX = 2
+MAX_SCAN = 5000        # страховка для очень широких диапазонов
+TOP_PER_PREFIX = 20
+
+
+def _fold_key(text: str) -> str:
+    return " ".join(fold(text).split())
+
+
+class Suggester:
+    def __init__(self):
+        self.keys: list[str] = []
+        self.key_entry = array("I")
+        # entry: (text, kind, url, code, score)
+        self.entries: list[tuple[str, str, str, str, float]] = []
+        self.top: dict[str, list[int]] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ------------------------------------------------------------------ build
+
+    @classmethod
+    def build(cls) -> "Suggester":
+        self = cls()
+        pairs: list[tuple[str, int]] = []
+        days = int(getattr(settings, "ASSISTANT_SUGGEST_QUERY_DAYS", 30))
+        since = timezone.now() - timedelta(days=days)
+
+        clicks = dict(
+            AssistantEvent.objects.filter(created_at__gte=since).exclude(clicked="")
+            .values_list("clicked").annotate(n=Count("id")).order_by()
+        )
+
+        rows = SearchIndex.objects.values_list("kind", "object_id", "title", "url", "boost", "meta")
+        for kind, obj_id, title, url, boost, meta in rows.iterator(chunk_size=2000):
+            if not title:
+                continue
+            code = str((meta or {}).get("code") or "") if isinstance(meta, dict) else ""
+            score = float(boost or 1.0) * (1.0 + math.log1p(clicks.get(f"{kind}:{obj_id}", 0)))
+            eid = len(self.entries)
+            self.entries.append((title, kind, url or "", code, score))
+
+            key = _fold_key(title)
+            words = key.split()
+            for i in range(min(len(words), MAX_TAIL_WORDS)):
+                pairs.append((" ".join(words[i:]), eid))
+            if code and kind in CODE_KINDS:
+                pairs.append((fold(code), eid))
+
+        min_count = int(getattr(settings, "ASSISTANT_SUGGEST_MIN_QUERY_COUNT", 3))
+        popular = (
+            AssistantEvent.objects.filter(created_at__gte=since).exclude(normalized="")
+            .values_list("normalized").annotate(n=Count("id")).filter(n__gte=min_count).order_by("-n")[:5000]
+        )
+        for qn, n in popular:
+            eid = len(self.entries)
+            self.entries.append((qn, "query", "", "", float(n)))
+            pairs.append((_fold_key(qn), eid))
+
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.key_entry = array("I", (e for _, e in pairs))
+
+        # топ для коротких префиксов — иначе "а" просканирует пол-индекса
+        buckets: dict[str, set[int]] = {}
+        for k, e in pairs:
+            for n in range(1, PRECOMPUTED_PREFIX + 1):
+                if len(k) >= n:
+                    buckets.setdefault(k[:n], set()).add(e)
+        score = self._score
+        self.top = {p: sorted(es, key=score)[:TOP_PER_PREFIX] for p, es in buckets.items()}
+        return self
+
+    def _score(self, eid: int):
+        text, kind, _url, _code, score = self.entries[eid]
+        return (-score, kind == "query", len(text), text)
+
+    # ----------------------------------------------------------------- lookup
+
+    def _range(self, prefix: str) -> list[int]:
+        keys, key_entry = self.keys, self.key_entry
+        i = bisect_left(keys, prefix)
+        seen = set()
+        end = min(len(keys), i + MAX_SCAN)
+        while i < end and keys[i].startswith(prefix):
+            seen.add(key_entry[i])
+            i += 1
+        return sorted(seen, key=self._score)
+
+    def suggest(self, q: str, limit: int = 8) -> list[dict]:
+        prefix = _fold_key(q)
+        if not prefix:
+            return []
+        eids = self.top.get(prefix, []) if len(prefix) <= PRECOMPUTED_PREFIX else self._range(prefix)
+        if not eids and prefix.isascii():
+            # набрали по-русски на английской раскладке
+            swapped = prefix.translate(LAYOUT_EN_RU)
+            eids = self.top.get(swapped, []) if len(swapped) <= PRECOMPUTED_PREFIX else self._range(swapped)
+
+        out, seen_text = [], set()
+        for eid in eids:
+            text, kind, url, code, _score = self.entries[eid]
+            if text in seen_text:
+                continue
+            seen_text.add(text)
+            out.append({"text": text, "kind": kind, "url": url, "code": code})
+            if len(out) >= limit:
+                break
+        return out
+
+
+_shared = PerProcess(Suggester.build, max_age=float(getattr(settings, "ASSISTANT_SUGGEST_TTL", 600)))
+
+
+def suggest(q: str, limit: int = 8) -> list[dict]:
+    return _shared.get().suggest(q, limit=limit)
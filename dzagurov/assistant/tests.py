@@ -1,3 +1,123 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
 
-# Create your tests here.
+from . import ratelimit
+from .answers import split_query
+from .codes import is_explicit_code, query_code
+from .orchestrator import normalize
+from .spelling import Vocabulary, bounded_levenshtein
+from .tokens import raw_tokens, stem, tokenize
+
+
+class TokensTests(SimpleTestCase):
+    def test_compound_codes_kept_whole_and_split(self):
+        self.assertEqual(raw_tokens("Анализ 03.001 HbA1c"), ["анализ", "03.001", "03", "001", "hba1c"])
+
+    def test_stem_folds_case_endings(self):
+        self.assertEqual(tokenize("ферритину ферритина"), ["ферритин", "ферритин"])
+
+    def test_short_and_latin_tokens_not_stemmed(self):
+        self.assertEqual(stem("тест"), "тест")
+        self.assertEqual(stem("glucose"), "glucose")
+
+
+class SpellingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.vocab = Vocabulary.from_texts(["Ферритин сыворотки", "Тиреотропный гормон ТТГ", "Общий анализ крови"])
+
+    def test_bounded_levenshtein(self):
+        self.assertEqual(bounded_levenshtein("abc", "abd", 1), 1)
+        # больше max_d — любое значение > max_d
+        self.assertGreater(bounded_levenshtein("abc", "xyz", 1), 1)
+
+    def test_typo_corrected(self):
+        self.assertEqual(self.vocab.correct("феритин"), ("ферритин", [("феритин", "ферритин")]))
+
+    def test_split_word_joined(self):
+        self.assertEqual(
+            self.vocab.correct("тирео тропный"),
+            ("тиреотропный", [("тирео тропный", "тиреотропный")]),
+        )
+
+    def test_known_words_and_codes_untouched(self):
+        self.assertEqual(self.vocab.correct("ферритин 03.001"), ("ферритин 03.001", []))
+        self.assertEqual(self.vocab.correct("кровь"), ("кровь", []))
+
+
+class AnswerQueryTests(SimpleTestCase):
+    def test_intent_and_rest(self):
+        self.assertEqual(split_query(normalize("подготовка к ферритину")), (["preparation"], ["ферритину"]))
+
+    def test_phrase_wins_over_word(self):
+        # "сколько стоит" — цена, а не срок по "сколько"
+        self.assertEqual(split_query(normalize("сколько стоит ттг")), (["price"], ["ттг"]))
+
+    def test_several_intents_in_table_order(self):
+        self.assertEqual(split_query(normalize("цена и срок алт")), (["duration", "price"], ["алт"]))
+
+    def test_no_intent(self):
+        self.assertEqual(split_query(normalize("ферритин")), ([], ["ферритин"]))
+
+
+class CodeQueryTests(SimpleTestCase):
+    def test_query_code(self):
+        self.assertEqual(query_code("03.001"), "03.001")
+        self.assertEqual(query_code("код: FERR"), "FERR")
+        self.assertEqual(query_code("FERR."), "FERR")
+        self.assertEqual(query_code("tsh"), "TSH")
+        self.assertEqual(query_code("анализ крови"), "")
+
+    def test_explicit_code_needs_digit_or_prefix(self):
+        self.assertTrue(is_explicit_code("03.001"))
+        self.assertTrue(is_explicit_code("код: FERR"))
+        self.assertFalse(is_explicit_code("tsh"))
+        self.assertFalse(is_explicit_code("ферритин"))
+        self.assertFalse(is_explicit_code("анализ крови 2"))
+
+
+@override_settings(ASSISTANT_RATELIMIT_CACHE_ALIAS="")
+class RateLimitWindowTests(SimpleTestCase):
+    LIMIT, WINDOW = 3, 60
+    T0 = 600.0  # начало окна idx = 10
+
+    def setUp(self):
+        ratelimit._local.clear()
+
+    def hit(self, at: float, ident: str = "c", scope: str = "t") -> int:
+        return ratelimit.hit(scope, ident, self.LIMIT, self.WINDOW, now=at)
+
+    def test_limit_within_window(self):
+        self.assertEqual([self.hit(self.T0 + i) for i in range(3)], [0, 0, 0])
+        # 4-й — ждать до конца окна
+        self.assertEqual(self.hit(self.T0 + 3), self.WINDOW - 3)
+
+    def test_previous_window_weight_decays(self):
+        for i in range(3):
+            self.hit(self.T0 + i)
+        # через 1 с после смены окна: 3 * 59/60 + 1 > 3
+        retry = self.hit(self.T0 + 61)
+        self.assertTrue(0 < retry <= 20)
+        # повтор после Retry-After проходит
+        self.assertEqual(self.hit(self.T0 + 61 + retry), 0)
+
+    def test_rejected_requests_not_counted(self):
+        for i in range(3):
+            self.hit(self.T0 + i)
+        for i in range(20):
+            self.assertGreater(self.hit(self.T0 + 3 + i), 0)
+        # если бы отказы считались, prev было бы 23 и клиент остался бы заблокирован
+        self.assertEqual(self.hit(self.T0 + self.WINDOW + 30), 0)
+
+    def test_clients_and_scopes_independent(self):
+        for i in range(3):
+            self.hit(self.T0 + i, ident="a")
+        self.assertGreater(self.hit(self.T0 + 3, ident="a"), 0)
+        self.assertEqual(self.hit(self.T0 + 3, ident="b"), 0)
+        self.assertEqual(self.hit(self.T0 + 3, ident="a", scope="other"), 0)
+
+    def test_unhit_returns_slot(self):
+        for i in range(3):
+            self.hit(self.T0 + i)
+        ratelimit.unhit("t", "c", self.WINDOW, now=self.T0 + 3)
+        self.assertEqual(self.hit(self.T0 + 4), 0)
@@ -0,0 +1,47 @@
+import re
+
+# слово или код с точками/дефисами внутри: "03.001", "25-oh", "hba1c"
+TOKEN_RE = re.compile(r"\w+(?:[.\-]\w+)*", re.U)
+
+# грубый «лёгкий» стеммер для русского: срезаем самые частые окончания,
+# чтобы "ферритину" / "ферритина" попадали в "ферритин"
+_ENDINGS = sorted([
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях",
+    "ого", "его", "ому", "ему", "ыми", "ими", "ых", "их",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ые", "ие",
+    "ов", "ев", "ам", "ям", "ах", "ях", "ом", "ем", "ую", "юю", "ию", "ия", "ья", "ье", "ьи",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+
+_CYR_RE = re.compile(r"[а-я]")
+MIN_STEM = 4
+
+
+def fold(text: str) -> str:
+    return (text or "").lower().replace("ё", "е")
+
+
+def stem(tok: str) -> str:
+    if len(tok) <= MIN_STEM or not _CYR_RE.search(tok):
+        return tok
+    for e in _ENDINGS:
+        if tok.endswith(e) and len(tok) - len(e) >= MIN_STEM:
+            return tok[: -len(e)]
+    return tok
+
+
+def raw_tokens(text: str) -> list[str]:
+    """
+    Токены без стемминга. Составные ("03.001") отдаём целиком
+    и дополнительно по частям — код находится и так, и так.
+    """
+    out = []
+    for t in TOKEN_RE.findall(fold(text)):
+        out.append(t)
+        if "." in t or "-" in t:
+            out.extend(p for p in re.split(r"[.\-]", t) if p)
+    return [t for t in out if len(t) > 1 or t.isdigit() or t.isascii()]
+
+
+def tokenize(text: str) -> list[str]:
+    return [stem(t) for t in raw_tokens(text)]
@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import ask
+from .views import ask, click, metrics_view, suggest
 
 urlpatterns = [
     path("ask/", ask, name="assistant_ask"),
+    path("click/", click, name="assistant_click"),
+    path("suggest/", suggest, name="assistant_suggest"),
+    path("metrics/", metrics_view, name="assistant_metrics"),
 ]
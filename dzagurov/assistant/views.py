@@ -1,32 +1,144 @@
 import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+
+from . import metrics, ratelimit
+from .events import log_event
+from .models import AssistantEvent, SearchIndex
+from .pipeline import retrieve
+from .suggest import suggest as suggest_prefix
+from .orchestrator import build_answer, build_structured_answer
+
+def _kinds_and_quotas(payload: dict) -> tuple[list, dict]:
+    """kinds: ["panel", ...] и quotas: {"news": 1, ...} из запроса — только известные kind."""
+    known = set(SearchIndex.Kind.values)
+    kinds = payload.get("kinds") or []
+    if isinstance(kinds, str):
+        kinds = [kinds]
+    kinds = sorted({k for k in kinds if isinstance(k, str) and k in known}) if isinstance(kinds, list) else []
+
+    quotas = {}
+    raw = payload.get("quotas")
+    if isinstance(raw, dict):
+        for k, v in raw.items():
+            if k in known:
+                try:
+                    quotas[k] = int(v)
+                except (TypeError, ValueError):
+                    pass
+    return kinds, quotas
+
+
+def _limit(payload: dict) -> int:
+    """limit из запроса в пределах 1..ASSISTANT_ASK_MAX_LIMIT (иначе limit=100000 тянет из БД простыни search_text)."""
+    try:
+        limit = int(payload.get("limit", 8))
+    except (TypeError, ValueError):
+        limit = 8
+    return min(max(limit, 1), int(getattr(settings, "ASSISTANT_ASK_MAX_LIMIT", 20)))
 
-from .retrieval import search_mysql_fulltext
-from .orchestrator import normalize, build_answer
-from .models import AssistantEvent
 
 @require_POST
 def ask(request):
-    payload = json.loads(request.body.decode("utf-8"))
-    query = (payload.get("q") or "")[:512]
-    limit = int(payload.get("limit", 8))
+    # до разбора запроса и поиска; request.user не читаем
+    retry = ratelimit.check(request)
+    if retry:
+        response = JsonResponse({"error": "rate_limited", "retry_after": retry}, status=429)
+        response["Retry-After"] = str(retry)
+        return response
 
-    if not request.session.session_key:
-        request.session.save()
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        payload = None
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "bad_request"}, status=400)
+
+    query = str(payload.get("q") or "")[:512]
+    limit = _limit(payload)
+    kinds, quotas = _kinds_and_quotas(payload)
 
-    qn = normalize(query)
-    rows = search_mysql_fulltext(qn, limit=limit)
+    r = retrieve(query, limit=limit, kinds=kinds, quotas=quotas)
 
-    data = build_answer(query, rows)
+    if r.answer is not None:
+        data = build_structured_answer(query, r.answer.row(), r.answer.facts, qn=r.qn)
+    else:
+        data = build_answer(query, r.rows, qn=r.qc, facets=r.facets)
+    data["kinds"] = kinds
+    if r.variant in ("layout", "translit") or r.fixes:
+        data["corrected"] = r.qc
 
-    AssistantEvent.objects.create(
+    user_id = request.user.pk if request.user.is_authenticated else None  # заодно загружает сессию
+    if not request.session.session_key:
+        # аноним без сессии (или с протухшей cookie): по ключу сессии click
+        # находит событие, а ratelimit считает запросы
+        request.session.create()
+    # запись события — в фоне
+    log_event(
         session_key=request.session.session_key,
-        user=request.user if request.user.is_authenticated else None,
+        user_id=user_id,
         query=query,
-        normalized=qn,
+        normalized=r.qn,
+        variant=r.variant,
         intents=data["intents"],
         results=[r["id"] for r in data["results"]],
     )
 
     return JsonResponse(data)
+
+
+CLICK_WINDOW = timedelta(hours=1)
+CLICK_LOOKBACK = 5  # последние события сессии, среди которых ищем показ
+
+
+@require_POST
+def click(request):
+    """
+    Клик по карточке: отмечаем clicked у последнего события этой сессии,
+    где документ был в выдаче. Из этих отметок learn_assistant_boosts
+    считает CTR и boost.
+    """
+    try:
+        doc_id = str(json.loads(request.body.decode("utf-8")).get("id") or "")[:128]
+    except (ValueError, AttributeError):
+        doc_id = ""
+    session_key = request.session.session_key
+    if not doc_id or not session_key:
+        return JsonResponse({"ok": False}, status=400)
+
+    recent = (
+        AssistantEvent.objects
+        .filter(session_key=session_key, clicked="", created_at__gte=timezone.now() - CLICK_WINDOW)
+        .order_by("-id")
+        .values_list("id", "results")[:CLICK_LOOKBACK]
+    )
+    for event_id, results in recent:
+        if isinstance(results, list) and doc_id in results:
+            AssistantEvent.objects.filter(pk=event_id).update(clicked=doc_id)
+            metrics.incr("click.matched")
+            return JsonResponse({"ok": True})
+
+    # событие ещё в буфере events или выдача старая — клик просто теряем
+    metrics.incr("click.unmatched")
+    return JsonResponse({"ok": False})
+
+
+@require_GET
+def suggest(request):
+    q = (request.GET.get("q") or "")[:64]
+    try:
+        limit = min(max(int(request.GET.get("limit", 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    return JsonResponse({"q": q, "items": suggest_prefix(q, limit=limit)})
+
+
+@require_GET
+@staff_member_required
+def metrics_view(request):
+    return JsonResponse(metrics.snapshot())
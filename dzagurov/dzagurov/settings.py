@@ -214,6 +214,73 @@ NACPP_HTTP_TIMEOUT = 30
 NACPP_RETRIES = 3
 NACPP_RETRY_BACKOFF = 1.5  # экспоненциально
 
+# разбор XML: auto (lxml, если установлен) | lxml | defusedxml
+# сравнить на дампах: python manage.py nacpp_bench_parse
+NACPP_XML_BACKEND = os.getenv("NACPP_XML_BACKEND", "auto")
+
+# --- Ассистент ---
+# поиск: mysql (FULLTEXT) | bm25 (in-memory индекс на процесс, numpy — если есть)
+ASSISTANT_SEARCH_BACKEND = os.getenv("ASSISTANT_SEARCH_BACKEND", "mysql")
+# как часто (сек) процесс перепроверяет версию SearchIndex для пересборки своих структур
+ASSISTANT_INDEX_VERSION_TTL = 5
+# кеш результатов ask: LRU в процессе + (опц.) общий Django-кеш по alias из CACHES
+ASSISTANT_RESULT_CACHE = True
+ASSISTANT_RESULT_CACHE_SIZE = 512
+ASSISTANT_RESULT_CACHE_ALIAS = os.getenv("ASSISTANT_RESULT_CACHE_ALIAS", "")
+ASSISTANT_RESULT_CACHE_TTL = 300
+# ask: не больше N строк одного kind в выдаче (остальные kind — до limit), чтобы новости не вытесняли панели
+ASSISTANT_KIND_QUOTAS = {"news": 2, "contact": 2, "doc": 3, "site_service": 3}
+# точечное обновление SearchIndex по post_save/post_delete (lab.Test/Panel/Service + материалы/преаналитика панелей,
+# main.Contact/News/Documents/Service)
+ASSISTANT_INDEX_SIGNALS = True
+# текст PDF документов (pypdf из requirements.txt; без него — только заголовок и текст страницы):
+# воркеры разбора (0 = по числу CPU), сколько страниц/символов брать
+ASSISTANT_PDF_WORKERS = 0
+ASSISTANT_PDF_MAX_PAGES = 50
+ASSISTANT_PDF_MAX_CHARS = 20000
+# артефакты ассистента на диске (словарь опечаток и т.п.), собираются reindex_search
+ASSISTANT_DATA_DIR = BASE_DIR / "data" / "assistant"
+# исправление опечаток по триграммному словарю каталога
+ASSISTANT_TYPO_CORRECTION = True
+# rerank топ-N кандидатов по TF-IDF (слова + триграммы; матрицу строит reindex_search / build_assistant_rerank):
+# вкл/выкл, сколько кандидатов, вес косинуса в итоговом score, бюджет (мс), с какой длины запроса (слов)
+ASSISTANT_RERANK = True
+ASSISTANT_RERANK_CANDIDATES = 100
+ASSISTANT_RERANK_WEIGHT = 0.3
+ASSISTANT_RERANK_BUDGET_MS = 15
+ASSISTANT_RERANK_MIN_TOKENS = 2
+# готовые ответы «интент + панель» (подготовка, срок, цена, биоматериал) без поиска; таблицу строит
+# reindex_search / build_assistant_answers
+ASSISTANT_STRUCTURED_ANSWERS = True
+# /assistant/ask/: не больше N строк в выдаче (limit из запроса обрезается)
+ASSISTANT_ASK_MAX_LIMIT = 20
+# лимит частоты ask (скользящее окно): (запросов, окно в сек) на сессию и на IP; 429 + Retry-After
+ASSISTANT_RATELIMIT = True
+ASSISTANT_RATELIMIT_SESSION = (30, 60)
+ASSISTANT_RATELIMIT_IP = (120, 60)
+# счётчики в Django-кеше по alias из CACHES (общие для воркеров); пусто, LocMem или кеш недоступен —
+# в памяти процесса, лимит на воркер (manage.py check --deploy: assistant.W001)
+ASSISTANT_RATELIMIT_CACHE_ALIAS = os.getenv("ASSISTANT_RATELIMIT_CACHE_ALIAS", "")
+# IP клиента за прокси из заголовка (например "HTTP_X_REAL_IP"); пусто — REMOTE_ADDR
+ASSISTANT_RATELIMIT_IP_HEADER = os.getenv("ASSISTANT_RATELIMIT_IP_HEADER", "")
+# /assistant/suggest/: пересборка (популярные запросы) раз в N сек, окно и порог популярности
+ASSISTANT_SUGGEST_TTL = 600
+ASSISTANT_SUGGEST_QUERY_DAYS = 30
+ASSISTANT_SUGGEST_MIN_QUERY_COUNT = 3
+# журнал AssistantEvent: фоновой пачкой (bulk_create) вместо INSERT в запросе
+ASSISTANT_EVENTS_ASYNC = True
+ASSISTANT_EVENTS_BATCH = 100
+ASSISTANT_EVENTS_FLUSH_SECONDS = 2.0
+ASSISTANT_EVENTS_QUEUE_MAX = 10000
+# сырые события старше N дней удаляет rollup_assistant_events (после агрегации)
+ASSISTANT_EVENTS_RETENTION_DAYS = 90
+# learn_assistant_boosts: окно событий, сила сглаживания CTR (в показах), диапазон boost, порог записи
+ASSISTANT_BOOST_DAYS = 30
+ASSISTANT_BOOST_PRIOR = 20.0
+ASSISTANT_BOOST_MIN = 0.5
+ASSISTANT_BOOST_MAX = 3.0
+ASSISTANT_BOOST_MIN_DELTA = 0.05
+
 
 
 # Баланс удобство/защита
@@ -1,4 +1,5 @@
 # lab/admin.py
+from django import forms
 from django.contrib import admin, messages
 from django.utils.html import format_html
 from django.db.models import Count, Prefetch  # <<< Prefetch
@@ -10,9 +11,11 @@ from django.conf import settings
 
 from .models import (
     Biomaterial, ContainerType, Test, Analyte, Panel, PanelCategory, PanelTest, PanelMaterial,
-    PanelLinked, TestRequirement, Localization, Order, OrderPanel, ResultEntry, Service, PanelPreanalytic
+    PanelLinked, TestRequirement, Localization, Order, OrderPanel, ResultEntry, Service, PanelPreanalytic,
+    PreanalyticText,
 )
 from .nacpp_client import NacppClient
+from .nacpp_records import parse_results
 
 
 # ==========================
@@ -33,49 +36,39 @@ def admin_refresh_results(modeladmin, request, queryset):
 
         changed = 0
 
-        for p in res.findall(".//panel"):
-            pcode = (p.get("code") or (p.findtext("code") or "")).strip()
-            panel = Panel.objects.filter(code=pcode).first()
+        for p in parse_results(res):
+            panel = Panel.objects.filter(code=p.code).first()
             op, _ = OrderPanel.objects.get_or_create(order=order, panel=panel)
-            op.status = (p.findtext("status") or "").strip()
-            op.released_doctor = (p.findtext("released_doctor") or "").strip()
+            op.status = p.status
+            op.released_doctor = p.released_doctor
             op.save()
 
-            for t in p.findall(".//test"):
-                tcode = (t.get("code") or (t.findtext("code") or "")).strip()
-                test = Test.objects.filter(code=tcode).first()
-                released = (t.findtext("released_doctor") or "").strip()
-
-                for a in t.findall(".//analyte"):
-                    an_code = (a.get("code") or (a.findtext("code") or "")).strip()
-                    an_name = (a.get("name") or (a.findtext("name") or "")).strip()
-                    val = (a.findtext("value") or "").strip()
-                    unit = (a.findtext("unit") or "").strip()
-                    low = (a.findtext("low") or "").strip()
-                    high = (a.findtext("high") or "").strip()
-                    comment = (a.findtext("comment") or "").strip()
-                    raw = (a.findtext("rawresult") or "").strip()
-
-                    analyt = None
-                    if test:
-                        if an_code:
-                            analyt = Analyte.objects.filter(test=test, code=an_code).first()
-                        if not analyt and an_name:
-                            analyt = Analyte.objects.filter(test=test, name__iexact=an_name).first()
-
-                    obj, created = ResultEntry.objects.get_or_create(
-                        order_panel=op,
-                        test=test,
-                        value=val,
-                        unit=unit,
-                        norm_low=low,
-                        norm_high=high,
-                        comment=comment,
-                        rawresult=raw,
-                        analyte=analyt,
-                        defaults={"released_doctor": released},
-                    )
-                    changed += int(created)
+            tests = {}
+            for r in p.results:
+                if r.test_code not in tests:
+                    tests[r.test_code] = Test.objects.filter(code=r.test_code).first()
+                test = tests[r.test_code]
+
+                analyt = None
+                if test:
+                    if r.analyte_code:
+                        analyt = Analyte.objects.filter(test=test, code=r.analyte_code).first()
+                    if not analyt and r.analyte_name:
+                        analyt = Analyte.objects.filter(test=test, name__iexact=r.analyte_name).first()
+
+                obj, created = ResultEntry.objects.get_or_create(
+                    order_panel=op,
+                    test=test,
+                    value=r.value,
+                    unit=r.unit,
+                    norm_low=r.low,
+                    norm_high=r.high,
+                    comment=r.comment,
+                    rawresult=r.rawresult,
+                    analyte=analyt,
+                    defaults={"released_doctor": r.test_released_doctor},
+                )
+                changed += int(created)
 
         updated += int(changed > 0)
 
@@ -241,7 +234,7 @@ class TestAdmin(admin.ModelAdmin):
     search_fields = ("code", "name", "unit", "method", "description", "analytes__name")
     ordering = ("code",)
     inlines = (AnalyteInline,)
-    list_filter = ("unit",)
+    list_filter = ("is_active", "unit")
     list_per_page = 50
     save_on_top = True
 
@@ -499,9 +492,37 @@ class HasPreanalyticFilter(admin.SimpleListFilter):
         return queryset
 
 
+# --- Форма преаналитики: тексты редактируем как обычные поля,
+#     а храним через PreanalyticText (общий блоб по хэшу)
+class PanelPreanalyticForm(forms.ModelForm):
+    training = forms.CharField(label="Подготовка к исследованию", required=False, widget=forms.Textarea)
+    centrifugation = forms.CharField(label="Центрифугирование", required=False, widget=forms.Textarea)
+    storage_transportation = forms.CharField(label="Хранение и транспортировка", required=False, widget=forms.Textarea)
+    note = forms.CharField(label="Примечание", required=False, widget=forms.Textarea)
+
+    class Meta:
+        model = PanelPreanalytic
+        fields = ("min_count",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            for name in PanelPreanalytic.TEXT_FIELDS:
+                self.fields[name].initial = getattr(self.instance, name)
+
+    def save(self, commit=True):
+        obj = super().save(commit=False)
+        for name in PanelPreanalytic.TEXT_FIELDS:
+            setattr(obj, f"{name}_text", PreanalyticText.intern(self.cleaned_data.get(name)))
+        if commit:
+            obj.save()
+        return obj
+
+
 # --- Inline для преаналитики (reverse FK)
 class PanelPreanalyticInline(admin.StackedInline):
     model = PanelPreanalytic
+    form = PanelPreanalyticForm
     extra = 0
     classes = ("collapse",)
     fieldsets = (
@@ -533,13 +554,13 @@ class PanelAdmin(admin.ModelAdmin):
         "duration",
         "panel_tests__test__name",
         # поиск по текстам преаналитики (reverse FK)
-        "preanalytic__training",                 # <<<
-        "preanalytic__centrifugation",           # <<<
-        "preanalytic__storage_transportation",   # <<<
-        "preanalytic__note",                     # <<<
+        "preanalytic__training_text__body",                 # <<<
+        "preanalytic__centrifugation_text__body",           # <<<
+        "preanalytic__storage_transportation_text__body",   # <<<
+        "preanalytic__note_text__body",                     # <<<
         "preanalytic__min_count",                # <<<
     )
-    list_filter = ("category_code", HasPreanalyticFilter, PanelByBiomaterialFilter, PanelHasLinkedFilter)
+    list_filter = ("is_active", "category_code", HasPreanalyticFilter, PanelByBiomaterialFilter, PanelHasLinkedFilter)
     ordering = ("code",)
     inlines = (PanelPreanalyticInline, PanelTestInline, PanelMaterialInline)
     list_per_page = 50
@@ -552,11 +573,15 @@ class PanelAdmin(admin.ModelAdmin):
             "panel_tests__test",
             "panel_materials__biomaterial",
             "panel_materials__container_type",
+            # тексты — JOIN-ом в том же запросе: preanalytic_badge читает .training и др.
             Prefetch(
                 "preanalytic",
-                queryset=PanelPreanalytic.objects.only(
-                    "id", "panel_id", "min_count", "training",
-                    "centrifugation", "storage_transportation", "note"
+                queryset=PanelPreanalytic.objects.select_related(
+                    "training_text", "centrifugation_text", "storage_transportation_text", "note_text",
+                ).only(
+                    "id", "panel_id", "min_count",
+                    "training_text__body", "centrifugation_text__body",
+                    "storage_transportation_text__body", "note_text__body",
                 ).order_by("id"),
             ),
         )
@@ -584,14 +609,11 @@ class PanelAdmin(admin.ModelAdmin):
     tests_count.short_description = "Тестов"
 
     def preanalytic_badge(self, obj):
-        # работаем с множеством preanalytics; показываем краткий тизер по первой записи
+        # preanalytic — OneToOne: объект из prefetch или его нет (DoesNotExist — это AttributeError)
         pa = getattr(obj, "preanalytic", None)
-        if not pa:
-            return "—"
-        pa_first = pa.first() if hasattr(pa, "first") else None
-        if not pa_first:
+        if pa is None:
             return "—"
-        teaser = pa_first.min_count or pa_first.training or pa_first.centrifugation or pa_first.storage_transportation or pa_first.note or ""
+        teaser = pa.min_count or pa.training or pa.centrifugation or pa.storage_transportation or pa.note or ""
         teaser = teaser.strip()
         if len(teaser) > 40:
             teaser = teaser[:40] + "…"
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import gc
+import json
+import multiprocessing as mp
+import resource
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from lab import nacpp_records as rec
+from lab import xml_backend
+
+
+PARSERS = {
+    "tests.xml": rec.parse_tests,
+    "panels.xml": rec.parse_panels,
+    "preanalytics.xml": rec.parse_preanalytics,
+    "testsrequirements.xml": rec.parse_requirements,
+    "panelscategories.xml": rec.parse_panel_categories,
+    "containertypes.xml": rec.parse_container_types,
+}
+
+
+def _maxrss_kb() -> int:
+    # VmHWM — пик RSS текущего адресного пространства (сбрасывается на exec);
+    # ru_maxrss в Linux наследует пик родителя, поэтому он только запасной
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(path: str, backend: str, mode: str, repeat: int) -> dict:
+    """
+    Выполняется в отдельном (spawn) процессе, чтобы пик RSS был честным
+    и включал память C-парсера (tracemalloc её не видит).
+    """
+    data = Path(path).read_bytes()
+    fn = PARSERS[Path(path).name]
+    gc.collect()
+    base = _maxrss_kb()
+
+    best = None
+    count = 0
+    with override_settings(NACPP_XML_BACKEND=backend):
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            if mode == "dom":
+                out = xml_backend.fromstring(data)
+                count = sum(1 for _ in out.iter())
+            else:
+                out = fn(data)
+                count = len(out)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+            out = None
+            gc.collect()
+
+    return {
+        "file": Path(path).name,
+        "backend": backend,
+        "mode": mode,
+        "items": count,
+        "seconds": round(best, 4),
+        "peak_mb": round((_maxrss_kb() - base) / 1024.0, 1),
+        "size_mb": round(len(data) / 1024.0 / 1024.0, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк разбора дампов NACPP: время и пиковая память по XML-бэкендам (lxml / defusedxml)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=str(Path(settings.BASE_DIR) / "nacpp_dumps"),
+                            help="Каталог с дампами (default: nacpp_dumps).")
+        parser.add_argument("--files", nargs="+", default=["tests.xml", "panels.xml", "preanalytics.xml"])
+        parser.add_argument("--backend", action="append", choices=xml_backend.BACKENDS,
+                            help="Какой бэкенд мерить (можно несколько; default: все установленные).")
+        parser.add_argument("--mode", action="append", choices=("dom", "records"),
+                            help="dom — fromstring целиком; records — потоковый разбор в lab.nacpp_records.")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--json", dest="json_path", default="", help="Сохранить отчёт в JSON.")
+
+    def handle(self, *args, **opts):
+        base = Path(opts["dir"])
+        backends = opts["backend"] or xml_backend.available_backends()
+        modes = opts["mode"] or ["dom", "records"]
+        repeat = max(1, int(opts["repeat"] or 1))
+
+        for b in backends:
+            if b not in xml_backend.available_backends():
+                raise CommandError(f"Бэкенд {b} недоступен (не установлен)")
+
+        files = []
+        for name in opts["files"]:
+            p = base / name
+            if not p.exists():
+                raise CommandError(f"Нет файла {p}")
+            if name not in PARSERS:
+                raise CommandError(f"Для {name} нет парсера записей")
+            files.append(p)
+
+        ctx = mp.get_context("spawn")
+        rows = []
+        with ctx.Pool(1, maxtasksperchild=1) as pool:
+            for p in files:
+                for b in backends:
+                    for m in modes:
+                        rows.append(pool.apply(_measure, (str(p), b, m, repeat)))
+
+        self.stdout.write(f"{'file':<20} {'backend':<11} {'mode':<8} {'items':>8} {'sec':>8} {'peak MB':>8}")
+        for r in rows:
+            self.stdout.write(
+                f"{r['file']:<20} {r['backend']:<11} {r['mode']:<8} {r['items']:>8} {r['seconds']:>8.3f} {r['peak_mb']:>8.1f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Текущий бэкенд (NACPP_XML_BACKEND): {xml_backend.resolve()}"))
+
+        if opts["json_path"]:
+            Path(opts["json_path"]).write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(f"JSON: {opts['json_path']}")
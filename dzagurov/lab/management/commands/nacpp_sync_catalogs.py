@@ -1,20 +1,35 @@
 # lab/management/commands/<твоя_команда>.py
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.utils import timezone
 from lab.models import (
     Biomaterial, ContainerType, Test, Analyte, Panel, PanelTest, PanelMaterial,
-    TestRequirement, PanelLinked, PanelCategory, PanelPreanalytic  # ← добавили
+    TestRequirement, PanelLinked, PanelCategory, PanelPreanalytic, PreanalyticText
 )
 from lab.nacpp_client import NacppClient
+from assistant import indexing
+from lab import nacpp_records as rec
 
 
 class Command(BaseCommand):
     help = "Синхронизация справочников (контейнеры, тесты, аналиты, категории панелей, панели, материалы, преаналитика, требования, связи)."
 
+    def add_arguments(self, parser):
+        parser.add_argument("--no-prune", action="store_true",
+                            help="Не удалять/не деактивировать строки, пропавшие из каталога.")
+        parser.add_argument("--prune-max-pct", type=float, default=20.0,
+                            help="Не чистить этап, если пропадает больше N%% строк (защита от обрезанного каталога; default: 20).")
+
     def handle(self, *args, **opts):
+        self.prune = not opts.get("no_prune")
+        self.prune_max_pct = opts["prune_max_pct"]
+        self.pruned = {}
+
         client = NacppClient()
         try:
-            with transaction.atomic():
+            # update_or_create шлёт сигналы на каждую строку — копим id и
+            # обновляем индекс ассистента одним батчем после коммита
+            with indexing.deferred(), transaction.atomic():
                 self.stdout.write("→ Синхронизация контейнеров…")
                 self.sync_containers(client)
 
@@ -38,6 +53,9 @@ class Command(BaseCommand):
                 self.stdout.write("→ Синхронизация связанных панелей…")
                 self.sync_linked(client)
 
+            if self.pruned:
+                report = ", ".join(f"{k}={v}" for k, v in self.pruned.items())
+                self.stdout.write(f"Очистка устаревших строк: {report}")
             self.stdout.write(self.style.SUCCESS("✅ Справочники синхронизированы"))
         finally:
             client.logout()
@@ -45,127 +63,105 @@ class Command(BaseCommand):
     # ------------------------------------------------------------------------
     # helpers
 
-    @staticmethod
-    def _tx(el, name, default=""):
-        n = el.find(name)
-        return (n.text or "").strip() if n is not None and n.text else default
-
-    @staticmethod
-    def _attr(el, name, default=""):
-        v = el.get(name)
-        return (v or "").strip() if v is not None else default
+    def _prune(self, label: str, qs, seen_ids: set, deactivate: bool = False, index_kind: str = ""):
+        """
+        Убираем строки qs, которых не было в текущей выгрузке: одним
+        DELETE (или UPDATE is_active=False для моделей под PROTECT).
+        Если пропадает больше prune_max_pct% — считаем каталог обрезанным
+        и этап не трогаем. UPDATE идёт мимо сигналов, поэтому деактивированные
+        строки явно отдаём в индекс ассистента (index_kind).
+        """
+        if not self.prune:
+            return 0
+        if deactivate:
+            qs = qs.filter(is_active=True)
+        total = qs.count()
+        stale = qs.exclude(id__in=seen_ids)
+        n = stale.count()
+        if not n:
+            self.pruned[label] = 0
+            return 0
+        pct = n * 100.0 / total if total else 0.0
+        if pct > self.prune_max_pct:
+            self.stdout.write(self.style.WARNING(
+                f"{label}: пропало {n} из {total} ({pct:.1f}% > {self.prune_max_pct:g}%) — очистка пропущена"
+            ))
+            self.pruned[label] = f"skipped({n})"
+            return 0
+        if deactivate:
+            if index_kind:
+                indexing.schedule(index_kind, stale.values_list("id", flat=True))
+            stale.update(is_active=False)
+        else:
+            stale.delete()
+        self.pruned[label] = n
+        return n
 
     # ------------------------------------------------------------------------
     # containers
 
     def sync_containers(self, client: NacppClient):
-        root = client.get_container_types()
-        for ct in root.findall(".//containertype"):
-            code = self._attr(ct, "code")
-            name = (ct.text or "").strip()
-            color = self._attr(ct, "color")
+        for ct in rec.parse_container_types(client.get_catalog_raw("containertypes")):
             ContainerType.objects.update_or_create(
-                code=code, defaults={"name": name, "color": color}
+                code=ct.code, defaults={"name": ct.name, "color": ct.color}
             )
 
     # ------------------------------------------------------------------------
     # tests + analytes
 
     def sync_tests(self, client: NacppClient):
-        tests_root = client.get_catalog("tests")
-
-        def iter_analytes(test_el):
-            return test_el.findall("./analytes/analyte")
-
-        for t in tests_root.findall(".//test"):
-            tcode = self._attr(t, "code") or self._tx(t, "code")
-            if not tcode:
-                continue
-            tname = self._tx(t, "name", tcode)
-            unit = self._tx(t, "unit", "")
-            method = self._tx(t, "method", "")
-            desc = self._tx(t, "description", "")
-            low = self._tx(t, "low", "")
-            high = self._tx(t, "high", "")
-
+        seen = set()
+        for t in rec.parse_tests(client.get_catalog_raw("tests")):
             test, _ = Test.objects.update_or_create(
-                code=tcode,
+                code=t.code,
                 defaults={
-                    "name": tname,
-                    "unit": unit,
-                    "method": method,
-                    "description": desc,
-                    "low": low,
-                    "high": high,
+                    "name": t.name,
+                    "unit": t.unit,
+                    "method": t.method,
+                    "description": t.description,
+                    "low": t.low,
+                    "high": t.high,
+                    "is_active": True,
                 },
             )
+            seen.add(test.id)
 
-            idx = 0
-            for a in iter_analytes(t):
-                idx += 1
-                acode = self._attr(a, "code") or self._tx(a, "code", "")
-                aname = self._attr(a, "name") or self._tx(a, "name", "")
-                unit_a = self._attr(a, "unit") or self._tx(a, "unit", unit)
-                nlow = self._attr(a, "low") or self._tx(a, "low", "")
-                nhigh = self._attr(a, "high") or self._tx(a, "high", "")
-
-                if not acode:
-                    key = aname or f"#{idx}"
-                    acode = f"{tcode}::{key}"
-
+            for a in t.analytes:
                 Analyte.objects.update_or_create(
                     test=test,
-                    code=acode,
+                    code=a.code,
                     defaults={
-                        "name": aname or acode,
-                        "unit": unit_a,
-                        "norm_low": nlow,
-                        "norm_high": nhigh,
+                        "name": a.name,
+                        "unit": a.unit,
+                        "norm_low": a.low,
+                        "norm_high": a.high,
                     },
                 )
 
+        self._prune("tests", Test.objects.all(), seen, deactivate=True, index_kind="test")
+
     # ------------------------------------------------------------------------
     # panel categories (дерево)
 
     def sync_panel_categories(self, client: NacppClient):
-        root = client.get_panel_categories()
-
-        def to_int(s):
-            try:
-                return int(s)
-            except Exception:
-                return None
-
         created = 0
         updated = 0
+        by_code = {}
 
-        def walk(cat_el, parent_obj=None):
-            nonlocal created, updated
-            if cat_el.tag != "category":
-                return
-            code = self._attr(cat_el, "code")
-            sorter = to_int(self._attr(cat_el, "sorter"))
-            name = self._tx(cat_el, "name", code)
-
+        # родитель в списке всегда раньше детей — FK находится сразу
+        for c in rec.parse_panel_categories(client.get_catalog_raw("panelscategories")):
             obj, is_created = PanelCategory.objects.update_or_create(
-                code=code,
+                code=c.code,
                 defaults={
-                    "name": name,
-                    "sorter": sorter,
-                    "parent": parent_obj,
+                    "name": c.name,
+                    "sorter": c.sorter,
+                    "parent": by_code.get(c.parent_code),
                 },
             )
+            by_code[c.code] = obj
             created += int(is_created)
             updated += int(not is_created)
 
-            ch_root = cat_el.find("./categories")
-            if ch_root is not None:
-                for ch in ch_root.findall("./category"):
-                    walk(ch, parent_obj=obj)
-
-        for top in root.findall("./category"):
-            walk(top, parent_obj=None)
-
         self.stdout.write(self.style.SUCCESS(
             f"Категории панелей: created={created}, updated={updated}"
         ))
@@ -174,60 +170,53 @@ class Command(BaseCommand):
     # panels + materials + tests + FK category
 
     def sync_panels(self, client: NacppClient):
-        panels_root = client.get_panels(include_categories=True)
-
-        for p in panels_root.findall(".//panel"):
-            pcode = self._attr(p, "code") or self._tx(p, "code")
-            if not pcode:
-                continue
-
-            pname = self._tx(p, "name", pcode)
-            duration = self._tx(p, "duration", "")
-
-            category_code = self._attr(p, "category")
+        panels = rec.parse_panels(client.get_catalog_raw("panels", categories="1"))
+        seen_panels, seen_materials, seen_tests = set(), set(), set()
 
+        for p in panels:
             panel, _ = Panel.objects.update_or_create(
-                code=pcode,
+                code=p.code,
                 defaults={
-                    "name": pname,
-                    "duration": duration,
-                    "category_code": category_code,
+                    "name": p.name,
+                    "duration": p.duration,
+                    "category_code": p.category,
+                    "is_active": True,
                 },
             )
+            seen_panels.add(panel.id)
 
-            if category_code:
-                cat = PanelCategory.objects.filter(code=category_code).first()
+            if p.category:
+                cat = PanelCategory.objects.filter(code=p.category).first()
                 if cat and panel.category_id != cat.id:
                     panel.category = cat
                     panel.save(update_fields=["category"])
 
-            for ctn in p.findall(".//containers/container"):
-                bio_code = self._attr(ctn, "biomaterial")
-                cont_code = self._attr(ctn, "containertype")
-                mat_name = self._attr(ctn, "matdakks")
-
+            for ctn in p.containers:
                 bio = None
-                if bio_code:
+                if ctn.biomaterial:
                     bio, _ = Biomaterial.objects.update_or_create(
-                        code=bio_code, defaults={"name": mat_name or bio_code}
+                        code=ctn.biomaterial, defaults={"name": ctn.matdakks or ctn.biomaterial}
                     )
 
                 cont = (
-                    ContainerType.objects.filter(code=cont_code).first()
-                    if cont_code else None
+                    ContainerType.objects.filter(code=ctn.containertype).first()
+                    if ctn.containertype else None
                 )
                 if bio:
-                    PanelMaterial.objects.get_or_create(
+                    pm, _ = PanelMaterial.objects.get_or_create(
                         panel=panel, biomaterial=bio, container_type=cont
                     )
+                    seen_materials.add(pm.id)
 
-                for tnode in ctn.findall("./test"):
-                    tcode = self._attr(tnode, "code") or self._tx(tnode, "code")
-                    if not tcode:
-                        continue
+                for tcode in ctn.tests:
                     test = Test.objects.filter(code=tcode).first()
                     if test:
-                        PanelTest.objects.get_or_create(panel=panel, test=test)
+                        pt, _ = PanelTest.objects.get_or_create(panel=panel, test=test)
+                        seen_tests.add(pt.id)
+
+        self._prune("panels", Panel.objects.all(), seen_panels, deactivate=True, index_kind="panel")
+        self._prune("panel_materials", PanelMaterial.objects.all(), seen_materials)
+        self._prune("panel_tests", PanelTest.objects.all(), seen_tests)
 
     # ------------------------------------------------------------------------
     # preanalytics  ← НОВЫЙ РАЗДЕЛ
@@ -235,6 +224,8 @@ class Command(BaseCommand):
     def sync_preanalytics(self, client: NacppClient):
         """
         Тянем catalog=preanalytics и апсертим OneToOne PanelPreanalytic.
+        Длинные тексты дедуплицируются в PreanalyticText (по sha256);
+        неизменившиеся строки не пишем вовсе.
         Формат (по их доке):
           <preanalytics>
             <preanalytic>
@@ -247,39 +238,69 @@ class Command(BaseCommand):
             </preanalytic>
           </preanalytics>
         """
-        # поддержим оба варианта клиента: явный метод и общий catalog
-        try:
-            root = client.get_preanalytics()
-        except AttributeError:
-            root = client.get_catalog("preanalytics")
+        items = rec.parse_preanalytics(client.get_catalog_raw("preanalytics"))
+        text_fields = PanelPreanalytic.TEXT_FIELDS
+
+        # 1) тексты: по хэшу, пишем только блобы, которых ещё нет
+        wanted = {}
+        for pa in items:
+            for name in text_fields:
+                text = getattr(pa, name).strip()
+                if text:
+                    wanted.setdefault(PreanalyticText.digest_of(text), text)
+
+        blob_ids = dict(
+            PreanalyticText.objects.filter(digest__in=list(wanted)).values_list("digest", "id")
+        )
+        missing = [PreanalyticText(digest=d, body=t) for d, t in wanted.items() if d not in blob_ids]
+        if missing:
+            PreanalyticText.objects.bulk_create(missing, batch_size=500)
+            blob_ids.update(
+                PreanalyticText.objects.filter(digest__in=[b.digest for b in missing]).values_list("digest", "id")
+            )
 
-        created = 0
-        updated = 0
-        skipped = 0
+        def ref(text):
+            text = text.strip()
+            return blob_ids[PreanalyticText.digest_of(text)] if text else None
 
-        for node in root.findall(".//preanalytic"):
-            pcode = self._tx(node, "panel_code", "")
-            if not pcode:
-                continue
+        # 2) сами преаналитики: создаём/обновляем только изменившиеся строки
+        panel_ids = dict(Panel.objects.values_list("code", "id"))
+        existing = {pa.panel_id: pa for pa in PanelPreanalytic.objects.all()}
+        ref_fields = [f"{name}_text_id" for name in text_fields]
 
-            panel = Panel.objects.filter(code=pcode).first()
-            if not panel:
+        to_create, to_update = [], {}
+        skipped = 0
+        now = timezone.now()
+        for pa in items:
+            panel_id = panel_ids.get(pa.panel_code)
+            if not panel_id:
                 skipped += 1
                 continue
 
-            defaults = {
-                "training": self._tx(node, "training", ""),
-                "centrifugation": self._tx(node, "centrifugation", ""),
-                "storage_transportation": self._tx(node, "storage_transportation", ""),
-                "note": self._tx(node, "note", ""),
-                "min_count": self._tx(node, "min_count", ""),
-            }
+            values = {f"{name}_text_id": ref(getattr(pa, name)) for name in text_fields}
+            values["min_count"] = pa.min_count
 
-            obj, is_created = PanelPreanalytic.objects.update_or_create(
-                panel=panel, defaults=defaults
+            obj = existing.get(panel_id)
+            if obj is None:
+                obj = PanelPreanalytic(panel_id=panel_id, **values)
+                existing[panel_id] = obj
+                to_create.append(obj)
+                continue
+            if any(getattr(obj, k) != v for k, v in values.items()):
+                for k, v in values.items():
+                    setattr(obj, k, v)
+                if obj.pk is not None:
+                    obj.updated_at = now
+                    to_update[panel_id] = obj
+
+        if to_create:
+            PanelPreanalytic.objects.bulk_create(to_create, batch_size=500)
+        if to_update:
+            PanelPreanalytic.objects.bulk_update(
+                list(to_update.values()), ref_fields + ["min_count", "updated_at"], batch_size=500
             )
-            created += int(is_created)
-            updated += int(not is_created)
+        created, updated = len(to_create), len(to_update)
+        self.stdout.write(f"Тексты преаналитики: distinct={len(wanted)}, new={len(missing)}")
 
         self.stdout.write(self.style.SUCCESS(
             f"Преаналитика: created={created}, updated={updated}, skipped(no panel)={skipped}"
@@ -289,41 +310,71 @@ class Command(BaseCommand):
     # requirements
 
     def sync_requirements(self, client: NacppClient):
-        req_root = client.get_tests_requirements()
-        for f in req_root.findall(".//field"):
-            fcode = self._attr(f, "code") or self._tx(f, "code")
-            name = self._tx(f, "name", fcode)
-            desc = self._tx(f, "description", "")
+        """
+        Требования + M2M dependent_tests.
+
+        Через-таблицу не чистим целиком: собираем желаемый набор пар
+        (requirement_id, test_id) из XML, сравниваем с тем, что уже лежит
+        в БД, и применяем только разницу (bulk delete / bulk_create).
+        На неизменившемся справочнике запись в M2M — ноль строк.
+        """
+        test_ids = dict(Test.objects.values_list("code", "id"))
+        Through = TestRequirement.dependent_tests.through
+
+        wanted = set()
+        seen_req_ids = set()
+        for f in rec.parse_requirements(client.get_catalog_raw("testsrequirements")):
             req, _ = TestRequirement.objects.update_or_create(
-                field_code=fcode, defaults={"name": name, "description": desc}
+                field_code=f.code, defaults={"name": f.name, "description": f.description}
             )
-            req.dependent_tests.clear()
-            for t in f.findall(".//dependent_tests/test"):
-                tcode = (t.text or "").strip()
-                test = Test.objects.filter(code=tcode).first()
-                if test:
-                    req.dependent_tests.add(test)
+            seen_req_ids.add(req.id)
+            for tcode in f.tests:
+                tid = test_ids.get(tcode)
+                if tid:
+                    wanted.add((req.id, tid))
+
+        existing = {}
+        links = Through.objects.filter(testrequirement_id__in=seen_req_ids)
+        for pk, rid, tid in links.values_list("id", "testrequirement_id", "test_id").iterator():
+            existing[(rid, tid)] = pk
+
+        stale = [pk for pair, pk in existing.items() if pair not in wanted]
+        fresh = [
+            Through(testrequirement_id=rid, test_id=tid)
+            for rid, tid in wanted if (rid, tid) not in existing
+        ]
+
+        if stale:
+            Through.objects.filter(id__in=stale).delete()
+        if fresh:
+            Through.objects.bulk_create(fresh, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Требования: links added={len(fresh)}, removed={len(stale)}"
+        ))
 
     # ------------------------------------------------------------------------
     # linked panels
 
     def sync_linked(self, client: NacppClient):
         try:
-            lp = client.get_linked_panels()
-            for rel in lp.findall(".//relation"):
-                main = (rel.findtext("main") or "").strip()
-                if not main:
-                    continue
-                main_panel = Panel.objects.filter(code=main).first()
-                if not main_panel:
-                    continue
-                for ex in rel.findall(".//extra"):
-                    ex_code = (ex.text or "").strip()
-                    extra_panel = Panel.objects.filter(code=ex_code).first()
-                    if extra_panel:
-                        PanelLinked.objects.get_or_create(
-                            main_panel=main_panel, extra_panel=extra_panel
-                        )
+            relations = rec.parse_linked_panels(client.get_catalog_raw("linkedpanels"))
         except Exception:
             # на некоторых стендах нет справочника связей — ок, молча пропускаем
-            pass
+            # (и ничего не чистим: пустой ответ тут не значит «связей нет»)
+            return
+
+        seen = set()
+        for rel in relations:
+            main_panel = Panel.objects.filter(code=rel.main).first()
+            if not main_panel:
+                continue
+            for ex_code in rel.extras:
+                extra_panel = Panel.objects.filter(code=ex_code).first()
+                if extra_panel:
+                    link, _ = PanelLinked.objects.get_or_create(
+                        main_panel=main_panel, extra_panel=extra_panel
+                    )
+                    seen.add(link.id)
+
+        self._prune("panel_linked", PanelLinked.objects.all(), seen)
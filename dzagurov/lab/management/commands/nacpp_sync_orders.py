@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from lab.models import Order, OrderPanel, Panel, Test, ResultEntry, Analyte
 from lab.nacpp_client import NacppClient
+from lab.nacpp_records import parse_results
 
 
 class Command(BaseCommand):
@@ -39,48 +40,38 @@ class Command(BaseCommand):
                     continue
 
                 with transaction.atomic():
-                    for p in res.findall(".//panel"):
-                        pcode = (p.get("code") or p.findtext("code") or "").strip()
-                        panel = Panel.objects.filter(code=pcode).first()
+                    for p in parse_results(res):
+                        panel = Panel.objects.filter(code=p.code).first()
                         op, _ = OrderPanel.objects.get_or_create(order=order, panel=panel)
-                        op.status = (p.findtext("status") or "").strip()
-                        op.released_doctor = (p.findtext("released_doctor") or "").strip()
+                        op.status = p.status
+                        op.released_doctor = p.released_doctor
                         op.save()
 
-                        for t in p.findall(".//test"):
-                            tcode = (t.get("code") or t.findtext("code") or "").strip()
-                            test = Test.objects.filter(code=tcode).first()
-                            released = (t.findtext("released_doctor") or "").strip()
+                        tests = {}
+                        for r in p.results:
+                            if r.test_code not in tests:
+                                tests[r.test_code] = Test.objects.filter(code=r.test_code).first()
+                            test = tests[r.test_code]
 
-                            for a in t.findall(".//analyte"):
-                                val = (a.findtext("value") or "").strip()
-                                unit = (a.findtext("unit") or "").strip()
-                                low = (a.findtext("low") or "").strip()
-                                high = (a.findtext("high") or "").strip()
-                                comment = (a.findtext("comment") or "").strip()
-                                raw = (a.findtext("rawresult") or "").strip()
-                                an_code = (a.get("code") or a.findtext("code") or "").strip()
-                                an_name = (a.get("name") or a.findtext("name") or "").strip()
+                            analyt_obj = None
+                            if test:
+                                if r.analyte_code:
+                                    analyt_obj = Analyte.objects.filter(test=test, code=r.analyte_code).first()
+                                if not analyt_obj and r.analyte_name:
+                                    analyt_obj = Analyte.objects.filter(test=test, name__iexact=r.analyte_name).first()
 
-                                analyt_obj = None
-                                if test:
-                                    if an_code:
-                                        analyt_obj = Analyte.objects.filter(test=test, code=an_code).first()
-                                    if not analyt_obj and an_name:
-                                        analyt_obj = Analyte.objects.filter(test=test, name__iexact=an_name).first()
-
-                                ResultEntry.objects.get_or_create(
-                                    order_panel=op,
-                                    test=test,
-                                    value=val,
-                                    unit=unit,
-                                    norm_low=low,
-                                    norm_high=high,
-                                    comment=comment,
-                                    rawresult=raw,
-                                    analyte=analyt_obj,
-                                    defaults={"released_doctor": released},
-                                )
+                            ResultEntry.objects.get_or_create(
+                                order_panel=op,
+                                test=test,
+                                value=r.value,
+                                unit=r.unit,
+                                norm_low=r.low,
+                                norm_high=r.high,
+                                comment=r.comment,
+                                rawresult=r.rawresult,
+                                analyte=analyt_obj,
+                                defaults={"released_doctor": r.test_released_doctor},
+                            )
 
                 count += 1
 
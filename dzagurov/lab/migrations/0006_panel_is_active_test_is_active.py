@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0005_alter_panelpreanalytic_min_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panel',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True, help_text='Снимается синком, если панель пропала из каталога NACPP.'),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True, help_text='Снимается синком, если тест пропал из каталога NACPP.'),
+        ),
+    ]
@@ -0,0 +1,99 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+TEXT_FIELDS = ("training", "centrifugation", "storage_transportation", "note")
+
+
+def to_blobs(apps, schema_editor):
+    PanelPreanalytic = apps.get_model("lab", "PanelPreanalytic")
+    PreanalyticText = apps.get_model("lab", "PreanalyticText")
+
+    by_digest = {}
+    for pa in PanelPreanalytic.objects.all().iterator(chunk_size=500):
+        changed = []
+        for name in TEXT_FIELDS:
+            text = (getattr(pa, name) or "").strip()
+            if not text:
+                continue
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            blob_id = by_digest.get(digest)
+            if blob_id is None:
+                blob_id = PreanalyticText.objects.create(digest=digest, body=text).id
+                by_digest[digest] = blob_id
+            setattr(pa, f"{name}_text_id", blob_id)
+            changed.append(f"{name}_text")
+        if changed:
+            pa.save(update_fields=changed)
+
+
+def from_blobs(apps, schema_editor):
+    PanelPreanalytic = apps.get_model("lab", "PanelPreanalytic")
+    PreanalyticText = apps.get_model("lab", "PreanalyticText")
+
+    bodies = dict(PreanalyticText.objects.values_list("id", "body"))
+    for pa in PanelPreanalytic.objects.all().iterator(chunk_size=500):
+        for name in TEXT_FIELDS:
+            setattr(pa, name, bodies.get(getattr(pa, f"{name}_text_id"), ""))
+        pa.save(update_fields=list(TEXT_FIELDS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0006_panel_is_active_test_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreanalyticText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('body', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'Текст преаналитики',
+                'verbose_name_plural': 'Тексты преаналитики',
+            },
+        ),
+        migrations.AddField(
+            model_name='panelpreanalytic',
+            name='training_text',
+            field=models.ForeignKey(blank=True, help_text='Подготовка к исследованию', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='lab.preanalytictext'),
+        ),
+        migrations.AddField(
+            model_name='panelpreanalytic',
+            name='centrifugation_text',
+            field=models.ForeignKey(blank=True, help_text='Центрифугирование', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='lab.preanalytictext'),
+        ),
+        migrations.AddField(
+            model_name='panelpreanalytic',
+            name='storage_transportation_text',
+            field=models.ForeignKey(blank=True, help_text='Хранение и транспортировка', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='lab.preanalytictext'),
+        ),
+        migrations.AddField(
+            model_name='panelpreanalytic',
+            name='note_text',
+            field=models.ForeignKey(blank=True, help_text='Примечание', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='lab.preanalytictext'),
+        ),
+        migrations.RunPython(to_blobs, from_blobs),
+        migrations.RemoveField(
+            model_name='panelpreanalytic',
+            name='training',
+        ),
+        migrations.RemoveField(
+            model_name='panelpreanalytic',
+            name='centrifugation',
+        ),
+        migrations.RemoveField(
+            model_name='panelpreanalytic',
+            name='storage_transportation',
+        ),
+        migrations.RemoveField(
+            model_name='panelpreanalytic',
+            name='note',
+        ),
+    ]
@@ -1,3 +1,5 @@
+import hashlib
+
 from django.db import models
 from django.utils import timezone
 from django.utils.functional import cached_property
@@ -43,6 +45,7 @@ class Test(models.Model):
     description = models.TextField(blank=True, default="")
     low = models.CharField(max_length=64, blank=True, default="")
     high = models.CharField(max_length=64, blank=True, default="")
+    is_active = models.BooleanField(default=True, db_index=True, help_text="Снимается синком, если тест пропал из каталога NACPP.")
 
     class Meta:
         verbose_name = "Тест"
@@ -111,6 +114,7 @@ class Panel(models.Model):
     category = models.ForeignKey(
         "PanelCategory", on_delete=models.SET_NULL, null=True, blank=True, related_name="panels"
     )
+    is_active = models.BooleanField(default=True, db_index=True, help_text="Снимается синком, если панель пропала из каталога NACPP.")
 
     class Meta:
         verbose_name = "Панель"
@@ -278,18 +282,62 @@ class ResultEntry(models.Model):
 
 # app/models.py
 
+class PreanalyticText(models.Model):
+    """
+    Текст преаналитики, хранится один раз по хэшу содержимого.
+    Одни и те же абзацы (венозная кровь, натощак, …) повторяются в сотнях
+    панелей — панели ссылаются на общий блоб.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    body = models.TextField()
+
+    class Meta:
+        verbose_name = "Текст преаналитики"
+        verbose_name_plural = "Тексты преаналитики"
+
+    def __str__(self):
+        return f"{self.digest[:12]} — {self.body[:60]}"
+
+    @staticmethod
+    def digest_of(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def intern(cls, text: str):
+        """Блоб для текста (создаём только если такого ещё нет). Пустой текст → None."""
+        text = (text or "").strip()
+        if not text:
+            return None
+        obj, _ = cls.objects.get_or_create(digest=cls.digest_of(text), defaults={"body": text})
+        return obj
+
+
 class PanelPreanalytic(models.Model):
+    TEXT_FIELDS = ("training", "centrifugation", "storage_transportation", "note")
+
     panel = models.OneToOneField(
         Panel,
         on_delete=models.CASCADE,
         related_name="preanalytic"
     )
 
-    # поля из спецификации НАКФФ
-    training = models.TextField(blank=True, default="", help_text="Подготовка к исследованию")
-    centrifugation = models.TextField(blank=True, default="", help_text="Центрифугирование")
-    storage_transportation = models.TextField(blank=True, default="", help_text="Хранение и транспортировка")
-    note = models.TextField(blank=True, default="", help_text="Примечание")
+    # поля из спецификации НАКФФ; длинные тексты — ссылками на PreanalyticText
+    training_text = models.ForeignKey(
+        PreanalyticText, on_delete=models.PROTECT, null=True, blank=True, related_name="+",
+        help_text="Подготовка к исследованию",
+    )
+    centrifugation_text = models.ForeignKey(
+        PreanalyticText, on_delete=models.PROTECT, null=True, blank=True, related_name="+",
+        help_text="Центрифугирование",
+    )
+    storage_transportation_text = models.ForeignKey(
+        PreanalyticText, on_delete=models.PROTECT, null=True, blank=True, related_name="+",
+        help_text="Хранение и транспортировка",
+    )
+    note_text = models.ForeignKey(
+        PreanalyticText, on_delete=models.PROTECT, null=True, blank=True, related_name="+",
+        help_text="Примечание",
+    )
     min_count = models.TextField(blank=True, default="", help_text="Минимальный объем образца")
 
     # служебка
@@ -304,3 +352,42 @@ class PanelPreanalytic(models.Model):
 
     def __str__(self):
         return f"Преаналитика {self.panel.code} — {self.panel.name[:60]}"
+
+    def _text(self, name: str) -> str:
+        blob = getattr(self, f"{name}_text")
+        return blob.body if blob else ""
+
+    @property
+    def training(self) -> str:
+        return self._text("training")
+
+    @property
+    def centrifugation(self) -> str:
+        return self._text("centrifugation")
+
+    @property
+    def storage_transportation(self) -> str:
+        return self._text("storage_transportation")
+
+    @property
+    def note(self) -> str:
+        return self._text("note")
+
+    @classmethod
+    def attach_texts(cls, items) -> None:
+        """
+        Подтягиваем тексты для пачки преаналитик одним запросом: каждый
+        различный блоб читается один раз, а не по JOIN-у на каждую панель.
+        """
+        items = [pa for pa in items if pa is not None]
+        ids = {
+            getattr(pa, f"{name}_text_id")
+            for pa in items for name in cls.TEXT_FIELDS
+        }
+        ids.discard(None)
+        blobs = PreanalyticText.objects.in_bulk(ids) if ids else {}
+        for pa in items:
+            for name in cls.TEXT_FIELDS:
+                blob = blobs.get(getattr(pa, f"{name}_text_id"))
+                if blob is not None:
+                    setattr(pa, f"{name}_text", blob)
@@ -7,10 +7,11 @@ from typing import Any, Dict, List, Tuple, Union
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
-from defusedxml.ElementTree import fromstring
 from xml.etree.ElementTree import Element  # для аннотаций
 from django.conf import settings
 
+from .xml_backend import fromstring
+
 
 class NacppError(Exception):
     """Базовая ошибка клиента NACPP."""
@@ -24,7 +25,8 @@ class NacppClient:
       - Авторизация через /login.php; успешной считаем по факту наличия cookies
         (даже если после редиректа сервер отдаёт 404 — такое на практике бывает).
       - Обязательный «пинг» каталога panelscategories для валидации сессии.
-      - Каталоги/заявки/результаты возвращаем как XML Element (defusedxml.fromstring).
+      - Каталоги/заявки/результаты возвращаем как XML Element (lab.xml_backend:
+        lxml, если установлен, иначе defusedxml).
       - Прайс: умеем авто-обнаруживать эндпоинты (несколько названий каталога/act)
         и парсить как XML/JSON/простую HTML-таблицу.
 
@@ -140,10 +142,13 @@ class NacppClient:
         t = (text or "").lstrip()
         return t.startswith("{") or t.startswith("[")
 
-    def _get_xml(self, path: str, params: Dict[str, Any]) -> Element:
+    def _get_text(self, path: str, params: Dict[str, Any]) -> str:
         r = self.s.get(f"{self.base}{path}", params=params, timeout=self.timeout)
         r.raise_for_status()
-        return fromstring(r.text)
+        return r.text
+
+    def _get_xml(self, path: str, params: Dict[str, Any]) -> Element:
+        return fromstring(self._get_text(path, params))
 
     def _post_xml(self, path: str, params: Dict[str, Any], xml_body: str) -> Element:
         r = self.s.post(
@@ -162,6 +167,11 @@ class NacppClient:
         q = {"act": "get-catalog", "catalog": catalog, **params}
         return self._get_xml("/plugins/index.php", q)
 
+    def get_catalog_raw(self, catalog: str, **params: Any) -> str:
+        """Сырой XML каталога — для потокового разбора в lab.nacpp_records."""
+        q = {"act": "get-catalog", "catalog": catalog, **params}
+        return self._get_text("/plugins/index.php", q)
+
     def get_biomaterials(self, barcodeinfo: bool = False) -> Element:
         p = {"barcodeinfo": ""} if barcodeinfo else {}
         return self.get_catalog("bio", **p)
@@ -0,0 +1,364 @@
+# lab/nacpp_records.py
+"""
+Промежуточное представление каталогов NACPP.
+
+Каждый каталог за один проход превращается в список компактных записей
+на __slots__ (без __dict__ на экземпляр). Дальше синки/диффы/бенчмарки
+работают только с записями и не ходят по Element-дереву сами.
+
+Источник — либо уже распарсенный Element (как отдаёт NacppClient),
+либо сырой XML (str/bytes): тогда разбираем потоково через iterparse
+и сразу чистим обработанные узлы, так что DOM целиком в памяти не живёт.
+"""
+from __future__ import annotations
+
+import sys
+from typing import Iterator, List, Union
+from xml.etree.ElementTree import Element
+
+from . import xml_backend
+from .xml_utils import attr, tx
+
+Source = Union[Element, str, bytes]
+
+
+# ---------------------------------------------------------------------------
+# records
+
+class _Rec:
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, k) == getattr(other, k) for k in self.__slots__
+        )
+
+
+class ContainerTypeRec(_Rec):
+    __slots__ = ("code", "name", "color")
+
+    def __init__(self, code, name, color):
+        self.code = code
+        self.name = name
+        self.color = color
+
+
+class AnalyteRec(_Rec):
+    __slots__ = ("code", "name", "unit", "low", "high")
+
+    def __init__(self, code, name, unit, low, high):
+        self.code = code
+        self.name = name
+        self.unit = unit
+        self.low = low
+        self.high = high
+
+
+class TestRec(_Rec):
+    __slots__ = ("code", "name", "unit", "method", "description", "low", "high", "analytes")
+
+    def __init__(self, code, name, unit, method, description, low, high, analytes):
+        self.code = code
+        self.name = name
+        self.unit = unit
+        self.method = method
+        self.description = description
+        self.low = low
+        self.high = high
+        self.analytes = analytes
+
+
+class CategoryRec(_Rec):
+    __slots__ = ("code", "name", "sorter", "parent_code")
+
+    def __init__(self, code, name, sorter, parent_code):
+        self.code = code
+        self.name = name
+        self.sorter = sorter
+        self.parent_code = parent_code
+
+
+class ContainerRec(_Rec):
+    __slots__ = ("biomaterial", "containertype", "matdakks", "tests")
+
+    def __init__(self, biomaterial, containertype, matdakks, tests):
+        self.biomaterial = biomaterial
+        self.containertype = containertype
+        self.matdakks = matdakks
+        self.tests = tests
+
+
+class PanelRec(_Rec):
+    __slots__ = ("code", "name", "duration", "category", "containers")
+
+    def __init__(self, code, name, duration, category, containers):
+        self.code = code
+        self.name = name
+        self.duration = duration
+        self.category = category
+        self.containers = containers
+
+
+class PreanalyticRec(_Rec):
+    __slots__ = ("panel_code", "training", "centrifugation", "storage_transportation", "note", "min_count")
+
+    def __init__(self, panel_code, training, centrifugation, storage_transportation, note, min_count):
+        self.panel_code = panel_code
+        self.training = training
+        self.centrifugation = centrifugation
+        self.storage_transportation = storage_transportation
+        self.note = note
+        self.min_count = min_count
+
+
+class RequirementRec(_Rec):
+    __slots__ = ("code", "name", "description", "tests")
+
+    def __init__(self, code, name, description, tests):
+        self.code = code
+        self.name = name
+        self.description = description
+        self.tests = tests
+
+
+class LinkedRec(_Rec):
+    __slots__ = ("main", "extras")
+
+    def __init__(self, main, extras):
+        self.main = main
+        self.extras = extras
+
+
+class ResultRec(_Rec):
+    """Одна строка результата (аналит) внутри панели заявки."""
+    __slots__ = (
+        "test_code", "test_released_doctor", "analyte_code", "analyte_name",
+        "value", "unit", "low", "high", "comment", "rawresult",
+    )
+
+    def __init__(self, test_code, test_released_doctor, analyte_code, analyte_name,
+                 value, unit, low, high, comment, rawresult):
+        self.test_code = test_code
+        self.test_released_doctor = test_released_doctor
+        self.analyte_code = analyte_code
+        self.analyte_name = analyte_name
+        self.value = value
+        self.unit = unit
+        self.low = low
+        self.high = high
+        self.comment = comment
+        self.rawresult = rawresult
+
+
+class OrderPanelRec(_Rec):
+    __slots__ = ("code", "status", "released_doctor", "results")
+
+    def __init__(self, code, status, released_doctor, results):
+        self.code = code
+        self.status = status
+        self.released_doctor = released_doctor
+        self.results = results
+
+
+# ---------------------------------------------------------------------------
+# helpers
+
+_intern = sys.intern
+
+
+def _attr_or_tx(el: Element, name: str, default: str = "") -> str:
+    return attr(el, name) or tx(el, name, default)
+
+
+def iter_tag(source: Source, tag: str, backend: str | None = None) -> Iterator[Element]:
+    """
+    Элементы с тегом tag. Для сырого XML — потоково, с очисткой
+    обработанного узла (потребитель должен забрать всё нужное до next()).
+    Парсер выбирает lab.xml_backend (lxml, если есть; иначе defusedxml).
+    """
+    if isinstance(source, (str, bytes)):
+        for el in xml_backend.iterparse(source, backend=backend):
+            if el.tag == tag:
+                yield el
+                xml_backend.release(el)
+        return
+    yield from source.iter(tag)
+
+
+# ---------------------------------------------------------------------------
+# parsers
+
+def parse_container_types(source: Source) -> List[ContainerTypeRec]:
+    return [
+        ContainerTypeRec(attr(ct, "code"), (ct.text or "").strip(), attr(ct, "color"))
+        for ct in iter_tag(source, "containertype")
+    ]
+
+
+def parse_tests(source: Source) -> List[TestRec]:
+    out = []
+    for t in iter_tag(source, "test"):
+        tcode = _attr_or_tx(t, "code")
+        if not tcode:
+            continue
+        unit = _intern(tx(t, "unit", ""))
+
+        analytes = []
+        for idx, a in enumerate(t.findall("./analytes/analyte"), start=1):
+            acode = _attr_or_tx(a, "code")
+            aname = _attr_or_tx(a, "name")
+            if not acode:
+                acode = f"{tcode}::{aname or f'#{idx}'}"
+            analytes.append(AnalyteRec(
+                acode,
+                aname or acode,
+                _intern(attr(a, "unit") or tx(a, "unit", unit)),
+                _attr_or_tx(a, "low"),
+                _attr_or_tx(a, "high"),
+            ))
+
+        out.append(TestRec(
+            tcode,
+            tx(t, "name", tcode),
+            unit,
+            tx(t, "method", ""),
+            tx(t, "description", ""),
+            tx(t, "low", ""),
+            tx(t, "high", ""),
+            analytes,
+        ))
+    return out
+
+
+def parse_panel_categories(source: Source) -> List[CategoryRec]:
+    """
+    Дерево категорий в плоский список: родитель всегда раньше детей.
+    """
+    if isinstance(source, (str, bytes)):
+        source = xml_backend.fromstring(source)
+
+    def to_int(s):
+        try:
+            return int(s)
+        except Exception:
+            return None
+
+    out = []
+
+    def walk(cat_el, parent_code):
+        code = attr(cat_el, "code")
+        out.append(CategoryRec(code, tx(cat_el, "name", code), to_int(attr(cat_el, "sorter")), parent_code))
+        for ch in cat_el.findall("./categories/category"):
+            walk(ch, code)
+
+    for top in source.findall("./category"):
+        walk(top, "")
+    return out
+
+
+def parse_panels(source: Source) -> List[PanelRec]:
+    out = []
+    for p in iter_tag(source, "panel"):
+        pcode = _attr_or_tx(p, "code")
+        if not pcode:
+            continue
+        containers = []
+        for ctn in p.findall(".//containers/container"):
+            tests = tuple(
+                c for c in (_attr_or_tx(t, "code") for t in ctn.findall("./test")) if c
+            )
+            containers.append(ContainerRec(
+                _intern(attr(ctn, "biomaterial")),
+                _intern(attr(ctn, "containertype")),
+                _intern(attr(ctn, "matdakks")),
+                tests,
+            ))
+        out.append(PanelRec(
+            pcode,
+            tx(p, "name", pcode),
+            _intern(tx(p, "duration", "")),
+            _intern(attr(p, "category")),
+            containers,
+        ))
+    return out
+
+
+def parse_preanalytics(source: Source) -> List[PreanalyticRec]:
+    out = []
+    for node in iter_tag(source, "preanalytic"):
+        pcode = tx(node, "panel_code", "")
+        if not pcode:
+            continue
+        out.append(PreanalyticRec(
+            pcode,
+            tx(node, "training", ""),
+            tx(node, "centrifugation", ""),
+            tx(node, "storage_transportation", ""),
+            tx(node, "note", ""),
+            _intern(tx(node, "min_count", "")),
+        ))
+    return out
+
+
+def parse_requirements(source: Source) -> List[RequirementRec]:
+    out = []
+    for f in iter_tag(source, "field"):
+        fcode = _attr_or_tx(f, "code")
+        out.append(RequirementRec(
+            fcode,
+            tx(f, "name", fcode),
+            tx(f, "description", ""),
+            tuple((t.text or "").strip() for t in f.findall(".//dependent_tests/test")),
+        ))
+    return out
+
+
+def parse_linked_panels(source: Source) -> List[LinkedRec]:
+    out = []
+    for rel in iter_tag(source, "relation"):
+        main = (rel.findtext("main") or "").strip()
+        if not main:
+            continue
+        extras = tuple(c for c in ((ex.text or "").strip() for ex in rel.findall(".//extra")) if c)
+        out.append(LinkedRec(main, extras))
+    return out
+
+
+def parse_results(source: Source) -> List[OrderPanelRec]:
+    """
+    Ответ act=get-result: панели заявки → тесты → аналиты,
+    аналиты разворачиваем в плоский список ResultRec внутри панели.
+    """
+    def val(el, name):
+        return (el.get(name) or el.findtext(name) or "").strip()
+
+    out = []
+    for p in iter_tag(source, "panel"):
+        results = []
+        for t in p.findall(".//test"):
+            tcode = val(t, "code")
+            released = (t.findtext("released_doctor") or "").strip()
+            for a in t.findall(".//analyte"):
+                results.append(ResultRec(
+                    tcode,
+                    released,
+                    val(a, "code"),
+                    val(a, "name"),
+                    (a.findtext("value") or "").strip(),
+                    _intern((a.findtext("unit") or "").strip()),
+                    (a.findtext("low") or "").strip(),
+                    (a.findtext("high") or "").strip(),
+                    (a.findtext("comment") or "").strip(),
+                    (a.findtext("rawresult") or "").strip(),
+                ))
+        out.append(OrderPanelRec(
+            val(p, "code"),
+            (p.findtext("status") or "").strip(),
+            (p.findtext("released_doctor") or "").strip(),
+            results,
+        ))
+    return out
@@ -1,3 +1,63 @@
-from django.test import TestCase
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from . import nacpp_records, xml_backend
+
+DUMPS = Path(settings.BASE_DIR) / "nacpp_dumps"
+
+# дамп -> парсер каталога
+CATALOGS = (
+    ("containertypes.xml", nacpp_records.parse_container_types),
+    ("tests.xml", nacpp_records.parse_tests),
+    ("panelscategories.xml", nacpp_records.parse_panel_categories),
+    ("panels.xml", nacpp_records.parse_panels),
+    ("preanalytics.xml", nacpp_records.parse_preanalytics),
+    ("testsrequirements.xml", nacpp_records.parse_requirements),
+    ("linkedpanels.xml", nacpp_records.parse_linked_panels),
+)
+
+
+class NacppParseEquivalenceTests(SimpleTestCase):
+    """Записи каталога не зависят ни от XML-бэкенда, ни от вида источника (Element / str / bytes)."""
+
+    def setUp(self):
+        if not DUMPS.is_dir():
+            self.skipTest(f"{DUMPS} not found")
+
+    def _parse_all(self, parse, raw: bytes, backend: str):
+        with override_settings(NACPP_XML_BACKEND=backend):
+            return {
+                "element": parse(xml_backend.fromstring(raw)),
+                "bytes": parse(raw),
+                "str": parse(raw.decode("utf-8")),
+            }
+
+    def test_backends_and_sources_agree(self):
+        for name, parse in CATALOGS:
+            path = DUMPS / name
+            if not path.exists():
+                continue
+            raw = path.read_bytes()
+            expected = parse(xml_backend.fromstring(raw, backend="defusedxml"))
+            for backend in xml_backend.available_backends():
+                for source, records in self._parse_all(parse, raw, backend).items():
+                    with self.subTest(catalog=name, backend=backend, source=source):
+                        self.assertEqual(len(records), len(expected))
+                        self.assertEqual(records, expected)
+
+    def test_inline_test_catalog(self):
+        raw = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<tests><test code="3"><name>Альбумин</name><unit>г/л</unit>'
+            '<analytes><analyte code="1785"><name>Альбумин</name></analyte><analyte/></analytes>'
+            '</test><test><name>без кода</name></test></tests>'
+        )
+        for backend in xml_backend.available_backends():
+            with self.subTest(backend=backend), override_settings(NACPP_XML_BACKEND=backend):
+                (rec,) = nacpp_records.parse_tests(raw)
+                self.assertEqual(rec.code, "3")
+                self.assertEqual(rec.name, "Альбумин")
+                self.assertEqual([a.code for a in rec.analytes], ["1785", "3::#2"])
+                self.assertEqual(rec.analytes[0].unit, "г/л")
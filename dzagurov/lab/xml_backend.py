@@ -0,0 +1,93 @@
+# lab/xml_backend.py
+"""
+Бэкенд разбора XML для NACPP.
+
+  - lxml (если установлен): C-парсер libxml2, заметно быстрее. Включаем
+    только с выключенными сущностями/DTD/сетью — по безопасности не хуже
+    defusedxml для того, что нам присылает шлюз.
+  - defusedxml (fallback): как было раньше.
+
+Выбор: settings.NACPP_XML_BACKEND = "auto" (по умолчанию) | "lxml" | "defusedxml".
+"""
+from __future__ import annotations
+
+import io
+from typing import Iterator, Union
+
+from django.conf import settings
+
+import defusedxml.ElementTree as _defused
+
+try:  # lxml — опциональная зависимость
+    from lxml import etree as _lxml
+except ImportError:  # pragma: no cover
+    _lxml = None
+
+Source = Union[str, bytes]
+
+BACKENDS = ("lxml", "defusedxml")
+
+
+def available_backends() -> list[str]:
+    return [b for b in BACKENDS if b != "lxml" or _lxml is not None]
+
+
+def resolve(name: str | None = None) -> str:
+    name = (name or getattr(settings, "NACPP_XML_BACKEND", "auto") or "auto").lower()
+    if name == "auto":
+        return "lxml" if _lxml is not None else "defusedxml"
+    if name == "lxml" and _lxml is None:
+        raise ImportError("NACPP_XML_BACKEND=lxml, но lxml не установлен")
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный XML-бэкенд: {name!r}")
+    return name
+
+
+def _lxml_kwargs() -> dict:
+    return {
+        "resolve_entities": False,
+        "no_network": True,
+        "load_dtd": False,
+        "huge_tree": False,
+    }
+
+
+def _as_bytes(source: Source) -> bytes:
+    # lxml не принимает str с <?xml encoding=...?>; отдаём байты и
+    # явно говорим парсеру utf-8 (декларацию в документе игнорирует)
+    return source.encode("utf-8") if isinstance(source, str) else source
+
+
+def fromstring(source: Source, backend: str | None = None):
+    if resolve(backend) == "lxml":
+        if isinstance(source, str):
+            parser = _lxml.XMLParser(encoding="utf-8", **_lxml_kwargs())
+        else:
+            parser = _lxml.XMLParser(**_lxml_kwargs())
+        return _lxml.fromstring(_as_bytes(source), parser=parser)
+    return _defused.fromstring(source)
+
+
+def iterparse(source: Source, backend: str | None = None) -> Iterator:
+    """Поток событий "end" — элемент уже полностью разобран."""
+    if resolve(backend) == "lxml":
+        extra = {"encoding": "utf-8"} if isinstance(source, str) else {}
+        for _event, el in _lxml.iterparse(io.BytesIO(_as_bytes(source)), events=("end",), **_lxml_kwargs(), **extra):
+            yield el
+        return
+    buf = io.StringIO(source) if isinstance(source, str) else io.BytesIO(source)
+    for _event, el in _defused.iterparse(buf, events=("end",)):
+        yield el
+
+
+def release(el) -> None:
+    """
+    Освобождаем уже обработанный узел. В lxml дополнительно отрываем
+    предыдущих соседей, иначе пустые узлы копятся у корня.
+    """
+    el.clear()
+    if _lxml is not None and isinstance(el, _lxml._Element):
+        parent = el.getparent()
+        if parent is not None:
+            while el.getprevious() is not None:
+                del parent[0]
@@ -54,7 +54,7 @@ class Index(TemplateView):
 
         categories_qs = (
             PanelCategory.objects
-            .annotate(total=Count("panels"))
+            .annotate(total=Count("panels", filter=Q(panels__is_active=True)))
             .order_by("sorter", "name")
         )
 
@@ -77,6 +77,7 @@ class Index(TemplateView):
 
         panels_qs = (
             Panel.objects
+            .filter(is_active=True)
             .select_related("category", "preanalytic")
             .prefetch_related(
                 "panel_materials__biomaterial",
@@ -101,6 +102,7 @@ class Index(TemplateView):
 
         panel_found_total = panels_qs.count()
         panel_list = list(panels_qs[: self.PANEL_LIMIT])
+        PanelPreanalytic.attach_texts(getattr(p, "preanalytic", None) for p in panel_list)
 
         hero_contacts = Contact.objects.all().order_by("order", "name")[:200]
 
@@ -186,7 +188,7 @@ class Analysis(ListView):
             if sel_for_map and sel_for_map.id not in subtree_map:
                 subtree_map[sel_for_map.id] = subtree_ids(sel_for_map.id)
 
-        per_cat_counts = Panel.objects.values("category_id").annotate(cnt=Count("id"))
+        per_cat_counts = Panel.objects.filter(is_active=True).values("category_id").annotate(cnt=Count("id"))
         count_by_cat_id = {row["category_id"]: row["cnt"] for row in per_cat_counts}
 
         def total_for_cat(root_id: int) -> int:
@@ -209,6 +211,7 @@ class Analysis(ListView):
 
         panels_qs = (
             Panel.objects
+            .filter(is_active=True)
             .select_related("category", "preanalytic")
             .prefetch_related(
                 "panel_materials__biomaterial",
@@ -235,6 +238,7 @@ class Analysis(ListView):
         panels_qs = panels_qs.order_by("code")
         panel_found_total = panels_qs.count()
         panel_list = list(panels_qs[: self.PANEL_LIMIT])
+        PanelPreanalytic.attach_texts(getattr(p, "preanalytic", None) for p in panel_list)
 
         ctx.update({
             "panel_categories": panel_categories,
@@ -22,6 +22,7 @@
     messages:  root.dataset.messagesUrl  || "/chat/api/messages/",
     send:      root.dataset.sendUrl      || "/chat/api/send/",
     assistant: root.dataset.assistantUrl || "/assistant/ask/",
+    click:     root.dataset.clickUrl     || "/assistant/click/",
   };
 
   const POLL_TIMEOUT = 20;
@@ -142,7 +143,7 @@
      Assistant (authed only)
      ========================= */
 
-  async function askAssistant(q) {
+  async function askAssistant(q, kinds) {
     const r = await fetch(API.assistant, {
       method: "POST",
       credentials: "same-origin",
@@ -150,12 +151,47 @@
         "Content-Type": "application/json",
         ...csrfHeader(),
       },
-      body: JSON.stringify({ q, limit: 6 }),
+      body: JSON.stringify(kinds && kinds.length ? { q, limit: 6, kinds } : { q, limit: 6 }),
     });
+    if (r.status === 429) {
+      const wait = r.headers.get("Retry-After");
+      system(`Навигатор: слишком много запросов подряд${wait ? `, попробуйте через ${wait} с` : ""}.`, "info");
+      return null;
+    }
     if (!r.ok) return null;
     return r.json();
   }
 
+  // клик по карточке -> обучение boost (см. learn_assistant_boosts); keepalive — ссылка уводит со страницы
+  function reportAssistantClick(id) {
+    if (!id) return;
+    fetch(API.click, {
+      method: "POST",
+      credentials: "same-origin",
+      keepalive: true,
+      headers: {
+        "Content-Type": "application/json",
+        ...csrfHeader(),
+      },
+      body: JSON.stringify({ id }),
+    }).catch(() => {});
+  }
+
+  messages.addEventListener("click", e => {
+    if (!e.target.closest) return;
+    const card = e.target.closest(".assistant-card[data-id]");
+    if (card) reportAssistantClick(card.dataset.id);
+
+    // чип раздела: тот же запрос, только этот kind (повторный клик — снова все разделы)
+    const chip = e.target.closest(".assistant-facet[data-kind]");
+    if (chip) {
+      const kinds = chip.classList.contains("is-active") ? [] : [chip.dataset.kind];
+      askAssistant(chip.dataset.query || "", kinds)
+        .then(d => { if (d) renderAssistantResults(d); })
+        .catch(() => {});
+    }
+  });
+
   function shouldAskAssistant(text) {
     const q = (text || "").trim();
     if (q.length < 3) return false;
@@ -169,7 +205,7 @@
     const hint = r?.meta?.hint || "";
 
     return `
-      <a class="assistant-card test-card" href="${esc(r.url)}" target="_blank" rel="noopener noreferrer">
+      <a class="assistant-card test-card" href="${esc(r.url)}" data-id="${esc(r.id || "")}" target="_blank" rel="noopener noreferrer">
         <div class="test-card__header">
           <div class="test-card__title">${esc(r.title)}</div>
           ${code ? `<div class="test-card__code">${esc(code)}</div>` : ""}
@@ -195,7 +231,7 @@
   // --- Default card for all other kinds
   function renderDefaultCard(r) {
     return `
-      <a class="assistant-card" href="${esc(r.url)}" target="_blank" rel="noopener noreferrer">
+      <a class="assistant-card" href="${esc(r.url)}" data-id="${esc(r.id || "")}" target="_blank" rel="noopener noreferrer">
         <div class="assistant-card__title">${esc(r.title)}</div>
         ${r.snippet ? `<div class="assistant-card__snippet">${esc(r.snippet)}</div>` : ""}
         <div class="assistant-card__meta">${esc(r.kind || "")}</div>
@@ -203,6 +239,29 @@
     `;
   }
 
+  // чипы по фасетам ответа: счётчики — сколько совпадений в разделе всего
+  function renderFacets(data) {
+    const facets = data?.facets || [];
+    if (facets.length < 2 && !(data?.kinds || []).length) return "";
+    const active = new Set(data?.kinds || []);
+    return `<div class="assistant-facets">${facets.map(f => `
+      <button type="button" class="assistant-facet${active.has(f.kind) ? " is-active" : ""}"
+              data-kind="${esc(f.kind)}" data-query="${esc(data?.query || "")}">
+        ${esc(f.label)}<span class="assistant-facet__count">${esc(f.count)}</span>
+      </button>`).join("")}</div>`;
+  }
+
+  // готовый ответ (mode=structured): подготовка / срок / цена / биоматериал по анализу
+  function renderFacts(data) {
+    const facts = (data?.answer?.blocks || []).filter(b => b.type === "fact");
+    if (!facts.length) return "";
+    return `<div class="assistant-facts">${facts.map(f => `
+      <div class="assistant-fact">
+        <div class="assistant-fact__label">${esc(f.label)}</div>
+        <div class="assistant-fact__text">${esc(f.text).replace(/\n/g, "<br>")}</div>
+      </div>`).join("")}</div>`;
+  }
+
   function renderAssistantResults(data) {
     const results = (data?.results || []).slice(0, 6);
     if (!results.length) return;
@@ -226,7 +285,10 @@
           <span class="chat-msg__author">Навигатор</span>
           ${now ? `<span class="chat-msg__time" style="font-size:10px; font-weight:600; opacity:.6;">${esc(now)}</span>` : ""}
         </div>
-        <div class="chat-msg__text">Подборка по запросу: <b>${esc(data?.query || "")}</b></div>
+        ${data?.mode === "structured"
+          ? `<div class="chat-msg__text"><b>${esc(data?.answer?.title || "")}</b></div>${renderFacts(data)}`
+          : `<div class="chat-msg__text">Подборка по запросу: <b>${esc(data?.query || "")}</b></div>`}
+        ${renderFacets(data)}
         <div class="assistant-cards">${cards}</div>
       </div>
     `;